@@ -1,4 +1,7 @@
 from django.apps import AppConfig
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class AuthAppConfig(AppConfig):
@@ -7,12 +10,26 @@ class AuthAppConfig(AppConfig):
 
     def ready(self):
         """Initialize app when Django starts"""
+        from django.conf import settings
+
+        try:
+            # Warn about settings that only hold up while the app runs in one process or on one host
+            from .utils.alert_engine import check_alert_state_store
+            from .utils.archive import check_archive_storage
+            from .utils.sensor_cache import check_shared_cache
+            check_shared_cache()
+            check_alert_state_store()
+            check_archive_storage()
+        except Exception as e:
+            logger.error(f"Error checking the deployment settings: {str(e)}")
+
+        if not getattr(settings, 'SCHEDULER_AUTOSTART', True):
+            # The jobs run in a dedicated `manage.py run_scheduler` process
+            return
         try:
             # Import and start the grow monitor
             from .tasks.grow_monitor import start_grow_monitor
             start_grow_monitor()
         except Exception as e:
             # Log error but don't prevent app from starting
-            import logging
-            logger = logging.getLogger(__name__)
             logger.error(f"Error starting grow monitor: {str(e)}")
@@ -3,7 +3,10 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 import asyncio
 import firebase_admin
 from firebase_admin import db
-from .firebase import get_firebase_ref
+from .firebase import get_async_firebase_ref, run_firebase
+from .utils.user_stats import get_user_stats
+from .utils.device_feed import device_feed
+from .utils.device_latest import with_sensor_compat
 import datetime
 
 class DeviceConsumer(AsyncWebsocketConsumer):
@@ -19,8 +22,12 @@ class DeviceConsumer(AsyncWebsocketConsumer):
         
         await self.accept()
         
-        # Start the background task to fetch devices
-        self.fetch_task = asyncio.create_task(self.periodic_device_fetch())
+        # Device changes are pushed to the group by the shared Firebase listener
+        device_feed.start()
+        await self.fetch_and_send_devices()
+        
+        # Only polls Firebase while the shared listener is unavailable
+        self.fetch_task = asyncio.create_task(self.fallback_device_fetch())
     
     async def disconnect(self, close_code):
         # Cancel the background task when disconnecting
@@ -44,38 +51,38 @@ class DeviceConsumer(AsyncWebsocketConsumer):
             # Manually trigger device fetch
             await self.fetch_and_send_devices()
     
-    async def periodic_device_fetch(self):
+    async def fallback_device_fetch(self):
         """
-        Periodically fetch devices and send updates
+        Poll for devices every 10 seconds while the device feed is down
         """
         try:
             while True:
-                await self.fetch_and_send_devices()
-                # Wait for 10 seconds before fetching again
                 await asyncio.sleep(10)
+                if device_feed.is_ready():
+                    continue
+                device_feed.start()
+                await self.fetch_and_send_devices()
         except asyncio.CancelledError:
             # Task was cancelled, clean up
             pass
     
     async def fetch_and_send_devices(self):
         """
-        Fetch devices from Firebase and send to the client
+        Send the user's full device list to the client
         """
         try:
-            # Get devices data for the user
-            ref = get_firebase_ref()
-            devices_ref = ref.child('devices')
-            devices_snapshot = devices_ref.order_by_child('user_id').equal_to(self.user_id).get()
-            
-            devices_data = {}
-            if devices_snapshot:
-                devices_data = devices_snapshot
+            if device_feed.is_ready():
+                devices_data = device_feed.get_user_devices(self.user_id)
+            else:
+                # Query Firebase off the event loop so other sockets aren't stalled
+                devices_ref = get_async_firebase_ref('devices')
+                devices_data = await devices_ref.order_by_child('user_id').equal_to(self.user_id).get() or {}
             
             # Send the devices data to the WebSocket
             await self.send(text_data=json.dumps({
                 'type': 'devices_update',
                 'timestamp': datetime.datetime.now().isoformat(),
-                'devices': devices_data
+                'devices': {device_id: with_sensor_compat(device) for device_id, device in devices_data.items()}
             }))
             
         except Exception as e:
@@ -93,6 +100,17 @@ class DeviceConsumer(AsyncWebsocketConsumer):
         # Send message to WebSocket
         await self.send(text_data=json.dumps(event))
 
+    async def devices_delta(self, event):
+        """
+        Forward changed and removed devices from the device feed to the WebSocket
+        """
+        await self.send(text_data=json.dumps({
+            'type': 'devices_delta',
+            'timestamp': event['timestamp'],
+            'devices': {device_id: with_sensor_compat(device) for device_id, device in event['devices'].items()},
+            'removed': event['removed']
+        }))
+
 class DashboardConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.user_id = self.scope['url_route']['kwargs']['user_id']
@@ -149,34 +167,17 @@ class DashboardConsumer(AsyncWebsocketConsumer):
         Fetch dashboard counts from Firebase and send to the client
         """
         try:
-            ref = get_firebase_ref()
-            # Device count
-            devices_ref = ref.child('devices')
-            devices_snapshot = devices_ref.order_by_child('user_id').equal_to(self.user_id).get()
-            device_count = len(devices_snapshot) if devices_snapshot else 0
-            
-            # Alert count
-            alerts_ref = ref.child(f'alerts/{self.user_id}')
-            alerts_snapshot = alerts_ref.get()
-            alert_count = len(alerts_snapshot) if alerts_snapshot else 0
-            
-            # Grow count (only active grows)
-            grows_ref = ref.child('grows')
-            grows_snapshot = grows_ref.get()
-            grow_count = 0
-            if grows_snapshot:
-                grow_count = sum(
-                    1 for grow in grows_snapshot.values()
-                    if grow.get('user_id') == self.user_id and grow.get('status') == 'active'
-                )
+            # Counters are materialized per user, read them on the shared pool
+            stats = await run_firebase(get_user_stats, self.user_id)
             
             # Send the dashboard counts to the WebSocket
             await self.send(text_data=json.dumps({
                 'type': 'dashboard_update',
                 'timestamp': datetime.datetime.now().isoformat(),
-                'device_count': device_count,
-                'alert_count': alert_count,
-                'grow_count': grow_count
+                'device_count': stats['devices'],
+                'alert_count': stats['alerts_total'],
+                'unread_alert_count': stats['alerts_unread'],
+                'grow_count': stats['active_grows']
             }))
         except Exception as e:
             print(f"Error fetching dashboard counts: {str(e)}")
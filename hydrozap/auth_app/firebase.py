@@ -1,8 +1,12 @@
 import firebase_admin
 from firebase_admin import credentials, auth, db, messaging
 from django.conf import settings
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
 import os
 import json
+import threading
 
 def initialize_firebase():
     if not firebase_admin._apps:
@@ -53,4 +57,53 @@ def is_fcm_available():
         return True
     except Exception as e:
         print(f"FCM functionality check failed: {str(e)}")
-        return False
\ No newline at end of file
+        return False
+
+# Bounded pool that runs the blocking firebase_admin calls made from async
+# code (consumers, async views) so they never block the event loop
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_firebase_executor():
+    """Get the shared thread pool used for async Firebase access"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'FIREBASE_ASYNC_MAX_WORKERS', 10),
+                    thread_name_prefix='firebase'
+                )
+    return _executor
+
+async def run_firebase(func, *args, **kwargs):
+    """Run a blocking Firebase call on the shared pool and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_firebase_executor(), functools.partial(func, *args, **kwargs))
+
+class AsyncFirebaseRef:
+    """Awaitable wrapper around a firebase_admin Reference or Query"""
+    # Methods that make a network round-trip and have to be awaited
+    BLOCKING_METHODS = {'get', 'set', 'update', 'push', 'delete', 'transaction', 'get_if_changed', 'set_if_unchanged'}
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in self.BLOCKING_METHODS:
+            async def call(*args, **kwargs):
+                result = await run_firebase(attr, *args, **kwargs)
+                return AsyncFirebaseRef(result) if isinstance(result, db.Reference) else result
+            return call
+        if callable(attr):
+            # child(), order_by_child(), equal_to() etc. only build the request
+            def build(*args, **kwargs):
+                result = attr(*args, **kwargs)
+                return AsyncFirebaseRef(result) if isinstance(result, (db.Reference, db.Query)) else result
+            return build
+        return attr
+
+def get_async_firebase_ref(path='/'):
+    """Get an awaitable Firebase database reference"""
+    return AsyncFirebaseRef(db.reference(path))
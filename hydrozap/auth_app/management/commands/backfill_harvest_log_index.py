@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from ...firebase import initialize_firebase
+from ...utils.harvest_index import rebuild_harvest_log_indexes
+
+
+class Command(BaseCommand):
+    help = "Build the harvest_logs_by_device and harvest_logs_by_grow indexes from harvest_logs"
+
+    def handle(self, *args, **options):
+        initialize_firebase()
+        log_count = rebuild_harvest_log_indexes()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {log_count} harvest logs"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from firebase_admin import db
+from ...firebase import initialize_firebase
+from ...utils.sensor_history import backfill_device_history
+
+
+class Command(BaseCommand):
+    help = "Copy readings stored under devices/{id}/sensors into sensor_history/{id}/{YYYY-MM-DD}"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', action='append', dest='devices',
+                            help="Only backfill this device (may be repeated)")
+
+    def handle(self, *args, **options):
+        initialize_firebase()
+        device_ids = options.get('devices') or list((db.reference('devices').get(shallow=True) or {}).keys())
+
+        total = 0
+        for device_id in device_ids:
+            copied = backfill_device_history(device_id)
+            total += copied
+            self.stdout.write(f"{device_id}: {copied} readings")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {total} readings for {len(device_ids)} devices"))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from ...firebase import initialize_firebase
+from ...utils.user_index import rebuild_user_indexes
+
+
+class Command(BaseCommand):
+    help = "Build the usernames and emails lookup indexes from the users tree"
+
+    def handle(self, *args, **options):
+        initialize_firebase()
+        user_count = rebuild_user_indexes()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {user_count} users"))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from datetime import datetime
+from firebase_admin import db
+from ...firebase import initialize_firebase
+from ...utils.alert_index import alert_index_updates
+from ...utils.push_id import generate_push_id, push_id_timestamp
+
+
+def _alert_time_ms(alert_id, alert):
+    """Best guess at when a legacy alert was created, in epoch milliseconds"""
+    try:
+        return int(datetime.fromisoformat(str(alert.get('timestamp')).replace('Z', '+00:00')).timestamp() * 1000)
+    except ValueError:
+        pass
+    try:
+        # Legacy keys look like alert_<epoch seconds>
+        return int(alert_id.rsplit('_', 1)[-1]) * 1000
+    except ValueError:
+        return None
+
+
+class Command(BaseCommand):
+    help = "Re-key legacy alert_<seconds> alerts to push IDs so paginated alert lists stay in order"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report how many alerts would be re-keyed")
+
+    def handle(self, *args, **options):
+        initialize_firebase()
+
+        migrated = 0
+        for user_id in (db.reference('alerts').get(shallow=True) or {}):
+            alerts = db.reference(f'alerts/{user_id}').get() or {}
+            updates = {}
+            for alert_id, alert in alerts.items():
+                if push_id_timestamp(alert_id) is not None or not isinstance(alert, dict):
+                    continue
+                new_id = generate_push_id(_alert_time_ms(alert_id, alert))
+                updates[f'alerts/{user_id}/{new_id}'] = alert
+                updates[f'alerts/{user_id}/{alert_id}'] = None
+                updates.update(alert_index_updates(user_id, alert_id, None, alert))
+                updates.update(alert_index_updates(user_id, new_id, alert))
+                migrated += 1
+
+            if updates and not options['dry_run']:
+                db.reference().update(updates)
+
+        verb = "Would re-key" if options['dry_run'] else "Re-keyed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {migrated} alerts"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from firebase_admin import db
+from ...firebase import initialize_firebase
+from ...utils.device_latest import migrate_device_latest
+
+
+class Command(BaseCommand):
+    help = "Move devices/{id}/sensors readings into sensor_history and keep only devices/{id}/latest on the device"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', action='append', dest='devices',
+                            help="Only migrate this device (may be repeated)")
+
+    def handle(self, *args, **options):
+        initialize_firebase()
+        device_ids = options.get('devices') or list((db.reference('devices').get(shallow=True) or {}).keys())
+
+        migrated = 0
+        total = 0
+        for device_id in device_ids:
+            copied = migrate_device_latest(device_id)
+            if copied is None:
+                continue
+            migrated += 1
+            total += copied
+            self.stdout.write(f"{device_id}: {copied} readings")
+
+        self.stdout.write(self.style.SUCCESS(f"Migrated {migrated} devices ({total} readings kept in sensor_history)"))
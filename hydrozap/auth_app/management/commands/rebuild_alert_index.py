@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from ...firebase import initialize_firebase
+from ...utils.alert_index import rebuild_alert_indexes
+
+
+class Command(BaseCommand):
+    help = "Rebuild the alerts_by_status and alerts_by_type indexes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', dest='user_id', help="Only rebuild this user's alert indexes")
+
+    def handle(self, *args, **options):
+        initialize_firebase()
+        alert_count = rebuild_alert_indexes(options.get('user_id'))
+        self.stdout.write(self.style.SUCCESS(f"Indexed {alert_count} alerts"))
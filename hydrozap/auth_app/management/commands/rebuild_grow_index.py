@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from ...firebase import initialize_firebase
+from ...utils.grow_index import rebuild_grow_indexes
+
+
+class Command(BaseCommand):
+    help = "Rebuild the grows_by_device, grows_by_user, grows_by_profile and grows_by_status indexes"
+
+    def handle(self, *args, **options):
+        initialize_firebase()
+        grow_count = rebuild_grow_indexes()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {grow_count} grows"))
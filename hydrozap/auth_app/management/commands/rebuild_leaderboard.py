@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from ...firebase import initialize_firebase
+from ...utils.leaderboard import rebuild_leaderboard
+
+
+class Command(BaseCommand):
+    help = "Rescore every harvest log and rebuild the materialized leaderboard"
+
+    def handle(self, *args, **options):
+        initialize_firebase()
+        log_count = rebuild_leaderboard()
+        self.stdout.write(self.style.SUCCESS(f"Ranked {log_count} harvest logs"))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from ...firebase import initialize_firebase
+from ...utils.user_stats import rebuild_all_user_stats, rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the user_stats dashboard counters from devices, alerts and the grow index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='users',
+                            help="Only rebuild this user's counters (may be repeated)")
+
+    def handle(self, *args, **options):
+        initialize_firebase()
+
+        user_ids = options.get('users')
+        if user_ids:
+            for user_id in user_ids:
+                stats = rebuild_user_stats(user_id)
+                self.stdout.write(f"{user_id}: {stats}")
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt user stats for {len(user_ids)} users"))
+            return
+
+        count = rebuild_all_user_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt user stats for {count} users"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from ...firebase import initialize_firebase
+from ...tasks.grow_monitor import start_grow_monitor
+import time
+
+
+class Command(BaseCommand):
+    help = "Run the scheduled jobs (grow monitor, fleet insights, sensor rollups, archive compaction) in this process"
+
+    def handle(self, *args, **options):
+        initialize_firebase()
+        scheduler = start_grow_monitor()
+        if scheduler is None:
+            self.stderr.write(self.style.ERROR("The scheduler could not be started"))
+            return
+
+        self.stdout.write(self.style.SUCCESS("Scheduler running, press Ctrl+C to stop"))
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            scheduler.shutdown()
@@ -1,12 +1,13 @@
 # auth_app/middleware.py
-from firebase_admin import auth
 from rest_framework.exceptions import AuthenticationFailed
 from .firebase import initialize_firebase
+from .utils.token_cache import certificate_refresher, verify_id_token
 
 class FirebaseAuthMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
         initialize_firebase()  # Initialize Firebase when middleware is loaded
+        certificate_refresher.start()
 
     def __call__(self, request):
         token = request.headers.get('Authorization')
@@ -15,7 +16,7 @@ class FirebaseAuthMiddleware:
             try:
                 # Remove 'Bearer ' if present
                 token = token.replace('Bearer ', '')
-                decoded_token = auth.verify_id_token(token)
+                decoded_token = verify_id_token(token)
                 request.user = decoded_token
             except Exception as e:
                 raise AuthenticationFailed(f"Invalid Token: {str(e)}")
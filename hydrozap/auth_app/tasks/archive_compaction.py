@@ -0,0 +1,185 @@
+from firebase_admin import db
+from datetime import datetime, timedelta, timezone
+import logging
+from django.conf import settings
+from ..utils.archive import check_archive_storage, write_archive
+from ..utils.job_lease import JobLease
+from ..utils.alert_index import alert_index_updates
+from ..utils.push_id import push_id_prefix, push_id_timestamp
+from ..utils.sensor_history import HISTORY_ROOT, parse_timestamp, reading_key_ms, to_epoch_ms
+from ..utils.sensor_rollups import get_dirty_days, get_rollup_checkpoint
+from ..utils.user_stats import is_unread, user_stats_updates
+
+logger = logging.getLogger(__name__)
+
+# Never archive more than this many sensor_history day buckets for one device
+# in a single run, so the first run over a long history is spread across runs
+MAX_DAYS_PER_RUN = 31
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def _cutoff_ms(retention_days):
+    return to_epoch_ms(datetime.now(timezone.utc) - timedelta(days=retention_days))
+
+
+def _batch_size():
+    return getattr(settings, 'ARCHIVE_BATCH_SIZE', 5000)
+
+
+def _record_time_ms(key, record):
+    """Prefer a record's own timestamp, falling back to the time in its push ID"""
+    try:
+        return to_epoch_ms(record['timestamp'])
+    except (KeyError, ValueError, TypeError, AttributeError):
+        return push_id_timestamp(key)
+
+
+def archive_sensor_history(device_id, cutoff_ms):
+    """Archive whole sensor_history day buckets older than cutoff_ms that have been rolled up"""
+    # Rollups are computed from the hot buckets, so never archive past the rollup checkpoint
+    checkpoint = get_rollup_checkpoint(device_id)
+    if checkpoint is None:
+        return 0
+    limit_ms = min(cutoff_ms, checkpoint)
+
+    # Days with late readings still waiting to be rolled up again stay hot
+    dirty = get_dirty_days(device_id)
+    days = sorted(db.reference(f'{HISTORY_ROOT}/{device_id}').get(shallow=True) or {})
+    days = [day for day in days
+            if day not in dirty and to_epoch_ms(parse_timestamp(day)) + DAY_MS <= limit_ms][:MAX_DAYS_PER_RUN]
+    if not days:
+        return 0
+
+    records = []
+    for day in days:
+        bucket = db.reference(f'{HISTORY_ROOT}/{device_id}/{day}').get() or {}
+        records.extend((key, reading_key_ms(key), reading) for key, reading in bucket.items()
+                       if isinstance(reading, dict) and reading_key_ms(key) is not None)
+
+    updates = {f'{HISTORY_ROOT}/{device_id}/{day}': None for day in days}
+    if records:
+        updates.update(write_archive('sensor_history', device_id, records))
+    db.reference().update(updates)
+    return len(records)
+
+
+def archive_device_log(device_id, child, cutoff_ms):
+    """Archive push-ID keyed entries of devices/{id}/{child} created before cutoff_ms"""
+    # Push IDs sort by creation time, so everything before the cutoff is one key range.
+    # Plain keys such as the latest sensor values or actuator settings are never touched.
+    entries = (db.reference(f'devices/{device_id}/{child}')
+               .order_by_key()
+               .end_at(push_id_prefix(cutoff_ms))
+               .limit_to_first(_batch_size())
+               .get()) or {}
+
+    records = [(key, _record_time_ms(key, entry), entry) for key, entry in entries.items()
+               if isinstance(entry, dict) and push_id_timestamp(key) is not None]
+    if not records:
+        return 0
+
+    updates = {f'devices/{device_id}/{child}/{key}': None for key, _, _ in records}
+    updates.update(write_archive(child, device_id, records))
+    db.reference().update(updates)
+    return len(records)
+
+
+def archive_dosing_logs(device_id, cutoff_ms):
+    """Archive dosing logs whose timestamp is older than cutoff_ms"""
+    logs = db.reference(f'devices/{device_id}/dosing_logs').get() or {}
+    if not isinstance(logs, dict):
+        return 0
+
+    records = []
+    for log_id, log in logs.items():
+        if not isinstance(log, dict):
+            continue
+        try:
+            log_ms = to_epoch_ms(log['timestamp'])
+        except (KeyError, ValueError, TypeError, AttributeError):
+            continue
+        if log_ms < cutoff_ms:
+            records.append((log_id, log_ms, log))
+    records = sorted(records, key=lambda item: item[1])[:_batch_size()]
+    if not records:
+        return 0
+
+    updates = {f'devices/{device_id}/dosing_logs/{log_id}': None for log_id, _, _ in records}
+    updates.update(write_archive('dosing_logs', device_id, records))
+    db.reference().update(updates)
+    return len(records)
+
+
+def archive_alerts(user_id, cutoff_ms):
+    """Archive a user's alerts created before cutoff_ms, with their index entries and counters"""
+    alerts = (db.reference(f'alerts/{user_id}')
+              .order_by_key()
+              .end_at(push_id_prefix(cutoff_ms))
+              .limit_to_first(_batch_size())
+              .get()) or {}
+
+    records = [(alert_id, _record_time_ms(alert_id, alert), alert) for alert_id, alert in alerts.items()
+               if isinstance(alert, dict) and push_id_timestamp(alert_id) is not None]
+    if not records:
+        return 0
+
+    updates = {}
+    for alert_id, _, alert in records:
+        updates[f'alerts/{user_id}/{alert_id}'] = None
+        updates.update(alert_index_updates(user_id, alert_id, None, alert))
+    updates.update(user_stats_updates(user_id, alerts_total=-len(records),
+                                      alerts_unread=-sum(1 for _, _, alert in records if is_unread(alert))))
+    updates.update(write_archive('alerts', user_id, records))
+    db.reference().update(updates)
+    return len(records)
+
+
+def run_archive_compaction():
+    """Move sensor readings, device logs and alerts past their retention into archive storage"""
+    if not check_archive_storage():
+        logger.error("Skipping archive compaction until archives go to shared storage")
+        return None
+
+    # A second concurrent run would archive the same records and adjust the counters twice
+    lease = JobLease('archive_compaction', getattr(settings, 'JOB_LEASE_SECONDS', 600))
+    if not lease.acquire():
+        logger.info("Archive compaction is already running in another process, skipping this run")
+        return None
+    try:
+        sensor_cutoff = _cutoff_ms(getattr(settings, 'ARCHIVE_SENSOR_RETENTION_DAYS', 30))
+        log_cutoff = _cutoff_ms(getattr(settings, 'ARCHIVE_LOG_RETENTION_DAYS', 90))
+        alert_cutoff = _cutoff_ms(getattr(settings, 'ARCHIVE_ALERT_RETENTION_DAYS', 90))
+
+        totals = {'sensor_history': 0, 'sensors': 0, 'actuators': 0, 'dosing_logs': 0, 'alerts': 0}
+
+        device_ids = set(db.reference('devices').get(shallow=True) or {})
+        device_ids |= set(db.reference(HISTORY_ROOT).get(shallow=True) or {})
+        for device_id in device_ids:
+            if not lease.renew():
+                return totals
+            try:
+                totals['sensor_history'] += archive_sensor_history(device_id, sensor_cutoff)
+                totals['sensors'] += archive_device_log(device_id, 'sensors', sensor_cutoff)
+                totals['actuators'] += archive_device_log(device_id, 'actuators', log_cutoff)
+                totals['dosing_logs'] += archive_dosing_logs(device_id, log_cutoff)
+            except Exception as e:
+                logger.error(f"Error archiving records for device {device_id}: {str(e)}")
+                continue
+
+        for user_id in (db.reference('alerts').get(shallow=True) or {}):
+            if not lease.renew():
+                return totals
+            try:
+                totals['alerts'] += archive_alerts(user_id, alert_cutoff)
+            except Exception as e:
+                logger.error(f"Error archiving alerts for user {user_id}: {str(e)}")
+                continue
+
+        logger.info(f"Archive compaction moved {totals}")
+        return totals
+
+    except Exception as e:
+        logger.error(f"Error in run_archive_compaction: {str(e)}")
+    finally:
+        lease.release()
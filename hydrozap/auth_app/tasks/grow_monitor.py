@@ -2,19 +2,31 @@ from firebase_admin import db
 from datetime import datetime
 import logging
 from ..views.notification_utils import send_fcm_notification
+from ..utils.grow_index import get_grow_statuses, get_grow_ids_by_status, get_grows
+from ..utils.crop_suggester import CropRangeMatrix, PARAMETERS, environment_row, get_crop_matrix
+from ..utils.model_registry import model_registry
+from ..utils.device_latest import LATEST_KEY, get_latest_reading, latest_path
+from ..utils.firebase_loader import FirebaseLoader
+from .sensor_rollup import run_sensor_rollup
+from .archive_compaction import run_archive_compaction
 from django.conf import settings
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
+import numpy as np
+import pandas as pd
 
 logger = logging.getLogger(__name__)
 
 def check_grow_readiness():
     """Check all active grows for harvest readiness and send notifications"""
     try:
-        # Get all grows
-        grows_ref = db.reference('grows')
-        grows = grows_ref.get()
-        
+        # Get every grow that has not been harvested from the status index
+        grow_ids = []
+        for grow_status in get_grow_statuses():
+            if grow_status != 'harvested':
+                grow_ids.extend(get_grow_ids_by_status(grow_status))
+
+        grows = get_grows(grow_ids)
         if not grows:
             return
             
@@ -52,21 +64,6 @@ def check_grow_readiness():
                     grow_name = grow_data.get('grow_name', 'Your grow')
                     device_id = grow_data.get('device_id')
                     
-                    # Get user's FCM tokens
-                    user_ref = db.reference(f'users/{user_id}/fcm_tokens')
-                    tokens = user_ref.get()
-                    
-                    if not tokens:
-                        logger.warning(f"No FCM tokens found for user {user_id}")
-                        continue
-                        
-                    # Convert tokens to list of strings
-                    token_list = [str(token) for token in tokens.values() if token]
-                    
-                    if not token_list:
-                        logger.warning(f"No valid FCM tokens found for user {user_id}")
-                        continue
-                    
                     # Send FCM notification
                     notification_sent = send_fcm_notification(
                         user_id=user_id,
@@ -94,8 +91,140 @@ def check_grow_readiness():
     except Exception as e:
         logger.error(f"Error in check_grow_readiness: {str(e)}")
 
+def _grow_crop(grow_data, grow_profiles, plant_profiles):
+    """Return (crop name, grow profile) for a grow"""
+    grow_profile = grow_profiles.get(grow_data.get('profile_id')) or {}
+    plant_profile = plant_profiles.get(grow_profile.get('plant_profile_id')) or {}
+    return plant_profile.get('name') or grow_profile.get('name'), grow_profile
+
+
+def _tipburn_risks(rows):
+    """Return tipburn probabilities for [(temperature, humidity, ec, ph, crop)] in one predict_proba call"""
+    if not rows:
+        return []
+    label_encoder = model_registry['tipburn_label_encoder']
+    tipburn_model = model_registry['tipburn']
+    df = pd.DataFrame(rows, columns=["temperature", "humidity", "ec", "ph", "crop_type"])
+    df["crop_type_encoded"] = label_encoder.transform(df.pop("crop_type"))
+    proba = tipburn_model.predict_proba(df)
+    # Class 1 is tipburn present
+    positive = list(tipburn_model.classes_).index(1)
+    return proba[:, positive].tolist()
+
+
+def scan_fleet_insights():
+    """Score every device's latest reading for crop suitability and tipburn risk"""
+    try:
+        fleet_ids = list(db.reference('devices').get(shallow=True) or {})
+        if not fleet_ids:
+            return
+
+        # Only each device's latest reading and owner, not its logs
+        loader = FirebaseLoader()
+        loader.prime(*[f'devices/{device_id}/{field}' for device_id in fleet_ids
+                       for field in (LATEST_KEY, 'user_id')])
+
+        grow_profiles = db.reference('grow_profiles').get() or {}
+        plant_profiles = db.reference('plant_profiles').get() or {}
+        active_grows = {grow.get('device_id'): grow for grow in get_grows(get_grow_ids_by_status('active')).values()}
+
+        # Devices not migrated to the latest node yet fall back to their legacy sensors node
+        loader.prime(*[f'devices/{device_id}/sensors' for device_id in fleet_ids
+                       if not isinstance(loader.load(latest_path(device_id)), dict)])
+        user_ids = {device_id: loader.load(f'devices/{device_id}/user_id') for device_id in fleet_ids}
+
+        device_ids, readings, environments, timestamps = [], [], [], []
+        for device_id in fleet_ids:
+            reading = get_latest_reading(device_id, loader)
+            try:
+                environment = environment_row(*(reading.get(parameter) for parameter in PARAMETERS))
+            except (TypeError, ValueError):
+                continue
+            if all(np.isnan(environment)):
+                continue
+            device_ids.append(device_id)
+            readings.append(reading)
+            environments.append(environment)
+            timestamps.append(reading.get('timestamp'))
+        if not device_ids:
+            return
+        environments = np.array(environments)
+
+        # Best suited crops, one vectorized ranking per user's crop catalogue
+        suitable = {}
+        by_user = {}
+        for index, device_id in enumerate(device_ids):
+            by_user.setdefault(user_ids[device_id], []).append(index)
+        for user_id, indexes in by_user.items():
+            ranked = get_crop_matrix(user_id=user_id).rank(environments[indexes], top_n=3, full_match_only=False)
+            for index, suggestions in zip(indexes, ranked):
+                suitable[device_ids[index]] = [
+                    {"crop": suggestion['crop'], "score": suggestion['score']} for suggestion in suggestions
+                ]
+
+        # Fit of each active grow's own profile ranges, one row per device
+        current = {}
+        crops = {}
+        names, lows, highs = [], [], []
+        for device_id in device_ids:
+            grow_data = active_grows.get(device_id) or {}
+            crop, grow_profile = _grow_crop(grow_data, grow_profiles, plant_profiles)
+            crops[device_id] = crop
+            profile_matrix = CropRangeMatrix.from_plant_profiles({'profile': grow_profile}, stage=grow_data.get('stage'))
+            if not grow_data or not len(profile_matrix):
+                profile_matrix = CropRangeMatrix([crop], [[np.nan] * len(PARAMETERS)], [[np.nan] * len(PARAMETERS)])
+            names.append(crop)
+            lows.append(profile_matrix.lows[0])
+            highs.append(profile_matrix.highs[0])
+        distance, compared = CropRangeMatrix(names, lows, highs).row_distances(environments)
+        for index, device_id in enumerate(device_ids):
+            if compared[index]:
+                current[device_id] = {
+                    "crop": crops[device_id],
+                    "score": round(float(1 / (1 + distance[index])), 4),
+                }
+
+        # Tipburn risk for devices growing a crop the model knows
+        tipburn = {}
+        try:
+            known_crops = {str(crop).lower(): str(crop) for crop in model_registry['tipburn_label_encoder'].classes_}
+            tipburn_rows, tipburn_devices = [], []
+            for index, device_id in enumerate(device_ids):
+                crop = known_crops.get(str(crops.get(device_id) or '').lower())
+                temperature, humidity, ph, ec = environments[index]
+                if crop and not np.isnan([temperature, humidity, ph, ec]).any():
+                    tipburn_rows.append((temperature, humidity, ec, ph, crop))
+                    tipburn_devices.append(device_id)
+            for device_id, risk in zip(tipburn_devices, _tipburn_risks(tipburn_rows)):
+                tipburn[device_id] = {"crop": crops[device_id], "risk": round(float(risk), 4)}
+        except Exception as e:
+            logger.warning(f"Skipping tipburn risk in fleet scan: {str(e)}")
+
+        # One multi-path write with a compact node per device
+        scanned_at = datetime.now().isoformat()
+        updates = {}
+        for index, device_id in enumerate(device_ids):
+            updates[f'device_insights/{device_id}'] = {
+                "scanned_at": scanned_at,
+                "reading_timestamp": timestamps[index],
+                "suitable_crops": suitable.get(device_id, []),
+                "current_crop": current.get(device_id),
+                "tipburn": tipburn.get(device_id),
+            }
+        db.reference().update(updates)
+        logger.info(f"Fleet scan wrote insights for {len(updates)} devices")
+
+    except Exception as e:
+        logger.error(f"Error in scan_fleet_insights: {str(e)}")
+
+_scheduler = None
+
+
 def start_grow_monitor():
-    """Start the background scheduler for grow monitoring"""
+    """Start the background scheduler for grow monitoring once per process and return it"""
+    global _scheduler
+    if _scheduler is not None:
+        return _scheduler
     try:
         scheduler = BackgroundScheduler(
             timezone='UTC',
@@ -114,8 +243,37 @@ def start_grow_monitor():
             misfire_grace_time=3600  # Allow up to 1 hour of delay before considering it missed
         )
         
+        # Precompute per-device crop suitability and tipburn risk
+        scheduler.add_job(
+            scan_fleet_insights,
+            trigger=IntervalTrigger(minutes=getattr(settings, 'FLEET_INSIGHTS_INTERVAL_MINUTES', 60)),
+            id='fleet_insights',
+            replace_existing=True,
+            misfire_grace_time=3600
+        )
+        
+        # Keep the hourly and daily sensor rollups up to date
+        scheduler.add_job(
+            run_sensor_rollup,
+            trigger=IntervalTrigger(minutes=getattr(settings, 'SENSOR_ROLLUP_INTERVAL_MINUTES', 15)),
+            id='sensor_rollup',
+            replace_existing=True,
+            misfire_grace_time=900
+        )
+        
+        # Move records past their retention out of Firebase into archive storage
+        scheduler.add_job(
+            run_archive_compaction,
+            trigger=IntervalTrigger(hours=getattr(settings, 'ARCHIVE_INTERVAL_HOURS', 24)),
+            id='archive_compaction',
+            replace_existing=True,
+            misfire_grace_time=3600
+        )
+        
         scheduler.start()
+        _scheduler = scheduler
         logger.info("Grow monitor scheduler started successfully")
+        return scheduler
         
     except Exception as e:
         logger.error(f"Error starting grow monitor scheduler: {str(e)}") 
\ No newline at end of file
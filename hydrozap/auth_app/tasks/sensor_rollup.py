@@ -0,0 +1,154 @@
+from firebase_admin import db
+from datetime import datetime, timedelta, timezone
+import logging
+from django.conf import settings
+from ..utils.job_lease import JobLease
+from ..utils.sensor_buffer import SENSOR_FIELDS
+from ..utils.sensor_history import HISTORY_ROOT, fetch_sensor_history, from_epoch_ms, to_epoch_ms, parse_timestamp
+from ..utils.sensor_rollups import (
+    ROLLUP_ROOT,
+    CHECKPOINT_ROOT,
+    DIRTY_ROOT,
+    GRANULARITIES,
+    bucket_key,
+    bucket_start_ms,
+    get_dirty_days,
+    aggregate_readings,
+    merge_stats,
+    get_rollup_checkpoint,
+    fetch_rollups,
+)
+
+logger = logging.getLogger(__name__)
+
+# Never roll up more than this many days of readings for one device in a
+# single run, so the first run over a long history is spread across runs
+MAX_DAYS_PER_RUN = 7
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def _first_reading_ms(device_id):
+    """Return the start of the device's oldest sensor_history day bucket, or None"""
+    days = db.reference(f'{HISTORY_ROOT}/{device_id}').get(shallow=True) or {}
+    if not days:
+        return None
+    return to_epoch_ms(parse_timestamp(min(days)))
+
+
+def reroll_day(device_id, day, marked_at, checkpoint):
+    """
+    Recompute the rollups of a dirty day from its raw readings, up to the
+    checkpoint; readings past the checkpoint are left to the incremental run.
+    Returns the number of readings processed.
+    """
+    day_start_ms = bucket_start_ms(day, 'day')
+    end_ms = min(day_start_ms + DAY_MS - 1, checkpoint) if checkpoint is not None else None
+
+    count = 0
+    if end_ms is not None and end_ms >= day_start_ms:
+        readings = fetch_sensor_history(device_id, from_epoch_ms(day_start_ms), from_epoch_ms(end_ms))
+        updates = {}
+        for granularity in GRANULARITIES:
+            # Whole buckets are recomputed, so they replace what was merged before
+            for bucket, stats in aggregate_readings(readings, SENSOR_FIELDS, granularity).items():
+                updates[f'{ROLLUP_ROOT}/{device_id}/{granularity}/{bucket}'] = merge_stats(None, stats)
+        if updates:
+            db.reference().update(updates)
+        count = len(readings)
+
+    # Keep the mark if another late reading arrived for the day meanwhile
+    db.reference(f'{DIRTY_ROOT}/{device_id}/{day}').transaction(
+        lambda current: None if current == marked_at else current
+    )
+    return count
+
+
+def _advance_checkpoint(device_id, checkpoint, end_ms):
+    """
+    Move the checkpoint from checkpoint to end_ms with a compare-and-set.
+    Returns False if another run moved it first, so the range it read has
+    already been merged by that run.
+    """
+    claimed = []
+
+    def advance(current):
+        claimed.clear()
+        if (int(current) if current else None) != checkpoint:
+            return current
+        claimed.append(True)
+        return end_ms
+
+    db.reference(f'{CHECKPOINT_ROOT}/{device_id}').transaction(advance)
+    return bool(claimed)
+
+
+def rollup_device(device_id, until_ms):
+    """Roll up a device's readings from its checkpoint to until_ms and return the number processed"""
+    checkpoint = get_rollup_checkpoint(device_id)
+
+    # Late readings behind the checkpoint first, the incremental run never looks back
+    rerolled = 0
+    for day, marked_at in sorted(get_dirty_days(device_id).items()):
+        rerolled += reroll_day(device_id, day, marked_at, checkpoint)
+    start_ms = checkpoint + 1 if checkpoint is not None else _first_reading_ms(device_id)
+    if start_ms is None or start_ms > until_ms:
+        return rerolled
+
+    end_ms = min(until_ms, start_ms + MAX_DAYS_PER_RUN * 24 * 60 * 60 * 1000)
+    readings = fetch_sensor_history(device_id, from_epoch_ms(start_ms), from_epoch_ms(end_ms))
+
+    # merge_stats adds to the buckets, so the range is claimed by moving the
+    # checkpoint before merging; a run that read the same checkpoint backs off
+    if not _advance_checkpoint(device_id, checkpoint, end_ms):
+        logger.info(f"Rollup checkpoint of device {device_id} moved during the run, skipping its readings")
+        return rerolled
+    if not readings:
+        return rerolled
+
+    try:
+        first_ms, last_ms = readings[0][0], readings[-1][0]
+        updates = {}
+        for granularity in GRANULARITIES:
+            existing = fetch_rollups(device_id, granularity, first_ms, last_ms)
+            for bucket, stats in aggregate_readings(readings, SENSOR_FIELDS, granularity).items():
+                updates[f'{ROLLUP_ROOT}/{device_id}/{granularity}/{bucket}'] = merge_stats(existing.get(bucket), stats)
+        db.reference().update(updates)
+    except Exception:
+        # The range is already claimed, have the days recomputed from raw readings instead
+        now_ms = to_epoch_ms(datetime.now(timezone.utc))
+        db.reference().update({f"{DIRTY_ROOT}/{device_id}/{bucket_key(epoch_ms, 'day')}": now_ms
+                               for epoch_ms, _ in readings})
+        raise
+    return rerolled + len(readings)
+
+
+def run_sensor_rollup():
+    """Incrementally roll up new sensor readings into hourly and daily aggregates for every device"""
+    lease = JobLease('sensor_rollup', getattr(settings, 'JOB_LEASE_SECONDS', 600))
+    if not lease.acquire():
+        logger.info("Sensor rollup is already running in another process, skipping this run")
+        return
+    try:
+        device_ids = list((db.reference(HISTORY_ROOT).get(shallow=True) or {}).keys())
+
+        # Leave the most recent readings alone so buffered writes can land first
+        lag = getattr(settings, 'SENSOR_ROLLUP_LAG_SECONDS', 120)
+        until_ms = to_epoch_ms(datetime.now(timezone.utc) - timedelta(seconds=lag))
+
+        total = 0
+        for device_id in device_ids:
+            if not lease.renew():
+                break
+            try:
+                total += rollup_device(device_id, until_ms)
+            except Exception as e:
+                logger.error(f"Error rolling up sensor readings for device {device_id}: {str(e)}")
+                continue
+
+        logger.info(f"Rolled up {total} sensor readings for {len(device_ids)} devices")
+
+    except Exception as e:
+        logger.error(f"Error in run_sensor_rollup: {str(e)}")
+    finally:
+        lease.release()
@@ -1,3 +1,357 @@
-from django.test import TestCase
+from datetime import datetime, timedelta
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+import copy
+from .utils.alert_engine import (
+    AlertEngine,
+    MemoryAlertStateStore,
+    RECOVERED,
+    STILL_FIRING,
+    TRIGGERED,
+    condition_key,
+)
+from .utils.sensor_rollups import merge_stats
 
-# Create your tests here.
+
+class FakeReference:
+    """Just enough of firebase_admin.db.Reference, backed by a nested dict"""
+
+    def __init__(self, database, path, query=None):
+        self.database = database
+        self.parts = [part for part in path.split('/') if part]
+        self.query = query or {}
+
+    def _node(self):
+        node = self.database.root
+        for part in self.parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def _ordered(self, node):
+        order = self.query.get('order_by')
+        if order == '$key':
+            value_of = lambda item: item[0]
+        else:
+            value_of = lambda item: item[1].get(order) if isinstance(item[1], dict) else None
+        # Firebase orders missing values first, then numbers, then strings
+        items = sorted(node.items(), key=lambda item: (
+            value_of(item) is not None, isinstance(value_of(item), str),
+            value_of(item) if value_of(item) is not None else 0, item[0]))
+        if 'equal_to' in self.query:
+            items = [item for item in items if value_of(item) == self.query['equal_to']]
+        if 'start_at' in self.query:
+            items = [item for item in items if value_of(item) is not None and value_of(item) >= self.query['start_at']]
+        if 'end_at' in self.query:
+            items = [item for item in items if value_of(item) is not None and value_of(item) <= self.query['end_at']]
+        if 'limit_to_first' in self.query:
+            items = items[:self.query['limit_to_first']]
+        if 'limit_to_last' in self.query:
+            items = items[-self.query['limit_to_last']:]
+        return dict(items)
+
+    def get(self, shallow=False):
+        node = self._node()
+        if isinstance(node, dict) and self.query.get('order_by'):
+            node = self._ordered(node)
+        if shallow and isinstance(node, dict):
+            return {key: True for key in node}
+        return copy.deepcopy(node)
+
+    def set(self, value):
+        self.database.write(self.parts, value)
+
+    def update(self, values):
+        for path, value in values.items():
+            self.database.write(self.parts + [part for part in path.split('/') if part], value)
+
+    def transaction(self, update_fn):
+        value = update_fn(self.get())
+        self.set(value)
+        return value
+
+    def _with(self, **query):
+        return FakeReference(self.database, '/'.join(self.parts), {**self.query, **query})
+
+    def order_by_key(self):
+        return self._with(order_by='$key')
+
+    def order_by_child(self, child):
+        return self._with(order_by=child)
+
+    def equal_to(self, value):
+        return self._with(equal_to=value)
+
+    def start_at(self, value):
+        return self._with(start_at=value)
+
+    def end_at(self, value):
+        return self._with(end_at=value)
+
+    def limit_to_first(self, count):
+        return self._with(limit_to_first=count)
+
+    def limit_to_last(self, count):
+        return self._with(limit_to_last=count)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.root = {}
+
+    def reference(self, path='/'):
+        return FakeReference(self, path)
+
+    def write(self, parts, value):
+        if not parts:
+            self.root = copy.deepcopy(value) or {}
+            return
+        node = self.root
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        if isinstance(value, dict) and '.sv' in value:
+            # Server values: only increments are used
+            value = (node.get(parts[-1]) or 0) + value['.sv']['increment']
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = copy.deepcopy(value)
+
+
+class FirebaseTestCase(SimpleTestCase):
+    """Runs each test against an in-memory FakeDatabase instead of Firebase"""
+
+    def setUp(self):
+        super().setUp()
+        self.database = FakeDatabase()
+        patcher = mock.patch('firebase_admin.db.reference', self.database.reference)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+@override_settings(ALERT_COOLDOWN_SECONDS=900, ALERT_AGGREGATE_SECONDS=300, ALERT_HYSTERESIS={'pH': 0.1})
+class AlertEngineTests(SimpleTestCase):
+    def setUp(self):
+        self.engine = AlertEngine(MemoryAlertStateStore())
+        self.key = condition_key('device', 'grow', 'pH', '>')
+        self.start = datetime(2026, 1, 1, 12, 0, 0)
+
+    def evaluate(self, value, seconds):
+        event, _ = self.engine.evaluate(self.key, 'pH', value, '>', 7.5,
+                                        now=self.start + timedelta(seconds=seconds))
+        return event
+
+    def test_trigger_recover_refire_and_cooldown_expiry(self):
+        self.assertEqual(self.evaluate(7.6, 0), TRIGGERED)
+        self.assertEqual(self.evaluate(7.3, 60), RECOVERED)
+
+        # Re-firing within the cooldown of the trigger is folded into that incident
+        self.assertIsNone(self.evaluate(7.6, 65))
+        self.assertIsNone(self.evaluate(7.6, 895))
+
+        # Still firing once the cooldown has run out: alert again
+        self.assertEqual(self.evaluate(7.6, 900), TRIGGERED)
+        self.assertIsNone(self.evaluate(7.6, 905))
+
+        # ...and report the recovery of that new incident
+        self.assertEqual(self.evaluate(7.3, 1000), RECOVERED)
+
+    def test_recovery_does_not_start_the_cooldown(self):
+        self.assertEqual(self.evaluate(7.6, 0), TRIGGERED)
+        self.assertEqual(self.evaluate(7.3, 850), RECOVERED)
+        # 100s after the recovery but past the trigger's cooldown
+        self.assertEqual(self.evaluate(7.6, 950), TRIGGERED)
+
+    def test_suppressed_flap_that_clears_stays_quiet(self):
+        self.assertEqual(self.evaluate(7.6, 0), TRIGGERED)
+        self.assertEqual(self.evaluate(7.3, 60), RECOVERED)
+        self.assertIsNone(self.evaluate(7.6, 120))
+        self.assertIsNone(self.evaluate(7.3, 180))
+
+    def test_hysteresis_and_still_firing(self):
+        self.assertEqual(self.evaluate(7.6, 0), TRIGGERED)
+        self.engine.attach_alert(self.key, 'alert-1')
+        # Inside the hysteresis band: not cleared yet
+        self.assertIsNone(self.evaluate(7.45, 10))
+        self.assertEqual(self.evaluate(7.6, 300), STILL_FIRING)
+        self.assertEqual(self.evaluate(7.35, 310), RECOVERED)
+
+
+class MemoryAlertStateStoreTests(SimpleTestCase):
+    def test_idle_state_expires_after_the_ttl(self):
+        with mock.patch('time.monotonic', return_value=1000.0):
+            store = MemoryAlertStateStore(ttl=600)
+            store.update('key', lambda state: ({'firing': True}, None))
+            self.assertEqual(store.update('key', lambda state: (state, state)), {'firing': True})
+        with mock.patch('time.monotonic', return_value=1700.0):
+            self.assertIsNone(store.update('other', lambda state: (state, None)))
+            # Swept by the prune, not just hidden
+            self.assertNotIn('key', store._states)
+            self.assertIsNone(store.update('key', lambda state: (state, state)))
+
+
+class MergeStatsTests(SimpleTestCase):
+    def test_merge_adds_counts_and_refreshes_the_mean(self):
+        merged = merge_stats(
+            {'temperature': {'min': 10.0, 'max': 20.0, 'sum': 30.0, 'count': 2}},
+            {'temperature': {'min': 5.0, 'max': 15.0, 'sum': 20.0, 'count': 2},
+             'ph': {'min': 6.0, 'max': 6.0, 'sum': 6.0, 'count': 1}},
+        )
+        self.assertEqual(merged['temperature'], {'min': 5.0, 'max': 20.0, 'sum': 50.0, 'count': 4, 'mean': 12.5})
+        self.assertEqual(merged['ph']['mean'], 6.0)
+
+    def test_merge_into_nothing_only_computes_means(self):
+        self.assertEqual(merge_stats(None, {'ec': {'min': 1.0, 'max': 3.0, 'sum': 4.0, 'count': 2}}),
+                         {'ec': {'min': 1.0, 'max': 3.0, 'sum': 4.0, 'count': 2, 'mean': 2.0}})
+
+
+@override_settings(SENSOR_ROLLUP_LAG_SECONDS=120)
+class RollupDeviceTests(FirebaseTestCase):
+    def setUp(self):
+        super().setUp()
+        from .utils.sensor_history import history_updates, to_epoch_ms
+        self.day = '2026-01-01'
+        for minute, value in ((0, 10), (10, 20), (20, 30)):
+            timestamp = f'{self.day}T10:{minute:02d}:00+00:00'
+            self.database.reference().update(history_updates('device', {'timestamp': timestamp, 'temperature': value}))
+        self.until_ms = to_epoch_ms(f'{self.day}T12:00:00+00:00')
+
+    def hour_stats(self):
+        return self.database.reference(f'sensor_rollups/device/hour/{self.day}T10').get()['temperature']
+
+    def test_rerun_with_unchanged_checkpoint_does_not_double_count(self):
+        from .tasks import sensor_rollup
+        self.assertEqual(sensor_rollup.rollup_device('device', self.until_ms), 3)
+        self.assertEqual(self.hour_stats()['count'], 3)
+
+        # A second run that read the checkpoint before the first one advanced it
+        with mock.patch.object(sensor_rollup, 'get_rollup_checkpoint', return_value=None):
+            self.assertEqual(sensor_rollup.rollup_device('device', self.until_ms), 0)
+        self.assertEqual(self.hour_stats(), {'min': 10.0, 'max': 30.0, 'sum': 60.0, 'count': 3, 'mean': 20.0})
+
+        # And a normal rerun has nothing new to merge
+        self.assertEqual(sensor_rollup.rollup_device('device', self.until_ms), 0)
+        self.assertEqual(self.hour_stats()['count'], 3)
+
+    def test_lease_keeps_a_second_process_out(self):
+        from .utils.job_lease import JobLease
+        first = JobLease('sensor_rollup', 600, owner='worker-1')
+        second = JobLease('sensor_rollup', 600, owner='worker-2')
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        first.release()
+        self.assertTrue(second.acquire())
+
+
+@override_settings(LEADERBOARD_TOP_K=2)
+class LeaderboardTests(FirebaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.database.reference('leaderboard/built_at').set('2026-01-01T00:00:00')
+
+    def add(self, log_id, score, crop='Basil', harvest_date='2026-01-15'):
+        from .utils.leaderboard import add_leaderboard_entry
+        add_leaderboard_entry({'logId': log_id, 'cropName': crop, 'harvestDate': harvest_date, 'score': score})
+
+    def ranked(self, path):
+        from .utils.leaderboard import rank_entries
+        return [entry['logId'] for entry in rank_entries(self.database.reference(path).get())]
+
+    def count(self, path):
+        return self.database.reference(f'leaderboard_counts/{path}').get()
+
+    def test_insert_ranks_the_entry_in_every_bucket(self):
+        self.add('log-1', 10)
+        self.add('log-2', 30)
+        for path in ('all', 'crops/basil', 'months/2026-01', 'crop_months/basil/2026-01'):
+            self.assertEqual(self.ranked(f'leaderboard/{path}'), ['log-2', 'log-1'])
+            self.assertEqual(self.count(path), 2)
+
+    def test_insert_past_top_k_evicts_the_lowest(self):
+        self.add('log-1', 10)
+        self.add('log-2', 30)
+        self.add('log-3', 20)
+        self.assertEqual(self.ranked('leaderboard/all'), ['log-2', 'log-3'])
+        self.assertEqual(self.count('all'), 3)
+
+        # An entry below the top K is kept out of the bucket but still counted
+        self.add('log-4', 5)
+        self.assertEqual(self.ranked('leaderboard/all'), ['log-2', 'log-3'])
+        self.assertEqual(self.count('all'), 4)
+
+    def test_demoted_entry_is_replaced_by_the_next_best(self):
+        self.add('log-1', 30)
+        self.add('log-2', 20)
+        self.add('log-3', 10)
+        self.add('log-1', 5)
+        self.assertEqual(self.ranked('leaderboard/all'), ['log-2', 'log-3'])
+        self.assertEqual(self.ranked('leaderboard/crops/basil'), ['log-2', 'log-3'])
+        self.assertEqual(self.count('all'), 3)
+
+    def test_moving_crops_refills_the_old_bucket(self):
+        self.add('log-1', 30)
+        self.add('log-2', 20)
+        self.add('log-3', 10)
+        self.add('log-1', 30, crop='Tomato')
+        self.assertEqual(self.ranked('leaderboard/crops/basil'), ['log-2', 'log-3'])
+        self.assertEqual(self.ranked('leaderboard/crops/tomato'), ['log-1'])
+        self.assertEqual(self.count('crops/basil'), 2)
+        self.assertEqual(self.count('crops/tomato'), 1)
+        self.assertEqual(self.ranked('leaderboard/all'), ['log-1', 'log-2'])
+
+    def test_page_without_a_limit_is_the_top_k_bucket(self):
+        from .utils.leaderboard import get_leaderboard_page
+        for log_id, score in (('log-1', 10), ('log-2', 30), ('log-3', 20)):
+            self.add(log_id, score)
+        # Not ranked through add_leaderboard_entry, so only a query of the entries would find it
+        self.database.reference('leaderboard_entries/log-4').set({'logId': 'log-4', 'score': 50})
+
+        page, total = get_leaderboard_page()
+        self.assertEqual([(entry['logId'], entry['rank']) for entry in page], [('log-2', 1), ('log-3', 2)])
+        self.assertEqual(total, 3)
+
+        # A page past the top K opts in to reading leaderboard_entries
+        page, _ = get_leaderboard_page(limit=2, offset=2)
+        self.assertEqual([(entry['logId'], entry['rank']) for entry in page], [('log-3', 3), ('log-1', 4)])
+
+
+class UserStatsTests(FirebaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.database.reference('user_stats/user').set(
+            {'devices': 0, 'alerts_unread': 0, 'alerts_total': 0, 'active_grows': 0})
+
+    def test_alert_writes_move_the_counters_in_the_same_update(self):
+        from .utils.alert_index import delete_alert, save_alert
+        from .utils.user_stats import get_user_stats
+        with mock.patch.object(FakeReference, 'transaction', side_effect=AssertionError):
+            alert = save_alert('user', 'alert-1', {'message': 'pH high', 'status': 'unread'})
+            save_alert('user', 'alert-2', {'message': 'EC low', 'status': 'unread'})
+            self.assertEqual(get_user_stats('user')['alerts_unread'], 2)
+
+            save_alert('user', 'alert-1', {'status': 'read'}, previous_alert=alert)
+            self.assertEqual(get_user_stats('user')['alerts_unread'], 1)
+
+            delete_alert('user', 'alert-2', {'message': 'EC low', 'status': 'unread'})
+            stats = get_user_stats('user')
+        self.assertEqual((stats['alerts_total'], stats['alerts_unread']), (1, 0))
+
+    def test_increment_without_counters_is_rebuilt_from_the_source(self):
+        from .utils.alert_index import save_alert
+        from .utils.user_stats import get_user_stats
+        self.database.reference('alerts/other/alert-0').set({'status': 'read'})
+        save_alert('other', 'alert-1', {'status': 'unread'})
+        self.assertEqual(self.database.reference('user_stats/other').get(), {'alerts_total': 1, 'alerts_unread': 1})
+        self.assertEqual(get_user_stats('other'),
+                         {'devices': 0, 'alerts_unread': 1, 'alerts_total': 2, 'active_grows': 0})
+
+
+class UsernameIndexTests(FirebaseTestCase):
+    def test_index_miss_falls_back_to_the_users_tree_and_indexes_it(self):
+        from .utils.user_index import get_uid_by_username
+        self.database.reference('users/uid-1').set({'username': 'grower', 'email': 'grower@example.com'})
+        self.assertEqual(get_uid_by_username('grower'), 'uid-1')
+        self.assertEqual(self.database.reference('usernames/grower').get(), 'uid-1')
+        self.assertIsNone(get_uid_by_username('nobody'))
+        self.assertIsNone(self.database.reference('usernames/nobody').get())
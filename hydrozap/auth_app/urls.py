@@ -12,9 +12,11 @@ from .views import (
     RegisteredDeviceView,
     DeviceView,
     DeviceCountView,
+    DeviceInsightsView,
     
     # Sensor views
     SensorDataView,
+    SensorBatchView,
     ActuatorDataView,
     HistoricalSensorDataView,
     DosingLogDataView,
@@ -38,6 +40,7 @@ from .views import (
     LeafCountPredictorView,
     CropSuggestionView,
     EnvironmentRecommendationView,
+    BatchPredictionView,
     
     # Notification views
     FcmTokenView,
@@ -73,8 +76,10 @@ urlpatterns = [
     
     # Sensor and actuator endpoints
     path('sensors/', SensorDataView.as_view(), name='sensors'),
+    path('sensors/batch/', SensorBatchView.as_view(), name='sensors-batch'),
     path('actuators/', ActuatorDataView.as_view(), name='actuators'),
     path('devices/<str:device_id>/dosing-logs/', DosingLogDataView.as_view(), name='dosing-logs'),
+    path('devices/<str:device_id>/insights/', DeviceInsightsView.as_view(), name='device-insights'),
     
     # Plant profile endpoints
     path('plant-profiles/', PlantProfileView.as_view(), name='plant-profiles'),
@@ -114,6 +119,7 @@ urlpatterns = [
     path('predict/leaf-count/', LeafCountPredictorView.as_view(), name='predict-count'),
     path('predict/crop-suggestion/', CropSuggestionView.as_view(), name='predict-crop'),
     path('predict/environment-recommendation/', EnvironmentRecommendationView.as_view(), name='predict-environment'),
+    path('predict/<str:model_name>/batch/', BatchPredictionView.as_view(), name='predict-batch'),
     
     # FCM endpoints
     path('fcm-token/', FcmTokenView.as_view(), name='fcm-token'),
@@ -0,0 +1,249 @@
+from django.conf import settings
+from datetime import datetime
+import json
+import logging
+import threading
+import time
+
+try:
+    import redis
+except ImportError:  # Redis is only needed when ALERT_STATE_REDIS_URL or CACHE_REDIS_URL is set
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Events returned by AlertEngine.evaluate()
+TRIGGERED = 'triggered'        # condition started firing, create an alert
+RECOVERED = 'recovered'        # condition cleared past the hysteresis band
+STILL_FIRING = 'still_firing'  # aggregation interval elapsed while firing
+
+
+def is_violated(value, operator, threshold):
+    """Return True if value breaks a grow condition"""
+    if operator == "<":
+        return value < threshold
+    elif operator == ">":
+        return value > threshold
+    elif operator == "==":
+        return value == threshold
+    return False
+
+
+def is_cleared(value, operator, threshold, hysteresis=0.0):
+    """Return True once value is back on the safe side of threshold by at least hysteresis"""
+    if operator == "<":
+        return value >= threshold + hysteresis
+    elif operator == ">":
+        return value <= threshold - hysteresis
+    elif operator == "==":
+        return value != threshold
+    return True
+
+
+def condition_key(device_id, grow_id, sensor_type, operator):
+    """
+    Identify one condition of one grow on one device. The threshold is left
+    out so editing it keeps the condition's state and its recovery alert.
+    """
+    return f"{device_id}:{grow_id}:{sensor_type}:{operator}"
+
+
+def alert_state_redis_url():
+    """Return the Redis alert state is shared through: ALERT_STATE_REDIS_URL, else the cache's Redis"""
+    return getattr(settings, 'ALERT_STATE_REDIS_URL', '') or getattr(settings, 'CACHE_REDIS_URL', '')
+
+
+def check_alert_state_store():
+    """
+    Alert state kept in memory is per process, so with several workers each
+    one alerts on its own. Return False (and log why) when it isn't shared.
+    """
+    if not alert_state_redis_url():
+        logger.warning("Neither ALERT_STATE_REDIS_URL nor CACHE_REDIS_URL is set, so alert state is kept per "
+                       "worker process; conditions will alert once per worker unless the app runs a single worker")
+        return False
+    if redis is None:
+        logger.warning("A Redis URL is set for alert state but redis is not installed, keeping alert state in memory")
+        return False
+    return True
+
+
+class MemoryAlertStateStore:
+    """
+    Per-process alert state, enough for a single worker. Like the Redis
+    store, state left alone for ttl seconds expires, so conditions of
+    deleted grows and devices don't pile up.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._states = {}
+        self._pruned_at = time.monotonic()
+
+    def _prune(self, now):
+        # Sweeping every expired entry at most once a minute keeps updates cheap
+        if now - self._pruned_at < 60:
+            return
+        self._pruned_at = now
+        for key in [key for key, (_, expires_at) in self._states.items() if expires_at <= now]:
+            del self._states[key]
+
+    def update(self, key, func):
+        """Apply func(state) -> (new_state, result) atomically and return result"""
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            state, expires_at = self._states.get(key, (None, None))
+            if expires_at is not None and expires_at <= now:
+                state = None
+            state, result = func(state)
+            if state is None:
+                self._states.pop(key, None)
+            else:
+                self._states[key] = (state, now + self.ttl if self.ttl else float('inf'))
+            return result
+
+
+class RedisAlertStateStore:
+    """Alert state shared by every worker through Redis"""
+
+    def __init__(self, url, ttl, prefix='alert_state:'):
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def update(self, key, func):
+        """Apply func(state) -> (new_state, result) in a WATCH/MULTI transaction and return result"""
+        redis_key = self.prefix + key
+
+        def apply(pipe):
+            raw = pipe.get(redis_key)
+            state, result = func(json.loads(raw) if raw else None)
+            pipe.multi()
+            if state is None:
+                pipe.delete(redis_key)
+            else:
+                pipe.set(redis_key, json.dumps(state), ex=self.ttl)
+            return result
+
+        return self.client.transaction(apply, redis_key, value_from_callable=True)
+
+
+class AlertEngine:
+    """
+    Stateful alerting for grow conditions.
+
+    Tracks each (device, grow, condition) so a violation produces one alert
+    when it starts and one when it clears, instead of one per reading. A
+    firing condition only clears once the value is back past the threshold
+    by the sensor's hysteresis band, a condition that re-fires within the
+    cooldown of its last trigger is folded into the previous incident
+    silently until the cooldown runs out, and readings while firing are
+    counted and reported as STILL_FIRING at most once per aggregation
+    interval.
+    """
+
+    def __init__(self, store=None):
+        self._store = store
+        self._lock = threading.Lock()
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = self._create_store()
+        return self._store
+
+    def _create_store(self):
+        url = alert_state_redis_url()
+        ttl = getattr(settings, 'ALERT_STATE_TTL', 7 * 24 * 3600)
+        if url:
+            if redis is None:
+                logger.warning("A Redis URL is set for alert state but redis is not installed, keeping alert state in memory")
+            else:
+                return RedisAlertStateStore(url, ttl)
+        return MemoryAlertStateStore(ttl)
+
+    @staticmethod
+    def hysteresis(sensor_type):
+        return getattr(settings, 'ALERT_HYSTERESIS', {}).get(sensor_type, 0.0)
+
+    def evaluate(self, key, sensor_type, value, operator, threshold, now=None):
+        """Feed a reading for one condition and return (event or None, state)"""
+        now = (now or datetime.now()).timestamp()
+        cooldown = getattr(settings, 'ALERT_COOLDOWN_SECONDS', 900)
+        aggregate_interval = getattr(settings, 'ALERT_AGGREGATE_SECONDS', 300)
+        violated = is_violated(value, operator, threshold)
+        cleared = is_cleared(value, operator, threshold, self.hysteresis(sensor_type))
+
+        def step(state):
+            if state is None and not violated:
+                # Nothing to track for a healthy condition
+                return None, None
+            state = dict(state or {'firing': False})
+
+            def trigger():
+                state.update({'suppressed': False, 'last_alert_at': now, 'last_triggered_at': now})
+                state.pop('alert_id', None)
+                return state, TRIGGERED
+
+            # The cooldown runs from the last TRIGGERED alert, never from a recovery
+            last_triggered_at = state.get('last_triggered_at', state.get('last_alert_at', 0))
+
+            if not state['firing']:
+                if not violated:
+                    return state, None
+                # Re-firing soon after the last trigger continues that incident quietly
+                suppressed = now - last_triggered_at < cooldown
+                state.update({
+                    'firing': True,
+                    'suppressed': suppressed,
+                    'since': state['since'] if suppressed and state.get('since') else now,
+                    'occurrences': (state.get('occurrences', 0) if suppressed else 0) + 1,
+                    'last_value': value,
+                    'last_reported_at': now,
+                })
+                if suppressed:
+                    return state, None
+                return trigger()
+
+            if cleared:
+                state['firing'] = False
+                state['last_value'] = value
+                if state.get('suppressed'):
+                    return state, None
+                state['last_alert_at'] = now
+                return state, RECOVERED
+
+            # Still firing, or inside the hysteresis band: aggregate
+            if violated:
+                state['occurrences'] = state.get('occurrences', 0) + 1
+            state['last_value'] = value
+            if state.get('suppressed') and violated and now - last_triggered_at >= cooldown:
+                # A quietly re-fired condition that outlasts the cooldown is a new incident
+                state.update({'since': now, 'occurrences': 1, 'last_reported_at': now})
+                return trigger()
+            if state.get('alert_id') and now - state.get('last_reported_at', 0) >= aggregate_interval:
+                state['last_reported_at'] = now
+                return state, STILL_FIRING
+            return state, None
+
+        def update(state):
+            state, event = step(state)
+            return state, (event, state)
+
+        return self.store.update(key, update)
+
+    def attach_alert(self, key, alert_id):
+        """Remember the alert created for the current incident so it can be aggregated into"""
+        def step(state):
+            if state is not None:
+                state = dict(state, alert_id=alert_id)
+            return state, None
+
+        self.store.update(key, step)
+
+
+alert_engine = AlertEngine()
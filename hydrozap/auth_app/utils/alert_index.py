@@ -0,0 +1,173 @@
+from firebase_admin import db
+from .firebase_loader import FirebaseLoader
+from .user_stats import alert_stats_updates
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Secondary indexes maintained alongside alerts/{user_id} so filtered alert
+# lists read small key-only nodes instead of the whole alert history:
+#   alerts_by_status/{user_id}/{status}/{alert_id}    -> True
+#   alerts_by_type/{user_id}/{alert_type}/{alert_id}  -> True
+INDEX_ROOTS = ['alerts_by_status', 'alerts_by_type']
+
+_INVALID_KEY_CHARS = re.compile(r'[.$#\[\]/]')
+
+
+def index_key(value):
+    """Turn a status or alert type into a valid Firebase key"""
+    return _INVALID_KEY_CHARS.sub('_', str(value)) or '_'
+
+
+def _index_entries(user_id, alert_id, alert):
+    """Return the index paths and values for a single alert record"""
+    if not alert:
+        return {}
+    alert_status = index_key(alert.get('status') or 'unread')
+    alert_type = index_key(alert.get('alert_type') or 'sensor')
+    return {
+        f'alerts_by_status/{user_id}/{alert_status}/{alert_id}': True,
+        f'alerts_by_type/{user_id}/{alert_type}/{alert_id}': True,
+    }
+
+
+def alert_index_updates(user_id, alert_id, alert=None, previous_alert=None):
+    """Build multi-path updates that move an alert's index entries from previous_alert to alert"""
+    updates = {path: None for path in _index_entries(user_id, alert_id, previous_alert)}
+    updates.update(_index_entries(user_id, alert_id, alert))
+    return updates
+
+
+def save_alert(user_id, alert_id, alert_data, previous_alert=None):
+    """
+    Write an alert together with its index entries and counters in one
+    multi-path update.
+
+    For an existing alert only the given fields are written, matching the
+    semantics of alert_ref.update().
+    """
+    if previous_alert is None:
+        updates = {f'alerts/{user_id}/{alert_id}': alert_data}
+        merged_alert = alert_data
+    else:
+        updates = {f'alerts/{user_id}/{alert_id}/{field}': value for field, value in alert_data.items()}
+        merged_alert = {**previous_alert, **alert_data}
+
+    updates.update(alert_index_updates(user_id, alert_id, merged_alert, previous_alert))
+    updates.update(alert_stats_updates(user_id, previous_alert, merged_alert))
+    db.reference().update(updates)
+    return merged_alert
+
+
+def delete_alert(user_id, alert_id, alert):
+    """Delete an alert and its index entries and counters in one multi-path update"""
+    updates = {f'alerts/{user_id}/{alert_id}': None}
+    updates.update(alert_index_updates(user_id, alert_id, None, alert))
+    updates.update(alert_stats_updates(user_id, alert, None))
+    db.reference().update(updates)
+
+
+def get_alert_ids(user_id, status=None, alert_type=None):
+    """Return the sorted (oldest first) ids of a user's alerts matching the filters"""
+    alert_ids = None
+    if status:
+        alert_ids = set(db.reference(f'alerts_by_status/{user_id}/{index_key(status)}').get(shallow=True) or {})
+    if alert_type and alert_ids != set():
+        type_ids = set(db.reference(f'alerts_by_type/{user_id}/{index_key(alert_type)}').get(shallow=True) or {})
+        alert_ids = type_ids if alert_ids is None else alert_ids & type_ids
+    if alert_ids is None:
+        alert_ids = db.reference(f'alerts/{user_id}').get(shallow=True) or {}
+    return sorted(alert_ids)
+
+
+def page_alert_ids(alert_ids, limit, before=None):
+    """Return (newest first ids older than before, next cursor or None) from sorted alert_ids"""
+    if before:
+        alert_ids = [alert_id for alert_id in alert_ids if alert_id < before]
+    page = alert_ids[-limit:]
+    next_before = page[0] if len(alert_ids) > limit else None
+    return list(reversed(page)), next_before
+
+
+def get_alert_page(user_id, limit, before=None, status=None, alert_type=None):
+    """Return ({alert_id: alert} for the newest limit matching alerts older than before, next cursor or None)"""
+    if status or alert_type:
+        alert_ids, next_before = page_alert_ids(get_alert_ids(user_id, status, alert_type), limit, before)
+        return get_alerts(user_id, alert_ids), next_before
+
+    query = db.reference(f'alerts/{user_id}').order_by_key()
+    if before:
+        # end_at is inclusive, so fetch the cursor itself too and drop it
+        query = query.end_at(before)
+    # One extra alert tells whether there is another page
+    alerts = query.limit_to_last(limit + 1 + (1 if before else 0)).get() or {}
+
+    alert_ids, next_before = page_alert_ids(sorted(alert_id for alert_id in alerts if alert_id != before), limit)
+    return {alert_id: alerts[alert_id] for alert_id in alert_ids}, next_before
+
+
+def get_alerts(user_id, alert_ids):
+    """Fetch the alerts for the given ids concurrently, in order, skipping missing ones"""
+    alert_ids = list(alert_ids)
+    loaded = FirebaseLoader().load_many([f'alerts/{user_id}/{alert_id}' for alert_id in alert_ids])
+    alerts = {}
+    for alert_id in alert_ids:
+        alert = loaded[f'alerts/{user_id}/{alert_id}']
+        if isinstance(alert, dict):
+            alerts[alert_id] = alert
+    return alerts
+
+
+def iter_alerts(user_id, status=None, alert_type=None, chunk_size=200):
+    """Yield (alert_id, alert) newest first, reading chunk_size alerts at a time"""
+    if status or alert_type:
+        alert_ids = get_alert_ids(user_id, status, alert_type)
+        for end in range(len(alert_ids), 0, -chunk_size):
+            chunk = alert_ids[max(0, end - chunk_size):end]
+            yield from get_alerts(user_id, reversed(chunk)).items()
+        return
+
+    before = None
+    while True:
+        query = db.reference(f'alerts/{user_id}').order_by_key()
+        if before:
+            query = query.end_at(before)
+        alerts = query.limit_to_last(chunk_size + (1 if before else 0)).get() or {}
+        alert_ids = sorted(alert_id for alert_id in alerts if alert_id != before)
+        for alert_id in reversed(alert_ids):
+            if isinstance(alerts[alert_id], dict):
+                yield alert_id, alerts[alert_id]
+        if len(alert_ids) < chunk_size:
+            return
+        before = alert_ids[0]
+
+
+def rebuild_alert_indexes(user_id=None):
+    """Rebuild the alert indexes from the alerts tree and return the number of alerts indexed"""
+    user_ids = [user_id] if user_id else list(db.reference('alerts').get(shallow=True) or {})
+    count = 0
+    for uid in user_ids:
+        alerts = db.reference(f'alerts/{uid}').get() or {}
+        roots = {root: {} for root in INDEX_ROOTS}
+        for alert_id, alert in alerts.items():
+            if not isinstance(alert, dict):
+                continue
+            for path, value in _index_entries(uid, alert_id, alert).items():
+                root, _, group, key = path.split('/')
+                roots[root].setdefault(group, {})[key] = value
+            count += 1
+
+        db.reference().update({f'{root}/{uid}': tree or None for root, tree in roots.items()})
+
+    if not user_id:
+        # Drop indexes of users who no longer have any alerts
+        indexed = set()
+        for root in INDEX_ROOTS:
+            indexed |= set(db.reference(root).get(shallow=True) or {})
+        stale = indexed - set(user_ids)
+        if stale:
+            db.reference().update({f'{root}/{uid}': None for root in INDEX_ROOTS for uid in stale})
+
+    logger.info(f"Rebuilt alert indexes for {count} alerts")
+    return count
@@ -0,0 +1,197 @@
+from django.conf import settings
+from firebase_admin import db
+from datetime import datetime, timezone
+import gzip
+import json
+import logging
+import os
+import threading
+
+try:
+    from google.cloud import storage as gcs
+except ImportError:  # Only needed when ARCHIVE_GCS_BUCKET is set
+    gcs = None
+
+logger = logging.getLogger(__name__)
+
+# Records moved out of Firebase by the archive compaction job are kept as
+# gzipped JSON lines, one blob per kind, owner (device or user) and UTC month:
+#   {kind}/{owner}/{YYYY-MM}.jsonl.gz -> {"key": ..., "ts": epoch_ms, "record": {...}} per line
+# and the newest archived record time per kind and owner is tracked in
+#   archive_watermarks/{kind}/{owner} -> epoch_ms
+# so readers only open archives when a query reaches back that far.
+WATERMARK_ROOT = 'archive_watermarks'
+KINDS = ('sensor_history', 'sensors', 'actuators', 'dosing_logs', 'alerts')
+
+
+def archive_month(epoch_ms):
+    """Return the YYYY-MM month an epoch-millisecond time falls in"""
+    return datetime.fromtimestamp(int(epoch_ms) / 1000, tz=timezone.utc).strftime('%Y-%m')
+
+
+def archive_name(kind, owner, month):
+    return f"{kind}/{owner}/{month}.jsonl.gz"
+
+
+class LocalArchiveStorage:
+    """Archive blobs in a directory on local disk"""
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.root, *name.split('/'))
+
+    def append(self, name, data):
+        """Append a gzip member to a blob, creating it if needed"""
+        path = self._path(name)
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Concatenated gzip members read back as one stream
+            with open(path, 'ab') as archive_file:
+                archive_file.write(data)
+
+    def read(self, name):
+        try:
+            with open(self._path(name), 'rb') as archive_file:
+                return archive_file.read()
+        except FileNotFoundError:
+            return None
+
+    def list(self, prefix):
+        """Return the blob names under a kind/owner/ prefix"""
+        directory = self._path(prefix.rstrip('/'))
+        if not os.path.isdir(directory):
+            return []
+        return sorted(f"{prefix.rstrip('/')}/{filename}" for filename in os.listdir(directory))
+
+
+class GCSArchiveStorage:
+    """Archive blobs in a Cloud Storage bucket"""
+
+    def __init__(self, bucket_name, prefix='archive/'):
+        self.bucket = gcs.Client().bucket(bucket_name)
+        self.prefix = prefix
+
+    def append(self, name, data):
+        """Append a gzip member to a blob, guarding against concurrent writers with its generation"""
+        blob = self.bucket.blob(self.prefix + name)
+        if blob.exists():
+            blob.reload()
+            existing = blob.download_as_bytes()
+            blob.upload_from_string(existing + data, content_type='application/gzip',
+                                    if_generation_match=blob.generation)
+        else:
+            blob.upload_from_string(data, content_type='application/gzip', if_generation_match=0)
+
+    def read(self, name):
+        blob = self.bucket.blob(self.prefix + name)
+        if not blob.exists():
+            return None
+        return blob.download_as_bytes()
+
+    def list(self, prefix):
+        return sorted(blob.name[len(self.prefix):]
+                      for blob in self.bucket.list_blobs(prefix=self.prefix + prefix.rstrip('/') + '/'))
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def has_shared_storage():
+    """Return True if archives go to Cloud Storage, which every host can read"""
+    return bool(getattr(settings, 'ARCHIVE_GCS_BUCKET', '')) and gcs is not None
+
+
+def check_archive_storage():
+    """
+    Archives on local disk are only readable on the host that wrote them, so
+    return False (and log why) when several hosts run the app without Cloud Storage.
+    """
+    if getattr(settings, 'APP_HOSTS', 1) > 1 and not has_shared_storage():
+        logger.error(f"APP_HOSTS is {settings.APP_HOSTS} but archives are written to the local ARCHIVE_DIR; "
+                     "set ARCHIVE_GCS_BUCKET (with google-cloud-storage installed) so every host can read them")
+        return False
+    return True
+
+
+def get_archive_storage():
+    """Return the configured archive storage, Cloud Storage if ARCHIVE_GCS_BUCKET is set"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                bucket_name = getattr(settings, 'ARCHIVE_GCS_BUCKET', '')
+                if bucket_name and gcs is not None:
+                    _storage = GCSArchiveStorage(bucket_name)
+                else:
+                    if bucket_name:
+                        logger.warning("ARCHIVE_GCS_BUCKET is set but google-cloud-storage is not installed, archiving to disk")
+                    _storage = LocalArchiveStorage(getattr(settings, 'ARCHIVE_DIR', 'archive'))
+    return _storage
+
+
+def get_archive_watermark(kind, owner):
+    """Return the time of the newest archived record, or None if nothing was archived"""
+    watermark = db.reference(f'{WATERMARK_ROOT}/{kind}/{owner}').get()
+    return int(watermark) if watermark is not None else None
+
+
+def write_archive(kind, owner, records):
+    """
+    Append [(key, epoch_ms, record)] to the monthly archives and return the
+    watermark multi-path update to apply together with the Firebase deletes.
+    """
+    by_month = {}
+    for key, epoch_ms, record in records:
+        by_month.setdefault(archive_month(epoch_ms), []).append(
+            json.dumps({"key": key, "ts": int(epoch_ms), "record": record}, default=str)
+        )
+
+    storage = get_archive_storage()
+    for month, lines in by_month.items():
+        storage.append(archive_name(kind, owner, month), gzip.compress(('\n'.join(lines) + '\n').encode()))
+
+    previous = get_archive_watermark(kind, owner) or 0
+    newest = max(int(epoch_ms) for _, epoch_ms, _ in records)
+    return {f'{WATERMARK_ROOT}/{kind}/{owner}': max(previous, newest)}
+
+
+def read_archive(kind, owner, start_ms=None, end_ms=None):
+    """
+    Return [(key, epoch_ms, record)] archived for kind and owner between
+    start_ms and end_ms (both optional), oldest first. Records archived twice
+    by a run that was interrupted before its Firebase delete appear once.
+    """
+    storage = get_archive_storage()
+    first_month = archive_month(start_ms) if start_ms is not None else None
+    last_month = archive_month(end_ms) if end_ms is not None else None
+
+    records = {}
+    for name in storage.list(f"{kind}/{owner}/"):
+        month = name.rsplit('/', 1)[-1].split('.', 1)[0]
+        if (first_month and month < first_month) or (last_month and month > last_month):
+            continue
+        data = storage.read(name)
+        if not data:
+            continue
+        for line in gzip.decompress(data).decode().splitlines():
+            if not line:
+                continue
+            entry = json.loads(line)
+            epoch_ms = entry['ts']
+            if (start_ms is not None and epoch_ms < start_ms) or (end_ms is not None and epoch_ms > end_ms):
+                continue
+            records[entry['key']] = (entry['key'], epoch_ms, entry['record'])
+
+    return sorted(records.values(), key=lambda item: item[1])
+
+
+def read_archive_if_needed(kind, owner, start_ms=None, end_ms=None):
+    """Like read_archive, but skips storage entirely when the range starts after the watermark"""
+    watermark = get_archive_watermark(kind, owner)
+    if watermark is None or (start_ms is not None and start_ms > watermark):
+        return []
+    return read_archive(kind, owner, start_ms, min(end_ms, watermark) if end_ms is not None else watermark)
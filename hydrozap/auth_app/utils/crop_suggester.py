@@ -1,8 +1,14 @@
 
+from django.conf import settings
+from django.core.cache import cache
+from firebase_admin import db
 import pandas as pd
 import numpy as np
+import json
 import random
 
+PLANT_PROFILES_CACHE_KEY = 'crop_suggester:plant_profiles'
+
 # Step 1: Define the crop data
 crops_data = {
     "Arugula":        {"temp": (16, 22), "humidity": (60, 75), "pH": (6.0, 7.0), "EC": (0.8, 1.2)},
@@ -19,25 +25,208 @@ def generate_range(min_val, max_val, variance=0.5):
     val = np.clip(random.uniform(min_val - variance, max_val + variance), 0, None)
     return round(val, 2)
 
+# Step 3: Range matrix over every crop, one row per crop and one column per parameter
+PARAMETERS = ("temperature", "humidity", "ph", "ec")
+
+# Keys used by crops_data and by plant profile optimal_conditions for each parameter
+CROPS_DATA_KEYS = {"temperature": "temp", "humidity": "humidity", "ph": "pH", "ec": "EC"}
+PROFILE_KEYS = {"temperature": "temperature_range", "humidity": "humidity_range", "ph": "ph_range", "ec": "ec_range"}
+
+
+class CropRangeMatrix:
+    """
+    NumPy-backed optimal ranges for many crops.
+
+    lows and highs are (crops x PARAMETERS) arrays, NaN where a crop has no
+    range for a parameter. Environments are scored against every crop at
+    once: the distance for a parameter is how far the value lies outside the
+    range, in units of the range width, and 0 inside it.
+    """
+
+    def __init__(self, names, lows, highs):
+        self.names = list(names)
+        self.lows = np.asarray(lows, dtype=np.float64).reshape(len(self.names), len(PARAMETERS))
+        self.highs = np.asarray(highs, dtype=np.float64).reshape(len(self.names), len(PARAMETERS))
+        widths = self.highs - self.lows
+        # Narrow or single-value ranges still need a non-zero scale
+        self.widths = np.where(widths > 0, widths, 1.0)
+        self.centers = (self.lows + self.highs) / 2
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build from a {crop: {"temp": (min, max), ...}} dict like crops_data"""
+        names = list(data)
+        lows = [[data[name].get(CROPS_DATA_KEYS[p], (np.nan, np.nan))[0] for p in PARAMETERS] for name in names]
+        highs = [[data[name].get(CROPS_DATA_KEYS[p], (np.nan, np.nan))[1] for p in PARAMETERS] for name in names]
+        return cls(names, lows, highs)
+
+    @classmethod
+    def from_plant_profiles(cls, profiles, stage=None):
+        """
+        Build from plant profile records with optimal_conditions per growth stage.
+
+        With a stage only that stage's ranges are used, otherwise each
+        parameter spans the lowest minimum to the highest maximum across stages.
+        """
+        names, lows, highs = [], [], []
+        for identifier, profile in (profiles or {}).items():
+            if not isinstance(profile, dict):
+                continue
+            stages = profile.get("optimal_conditions") or {}
+            if isinstance(stages, str):
+                try:
+                    stages = json.loads(stages)
+                except ValueError:
+                    continue
+            if stage:
+                stages = {stage: stages.get(stage)} if stages.get(stage) else {}
+            if not isinstance(stages, dict) or not stages:
+                continue
+
+            row_low, row_high = [], []
+            for parameter in PARAMETERS:
+                mins, maxes = [], []
+                for conditions in stages.values():
+                    value_range = (conditions or {}).get(PROFILE_KEYS[parameter]) or {}
+                    try:
+                        mins.append(float(value_range["min"]))
+                        maxes.append(float(value_range["max"]))
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                row_low.append(min(mins) if mins else np.nan)
+                row_high.append(max(maxes) if maxes else np.nan)
+
+            if all(np.isnan(row_low)):
+                continue
+            names.append(profile.get("name") or identifier)
+            lows.append(row_low)
+            highs.append(row_high)
+        return cls(names, lows, highs)
+
+    def distances(self, environments):
+        """
+        Score environment rows against every crop.
+
+        environments is an (rows x PARAMETERS) array with NaN for parameters
+        that weren't given. Returns (distance, matched, compared), each
+        (rows x crops): summed out-of-range distance, the number of given
+        parameters inside the crop's range, and the number compared.
+        """
+        env = np.asarray(environments, dtype=np.float64).reshape(-1, 1, len(PARAMETERS))
+        outside = np.maximum(self.lows - env, 0) + np.maximum(env - self.highs, 0)
+        per_parameter = outside / self.widths
+        compared = ~np.isnan(per_parameter)
+        distance = np.where(compared, per_parameter, 0).sum(axis=2)
+        matched = (compared & (per_parameter == 0)).sum(axis=2)
+        return distance, matched, compared.sum(axis=2)
+
+    def row_distances(self, environments):
+        """Distance of environment row i to crop i only, for matrices aligned with their rows"""
+        env = np.asarray(environments, dtype=np.float64).reshape(len(self.names), len(PARAMETERS))
+        outside = np.maximum(self.lows - env, 0) + np.maximum(env - self.highs, 0)
+        per_parameter = outside / self.widths
+        compared = ~np.isnan(per_parameter)
+        distance = np.where(compared, per_parameter, 0).sum(axis=1)
+        return distance, compared.sum(axis=1)
+
+    def describe(self, index):
+        """Format a crop's ranges the way suggest_crops_by_env reports them"""
+        low, high = self.lows[index], self.highs[index]
+
+        def fmt(column, unit="", decimal=False):
+            if np.isnan(low[column]) or np.isnan(high[column]):
+                return "-"
+            if decimal:
+                return f"{float(low[column])}-{float(high[column])}{unit}"
+            return f"{low[column]:g}-{high[column]:g}{unit}"
+
+        return {
+            "crop": self.names[index],
+            "temp_range": fmt(0, "°C"),
+            "humidity_range": fmt(1, "%"),
+            "pH_range": fmt(2, decimal=True),
+            "EC_range": fmt(3, " mS/cm", decimal=True),
+        }
+
+    def rank(self, environments, top_n=4, full_match_only=True):
+        """
+        Rank crops for each environment row in one vectorized pass.
+
+        Crops are ordered by out-of-range distance, then by closeness to the
+        middle of their ranges. Returns one list of suggestions per row.
+        """
+        env = np.asarray(environments, dtype=np.float64).reshape(-1, len(PARAMETERS))
+        if not len(self):
+            return [[] for _ in range(len(env))]
+
+        distance, matched, compared = self.distances(env)
+        centered = np.abs(env[:, None, :] - self.centers) / self.widths
+        centered = np.where(np.isnan(centered), 0, centered).sum(axis=2)
+        # Crops with no range for any given parameter can't be judged
+        eligible = compared > 0
+        if full_match_only:
+            eligible &= matched == compared
+
+        results = []
+        for row in range(len(env)):
+            order = np.lexsort((centered[row], distance[row]))
+            suggestions = []
+            for index in order:
+                if not eligible[row, index]:
+                    continue
+                suggestion = self.describe(index)
+                suggestion.update({
+                    "score": round(float(1 / (1 + distance[row, index])), 4),
+                    "distance": round(float(distance[row, index]), 4),
+                    "matched_parameters": int(matched[row, index]),
+                    "compared_parameters": int(compared[row, index]),
+                })
+                suggestions.append(suggestion)
+                if len(suggestions) >= top_n:
+                    break
+            results.append(suggestions)
+        return results
+
+
+builtin_crop_matrix = CropRangeMatrix.from_dict(crops_data)
+
+
+def get_crop_matrix(user_id=None, stage=None):
+    """
+    Build the crop matrix from the plant profiles visible to a user (public
+    ones plus their own), falling back to the built-in crops_data.
+    """
+    profiles = cache.get(PLANT_PROFILES_CACHE_KEY)
+    if profiles is None:
+        profiles = db.reference('plant_profiles').get() or {}
+        cache.set(PLANT_PROFILES_CACHE_KEY, profiles, getattr(settings, 'CROP_MATRIX_CACHE_TTL', 300))
+
+    visible = {identifier: profile for identifier, profile in profiles.items()
+               if isinstance(profile, dict) and profile.get('user_id') in (None, user_id)}
+    matrix = CropRangeMatrix.from_plant_profiles(visible, stage=stage)
+    return matrix if len(matrix) else builtin_crop_matrix
+
+
+def invalidate_crop_matrix():
+    """Forget the cached plant profiles after a profile is added, changed or deleted"""
+    cache.delete(PLANT_PROFILES_CACHE_KEY)
+
+
+def environment_row(temperature=None, humidity=None, ph=None, ec=None):
+    """Build a PARAMETERS-ordered row, NaN for missing values"""
+    return [np.nan if value is None else float(value) for value in (temperature, humidity, ph, ec)]
+
+
 # Step 5: Suggest crops based on environment with fallback
-def suggest_crops_by_env(temp, humidity, top_n=4):
-    matches = []
-
-    for crop, conditions in crops_data.items():
-        temp_min, temp_max = conditions["temp"]
-        hum_min, hum_max = conditions["humidity"]
-
-        # Only suggest crops that fully match both conditions
-        if temp_min <= temp <= temp_max and hum_min <= humidity <= hum_max:
-            matches.append({
-                "crop": crop,
-                "temp_range": f"{temp_min}-{temp_max}°C",
-                "humidity_range": f"{hum_min}-{hum_max}%",
-                "pH_range": f"{conditions['pH'][0]}-{conditions['pH'][1]}",
-                "EC_range": f"{conditions['EC'][0]}-{conditions['EC'][1]} mS/cm"
-            })
+def suggest_crops_by_env(temp, humidity, top_n=4, ph=None, ec=None, matrix=None):
+    """Return the crops whose ranges contain every given value, best centred first"""
+    matrix = matrix if matrix is not None else builtin_crop_matrix
+    matches = matrix.rank([environment_row(temp, humidity, ph, ec)], top_n=top_n)[0]
 
     if not matches:
         return f"No suitable crops found for {temp}°C and {humidity}%. Please check your input values."
 
-    return matches[:top_n]
+    return matches
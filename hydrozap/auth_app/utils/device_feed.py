@@ -0,0 +1,214 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from firebase_admin import db
+from datetime import datetime
+from .push_id import push_id_timestamp
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+# Device children the feed leaves out of its mirror: dosing_logs is a log
+# collection, and push-ID keyed entries of actuators are the actuator log
+# next to the named actuator settings clients render. Of a legacy sensors
+# node only the plain fields and the newest pushed reading are kept.
+LOG_FIELDS = {'dosing_logs'}
+PUSH_LOG_FIELDS = {'actuators'}
+
+
+def _slim_sensors(sensors):
+    """Keep a legacy sensors node's plain fields and its newest pushed reading"""
+    if not isinstance(sensors, dict):
+        return sensors
+    slim = {key: value for key, value in sensors.items() if push_id_timestamp(key) is None}
+    pushed = [key for key, value in sensors.items() if push_id_timestamp(key) is not None and isinstance(value, dict)]
+    if pushed:
+        newest = max(pushed)
+        slim[newest] = sensors[newest]
+    return slim
+
+
+def _slim_field(field, value):
+    if field == 'sensors':
+        return _slim_sensors(value)
+    if field in PUSH_LOG_FIELDS and isinstance(value, dict):
+        return {key: child for key, child in value.items() if push_id_timestamp(key) is None}
+    return value
+
+
+def slim_device(device):
+    """Return the parts of a device record clients render"""
+    if not isinstance(device, dict):
+        return {}
+    return {field: _slim_field(field, value) for field, value in device.items() if field not in LOG_FIELDS}
+
+
+def _is_log_write(segments):
+    """Return True for a write below a device that only touches its logs"""
+    field = segments[0]
+    if field in LOG_FIELDS:
+        return True
+    return field in PUSH_LOG_FIELDS and len(segments) > 1 and push_id_timestamp(segments[1]) is not None
+
+
+def _set_path(node, segments, value):
+    """Return a copy of node with a Firebase put of value at segments; only dicts on the path are copied"""
+    node = dict(node)
+    if len(segments) == 1:
+        if value is None:
+            node.pop(segments[0], None)
+        else:
+            node[segments[0]] = value
+        return node
+    child = node.get(segments[0])
+    if not isinstance(child, dict):
+        if value is None:
+            return node
+        child = {}
+    node[segments[0]] = _set_path(child, segments[1:], value)
+    return node
+
+
+class DeviceFeed:
+    """
+    Process-wide change feed for the devices tree.
+
+    A single db.reference('devices').listen() stream keeps an in-memory
+    mirror of every device, without its logs, and fans out the devices that
+    changed to the devices_{user_id} channel groups, so DeviceConsumer
+    sockets no longer poll Firebase. Mirrored device dicts are replaced,
+    never mutated, so snapshots handed to consumers stay consistent.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._devices = {}
+        self._ready = threading.Event()
+        self._registration = None
+        self._listener_thread = None
+        self._starter = None
+
+    def start(self):
+        """Start listening if the feed is not already running"""
+        with self._lock:
+            if self.is_running() or (self._starter is not None and self._starter.is_alive()):
+                return
+            self._ready.clear()
+            # listen() starts a non-daemon thread; starting it from a daemon
+            # thread makes it inherit daemon status so it can't block shutdown
+            self._starter = threading.Thread(target=self._listen, name='device-feed', daemon=True)
+            self._starter.start()
+
+    def _listen(self):
+        try:
+            self._listener_thread = None
+            self._registration = db.reference('devices').listen(self._on_event)
+        except Exception as e:
+            logger.error(f"Error starting device feed: {str(e)}")
+
+    def is_running(self):
+        """Return True while the Firebase listener is connected"""
+        if self._registration is None:
+            return False
+        # The listener delivers every event on its own thread, which ends
+        # when the stream fails; until the first event arrives it is connecting
+        listener_thread = self._listener_thread
+        return listener_thread is None or listener_thread.is_alive()
+
+    def is_ready(self):
+        """Return True once the mirror holds a full snapshot and the listener is alive"""
+        return self._ready.is_set() and self.is_running()
+
+    def get_user_devices(self, user_id):
+        """Return {device_id: device} for a user from the mirror"""
+        with self._lock:
+            return {device_id: device for device_id, device in self._devices.items()
+                    if device.get('user_id') == user_id}
+
+    def _on_event(self, event):
+        # Never let an exception escape, it would end the listener thread
+        try:
+            self._listener_thread = threading.current_thread()
+            changed = self._apply(event.event_type, event.path, event.data)
+            self._ready.set()
+            if changed:
+                self._fan_out(changed)
+        except Exception as e:
+            logger.error(f"Error handling device feed event: {str(e)}")
+
+    def _apply(self, event_type, path, data):
+        """Apply a put/patch event to the mirror and return {device_id: (previous_user_id, device)}"""
+        segments = [segment for segment in path.split('/') if segment]
+
+        with self._lock:
+            if not segments and event_type == 'put':
+                # Full snapshot, sent on connect and again after the stream reconnects
+                previous = self._devices
+                self._devices = {device_id: slim_device(device) for device_id, device in (data or {}).items()
+                                 if isinstance(device, dict)}
+                return {
+                    device_id: ((previous.get(device_id) or {}).get('user_id'), self._devices.get(device_id))
+                    for device_id in set(previous) | set(self._devices)
+                    if previous.get(device_id) != self._devices.get(device_id)
+                }
+
+            if event_type == 'patch':
+                writes = [(segments + [part for part in key.split('/') if part], value)
+                          for key, value in (data or {}).items()]
+            else:
+                writes = [(segments, data)]
+
+            changed = {}
+            for write_segments, value in writes:
+                if not write_segments or (len(write_segments) > 1 and _is_log_write(write_segments[1:])):
+                    continue
+                device_id = write_segments[0]
+                if device_id not in changed:
+                    changed[device_id] = (self._devices.get(device_id) or {}).get('user_id')
+
+                # Writes build new dicts along their path, so snapshots already handed out are never mutated
+                if len(write_segments) == 1:
+                    self._devices[device_id] = slim_device(value)
+                else:
+                    field = write_segments[1]
+                    device = _set_path(self._devices.get(device_id) or {}, write_segments[1:], value)
+                    if field in device:
+                        device[field] = _slim_field(field, device[field])
+                    self._devices[device_id] = device
+
+            result = {}
+            for device_id, previous_user_id in changed.items():
+                if not self._devices.get(device_id):
+                    self._devices.pop(device_id, None)
+                result[device_id] = (previous_user_id, self._devices.get(device_id))
+            return result
+
+    def _fan_out(self, changed):
+        """Send each affected user the devices that changed for them"""
+        deltas = {}
+        for device_id, (previous_user_id, device) in changed.items():
+            user_id = device.get('user_id') if device else None
+            if user_id:
+                deltas.setdefault(user_id, {'devices': {}, 'removed': []})['devices'][device_id] = device
+            if previous_user_id and previous_user_id != user_id:
+                deltas.setdefault(previous_user_id, {'devices': {}, 'removed': []})['removed'].append(device_id)
+
+        channel_layer = get_channel_layer()
+        timestamp = datetime.now().isoformat()
+        for user_id, delta in deltas.items():
+            try:
+                async_to_sync(channel_layer.group_send)(
+                    f"devices_{user_id}",
+                    {
+                        "type": "devices.delta",
+                        "timestamp": timestamp,
+                        "devices": delta['devices'],
+                        "removed": delta['removed'],
+                    }
+                )
+            except Exception as e:
+                logger.error(f"Error sending device delta to user {user_id}: {str(e)}")
+
+
+device_feed = DeviceFeed()
@@ -0,0 +1,88 @@
+from firebase_admin import db
+from .firebase_loader import load_path
+from .sensor_history import backfill_device_history
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The newest sensor reading of each device is kept in its own small node,
+#   devices/{device_id}/latest -> {temperature, humidity, ph, ec, tds, waterLevel, timestamp}
+# while the reading history lives only in sensor_history. Older device records
+# still carry devices/{device_id}/sensors, which mixed the latest values in
+# with every pushed reading, until migrate_device_latest moves them out.
+LATEST_KEY = 'latest'
+
+
+def latest_path(device_id):
+    return f'devices/{device_id}/{LATEST_KEY}'
+
+
+def legacy_latest_reading(sensors):
+    """Return the newest reading from a legacy devices/{id}/sensors node"""
+    if not isinstance(sensors, dict):
+        return {}
+
+    # The top-level sensor fields hold the newest reading; older device
+    # records may only have the pushed readings
+    latest = {field: value for field, value in sensors.items() if not isinstance(value, dict)}
+    if latest.get('timestamp'):
+        return latest
+    for reading in sensors.values():
+        if isinstance(reading, dict) and 'timestamp' in reading:
+            if not latest.get('timestamp') or reading['timestamp'] > latest['timestamp']:
+                latest = reading
+    return latest
+
+
+def latest_reading(device_data):
+    """Return the latest sensor values stored on a device record"""
+    latest = (device_data or {}).get(LATEST_KEY)
+    if isinstance(latest, dict):
+        return latest
+    return legacy_latest_reading((device_data or {}).get('sensors'))
+
+
+def get_latest_reading(device_id, loader=None):
+    """Read a device's latest sensor values without downloading the device record"""
+    latest = load_path(latest_path(device_id), loader)
+    if isinstance(latest, dict):
+        return latest
+    # Devices that have not been migrated yet
+    return legacy_latest_reading(load_path(f'devices/{device_id}/sensors', loader))
+
+
+def with_sensor_compat(device_data):
+    """
+    Present the latest reading under 'sensors' as well, the shape clients
+    built against the old layout look for (a map of timestamped readings).
+    """
+    if not isinstance(device_data, dict):
+        return device_data
+    latest = device_data.get(LATEST_KEY)
+    if not isinstance(latest, dict):
+        return device_data
+    return {**device_data, 'sensors': {LATEST_KEY: latest}}
+
+
+def migrate_device_latest(device_id):
+    """
+    Move a device's legacy sensors node out of the device record: readings are
+    copied to sensor_history, the newest one becomes devices/{id}/latest and
+    the sensors node is removed. Returns the number of readings copied, or
+    None if the device had nothing to migrate.
+    """
+    sensors = db.reference(f'devices/{device_id}/sensors').get()
+    if sensors is None:
+        return None
+
+    copied = backfill_device_history(device_id)
+
+    updates = {f'devices/{device_id}/sensors': None}
+    existing = db.reference(latest_path(device_id)).get()
+    latest = legacy_latest_reading(sensors)
+    if latest and not (isinstance(existing, dict) and existing.get('timestamp', '') >= latest.get('timestamp', '')):
+        updates[latest_path(device_id)] = latest
+    db.reference().update(updates)
+
+    logger.info(f"Migrated device {device_id} to the latest node ({copied} readings kept in sensor_history)")
+    return copied
@@ -0,0 +1,94 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from django.conf import settings
+from firebase_admin import db
+import threading
+
+# Pool for the loader's reads, kept apart from the async Firebase pool so a
+# request fanning out reads never starves consumers and async views
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_loader_executor():
+    """Get the shared thread pool the loaders fetch paths on"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'FIREBASE_LOADER_MAX_WORKERS', 16),
+                    thread_name_prefix='firebase-loader'
+                )
+    return _executor
+
+
+def _normalize(path):
+    return path.strip('/')
+
+
+class FirebaseLoader:
+    """
+    Batched, memoizing reader for Firebase paths.
+
+    prime() starts fetching the paths a caller is going to need, all at once
+    on the loader pool; load() waits for a path, fetching it first if nobody
+    primed it. Each path is fetched at most once per loader, so one loader
+    should live no longer than the request (or job) it serves.
+    """
+
+    def __init__(self, executor=None):
+        self._executor = executor or get_loader_executor()
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def prime(self, *paths):
+        """Start fetching paths that have not been requested yet"""
+        with self._lock:
+            for path in paths:
+                if not path:
+                    continue
+                path = _normalize(path)
+                if path not in self._futures:
+                    self._futures[path] = self._executor.submit(lambda p=path: db.reference(p).get())
+        return self
+
+    def load(self, path):
+        """Return the value at path, waiting for its fetch to finish"""
+        path = _normalize(path)
+        self.prime(path)
+        return self._futures[path].result()
+
+    def load_many(self, paths):
+        """Fetch paths concurrently and return {path: value}"""
+        paths = [path for path in paths if path]
+        self.prime(*paths)
+        return {path: self.load(path) for path in paths}
+
+    def set(self, path, value):
+        """Record a value written during the request so later loads see it"""
+        future = Future()
+        future.set_result(value)
+        with self._lock:
+            self._futures[_normalize(path)] = future
+
+    def forget(self, *paths):
+        """Drop memoized values so the next load fetches them again"""
+        with self._lock:
+            for path in paths:
+                self._futures.pop(_normalize(path), None)
+
+
+def get_request_loader(request):
+    """Return the FirebaseLoader scoped to a request, creating it on first use"""
+    loader = getattr(request, '_firebase_loader', None)
+    if loader is None:
+        loader = FirebaseLoader()
+        request._firebase_loader = loader
+    return loader
+
+
+def load_path(path, loader=None):
+    """Read a path through loader when one is given, directly otherwise"""
+    if loader is not None:
+        return loader.load(path)
+    return db.reference(path).get()
@@ -0,0 +1,186 @@
+from firebase_admin import db
+from .firebase_loader import FirebaseLoader
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Secondary indexes maintained alongside the grows tree so request paths can
+# read a small index node instead of downloading every grow:
+#   grows_by_device/{device_id}/{grow_id}       -> grow status
+#   grows_by_user/{user_id}/{status}/{grow_id}  -> True
+#   grows_by_profile/{profile_id}/{grow_id}     -> grow status
+#   grows_by_status/{status}/{grow_id}          -> True
+INDEX_ROOTS = ['grows_by_device', 'grows_by_user', 'grows_by_profile', 'grows_by_status']
+
+
+def _index_entries(grow_id, grow_data):
+    """Return the index paths and values for a single grow record"""
+    if not grow_data:
+        return {}
+
+    grow_status = grow_data.get('status') or 'active'
+    entries = {f'grows_by_status/{grow_status}/{grow_id}': True}
+
+    device_id = grow_data.get('device_id')
+    if device_id:
+        entries[f'grows_by_device/{device_id}/{grow_id}'] = grow_status
+
+    user_id = grow_data.get('user_id')
+    if user_id:
+        entries[f'grows_by_user/{user_id}/{grow_status}/{grow_id}'] = True
+
+    profile_id = grow_data.get('profile_id')
+    if profile_id:
+        entries[f'grows_by_profile/{profile_id}/{grow_id}'] = grow_status
+
+    return entries
+
+
+def grow_index_updates(grow_id, grow_data=None, previous_data=None):
+    """Build multi-path updates that move a grow's index entries from previous_data to grow_data"""
+    updates = {path: None for path in _index_entries(grow_id, previous_data)}
+    updates.update(_index_entries(grow_id, grow_data))
+    return updates
+
+
+def _invalidate_sensor_conditions(*grow_records):
+    """Drop cached sensor alert conditions for the devices these grow records point at"""
+    from .sensor_cache import invalidate_grow_conditions
+    invalidate_grow_conditions(*[record.get('device_id') for record in grow_records if record])
+
+
+def _active_grow_stats_updates(previous_data, grow_data):
+    """Build multi-path updates that move the active_grows counter when a grow becomes or stops being active"""
+    from .user_stats import user_stats_updates
+
+    def active_owner(record):
+        if record and (record.get('status') or 'active') == 'active':
+            return record.get('user_id')
+        return None
+
+    previous_owner, owner = active_owner(previous_data), active_owner(grow_data)
+    if previous_owner == owner:
+        return {}
+    return {**user_stats_updates(previous_owner, active_grows=-1), **user_stats_updates(owner, active_grows=1)}
+
+
+def save_grow(grow_id, grow_data, previous_data=None, replace=False):
+    """
+    Write a grow record together with its index entries in one multi-path update.
+
+    With replace=False only the given fields are written, matching the
+    semantics of grow_ref.update().
+    """
+    if replace:
+        updates = {f'grows/{grow_id}': grow_data}
+        merged_data = grow_data
+    else:
+        updates = {f'grows/{grow_id}/{field}': value for field, value in grow_data.items()}
+        merged_data = {**(previous_data or {}), **grow_data}
+
+    updates.update(grow_index_updates(grow_id, merged_data, previous_data))
+    updates.update(_active_grow_stats_updates(previous_data, merged_data))
+    db.reference().update(updates)
+    _invalidate_sensor_conditions(merged_data, previous_data)
+    return merged_data
+
+
+def delete_grow(grow_id, grow_data):
+    """Delete a grow record and its index entries in one multi-path update"""
+    updates = {f'grows/{grow_id}': None}
+    updates.update(grow_index_updates(grow_id, None, grow_data))
+    updates.update(_active_grow_stats_updates(grow_data, None))
+    db.reference().update(updates)
+    _invalidate_sensor_conditions(grow_data)
+
+
+def _matches_status(grow_status, status):
+    return status is None or str(grow_status).lower() == str(status).lower()
+
+
+def get_device_grow_ids(device_id, status=None):
+    """Return {grow_id: status} for the grows assigned to a device"""
+    if not device_id:
+        return {}
+    entries = db.reference(f'grows_by_device/{device_id}').get() or {}
+    return {grow_id: grow_status for grow_id, grow_status in entries.items()
+            if _matches_status(grow_status, status)}
+
+
+def get_profile_grow_ids(profile_id, status=None):
+    """Return {grow_id: status} for the grows using a grow profile"""
+    if not profile_id:
+        return {}
+    entries = db.reference(f'grows_by_profile/{profile_id}').get() or {}
+    return {grow_id: grow_status for grow_id, grow_status in entries.items()
+            if _matches_status(grow_status, status)}
+
+
+def get_user_grow_ids(user_id, status='active'):
+    """Return the ids of a user's grows with the given status"""
+    if not user_id:
+        return []
+    entries = db.reference(f'grows_by_user/{user_id}/{status}').get(shallow=True) or {}
+    return list(entries.keys())
+
+
+def count_user_grows(user_id, status='active'):
+    """Count a user's grows with the given status without downloading them"""
+    return len(get_user_grow_ids(user_id, status))
+
+
+def get_grow_ids_by_status(status):
+    """Return the ids of all grows with the given status"""
+    entries = db.reference(f'grows_by_status/{status}').get(shallow=True) or {}
+    return list(entries.keys())
+
+
+def get_grow_statuses():
+    """Return every status currently present in the status index"""
+    statuses = db.reference('grows_by_status').get(shallow=True) or {}
+    return list(statuses.keys())
+
+
+def get_grows(grow_ids):
+    """Fetch the grow records for the given ids concurrently, skipping missing ones"""
+    grow_ids = list(grow_ids)
+    loaded = FirebaseLoader().load_many([f'grows/{grow_id}' for grow_id in grow_ids])
+    grows = {}
+    for grow_id in grow_ids:
+        grow_data = loaded[f'grows/{grow_id}']
+        if grow_data:
+            grows[grow_id] = grow_data
+    return grows
+
+
+def get_active_device_grow(device_id):
+    """Return (grow_id, grow_data) for the device's active grow, or (None, None)"""
+    active_ids = get_device_grow_ids(device_id, status='active')
+    for grow_id, grow_data in get_grows(active_ids).items():
+        return grow_id, grow_data
+    return None, None
+
+
+def rebuild_grow_indexes():
+    """Rebuild every grow index from the grows tree and return the number of grows indexed"""
+    grows = db.reference('grows').get() or {}
+
+    roots = {root: {} for root in INDEX_ROOTS}
+    for grow_id, grow_data in grows.items():
+        if not isinstance(grow_data, dict):
+            continue
+        for path, value in _index_entries(grow_id, grow_data).items():
+            parts = path.split('/')
+            node = roots[parts[0]]
+            for part in parts[1:-1]:
+                node = node.setdefault(part, {})
+            node[parts[-1]] = value
+
+    for root, tree in roots.items():
+        if tree:
+            db.reference(root).set(tree)
+        else:
+            db.reference(root).delete()
+
+    logger.info(f"Rebuilt grow indexes for {len(grows)} grows")
+    return len(grows)
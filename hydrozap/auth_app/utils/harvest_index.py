@@ -0,0 +1,101 @@
+from firebase_admin import db
+from .firebase_loader import FirebaseLoader
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Secondary indexes maintained alongside harvest_logs so a device's or grow's
+# logs are found without downloading every harvest log on the platform:
+#   harvest_logs_by_device/{device_id}/{log_id}  -> harvest date
+#   harvest_logs_by_grow/{grow_id}/{log_id}      -> harvest date
+INDEX_ROOTS = ['harvest_logs_by_device', 'harvest_logs_by_grow']
+
+
+def _index_entries(log_id, log_data):
+    """Return the index paths and values for a single harvest log"""
+    if not log_data:
+        return {}
+
+    # The harvest date is stored as the value so pages can be ordered from the index alone
+    harvest_date = log_data.get('harvest_date') or True
+    entries = {}
+
+    device_id = log_data.get('device_id')
+    if device_id:
+        entries[f'harvest_logs_by_device/{device_id}/{log_id}'] = harvest_date
+
+    grow_id = log_data.get('grow_id')
+    if grow_id:
+        entries[f'harvest_logs_by_grow/{grow_id}/{log_id}'] = harvest_date
+
+    return entries
+
+
+def harvest_log_index_updates(log_id, log_data=None, previous_data=None):
+    """Build multi-path updates that move a harvest log's index entries from previous_data to log_data"""
+    updates = {path: None for path in _index_entries(log_id, previous_data)}
+    updates.update(_index_entries(log_id, log_data))
+    return updates
+
+
+def save_harvest_log(log_id, log_data):
+    """Write a harvest log together with its index entries in one multi-path update"""
+    updates = {f'harvest_logs/{log_id}': log_data}
+    updates.update(harvest_log_index_updates(log_id, log_data))
+    db.reference().update(updates)
+
+
+def _newest_first(index):
+    """Return index log ids ordered by harvest date, newest first"""
+    def sort_key(item):
+        log_id, harvest_date = item
+        return (harvest_date if isinstance(harvest_date, str) else '', log_id)
+    return [log_id for log_id, _ in sorted(index.items(), key=sort_key, reverse=True)]
+
+
+def get_harvest_log_ids(device_id, grow_id=None, loader=None):
+    """Return the ids of a device's harvest logs, optionally for one grow, newest first"""
+    loader = loader or FirebaseLoader()
+    device_path = f'harvest_logs_by_device/{device_id}'
+    grow_path = f'harvest_logs_by_grow/{grow_id}' if grow_id else None
+    indexes = loader.load_many([device_path, grow_path])
+
+    index = indexes[device_path] or {}
+    if grow_id:
+        grow_index = indexes[grow_path] or {}
+        index = {log_id: harvest_date for log_id, harvest_date in index.items() if log_id in grow_index}
+    return _newest_first(index)
+
+
+def get_harvest_log_page(device_id, grow_id=None, limit=None, offset=0, loader=None):
+    """
+    Return ([(log_id, log)], total) for one page of a device's harvest logs,
+    newest first. The page's logs are fetched concurrently.
+    """
+    loader = loader or FirebaseLoader()
+    log_ids = get_harvest_log_ids(device_id, grow_id, loader)
+    end = offset + limit if limit is not None else None
+    page_ids = log_ids[offset:end]
+
+    logs = loader.load_many([f'harvest_logs/{log_id}' for log_id in page_ids])
+    page = [(log_id, logs[f'harvest_logs/{log_id}']) for log_id in page_ids
+            if isinstance(logs[f'harvest_logs/{log_id}'], dict)]
+    return page, len(log_ids)
+
+
+def rebuild_harvest_log_indexes():
+    """Rebuild the harvest log indexes from the harvest_logs tree and return the number of logs indexed"""
+    logs = db.reference('harvest_logs').get() or {}
+    roots = {root: {} for root in INDEX_ROOTS}
+    count = 0
+    for log_id, log_data in logs.items():
+        if not isinstance(log_data, dict):
+            continue
+        for path, value in _index_entries(log_id, log_data).items():
+            root, group, key = path.split('/')
+            roots[root].setdefault(group, {})[key] = value
+        count += 1
+
+    db.reference().update({root: tree or None for root, tree in roots.items()})
+    logger.info(f"Rebuilt harvest log indexes for {count} logs")
+    return count
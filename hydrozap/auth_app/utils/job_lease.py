@@ -0,0 +1,58 @@
+from firebase_admin import db
+import logging
+import os
+import socket
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Scheduled jobs may be started by every worker process, so jobs that must not
+# run twice at once hold a lease first:
+#   job_leases/{job_name} -> {owner, expires_at}
+# A lease whose holder died expires after its duration and can be taken over.
+LEASE_ROOT = 'job_leases'
+
+PROCESS_OWNER = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+class JobLease:
+    """
+    Lease on a scheduled job taken with an RTDB transaction, so only one
+    process in the deployment runs the job at a time.
+    """
+
+    def __init__(self, name, duration_seconds, owner=PROCESS_OWNER):
+        self.name = name
+        self.duration_ms = int(duration_seconds * 1000)
+        self.owner = owner
+        self.ref = db.reference(f'{LEASE_ROOT}/{name}')
+
+    def acquire(self):
+        """Take or extend the lease, returning False while another process holds it"""
+        now_ms = _now_ms()
+
+        def take(current):
+            if (isinstance(current, dict) and current.get('owner') != self.owner
+                    and (current.get('expires_at') or 0) > now_ms):
+                return current
+            return {'owner': self.owner, 'expires_at': now_ms + self.duration_ms}
+
+        lease = self.ref.transaction(take)
+        return isinstance(lease, dict) and lease.get('owner') == self.owner
+
+    def renew(self):
+        """Extend a held lease; False means it expired and another process took it over"""
+        held = self.acquire()
+        if not held:
+            logger.warning(f"Lost the {self.name} lease to another process")
+        return held
+
+    def release(self):
+        """Give the lease up so the next run anywhere can start immediately"""
+        self.ref.transaction(lambda current: None if isinstance(current, dict)
+                             and current.get('owner') == self.owner else current)
@@ -0,0 +1,410 @@
+from django.conf import settings
+from firebase_admin import db, exceptions
+from .firebase_loader import FirebaseLoader, load_path
+from datetime import datetime
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# The global leaderboard is materialized when a harvest log is written instead
+# of being recomputed from every log on each request. Each log's entry is
+# scored once and stored in
+#   leaderboard_entries/{log_id}                               -> entry
+# and ranked in top-K buckets that hold at most LEADERBOARD_TOP_K entries:
+#   leaderboard/all/{log_id}                                   -> entry
+#   leaderboard/crops/{crop_key}/{log_id}                      -> entry
+#   leaderboard/months/{YYYY-MM}/{log_id}                      -> entry
+#   leaderboard/crop_months/{crop_key}/{YYYY-MM}/{log_id}      -> entry
+# with the number of logs ranked in each bucket's full ranking kept in
+#   leaderboard_counts/{same path below leaderboard/}          -> count
+# leaderboard/built_at is set once the buckets have been built from the logs.
+#
+# Pages inside the top K, which is also the default page, are served from a
+# bucket. Deeper pages are served from leaderboard_entries, queried by the
+# fields in QUERY_FIELDS, which needs
+#   ".indexOn": ["score", "cropKey", "harvestMonth", "cropMonth"]
+# on leaderboard_entries in the database rules; without it the entries are
+# read in full and filtered in memory. Buckets are only ever changed in
+# transactions, so concurrent harvest log writes don't drop each other's entries.
+LEADERBOARD_ROOT = 'leaderboard'
+ENTRIES_ROOT = 'leaderboard_entries'
+COUNTS_ROOT = 'leaderboard_counts'
+ALL_PERIODS = 'all'
+QUERY_FIELDS = ('cropKey', 'harvestMonth', 'cropMonth')
+
+_rebuild_lock = threading.Lock()
+
+
+def _top_k():
+    return getattr(settings, 'LEADERBOARD_TOP_K', 100)
+
+
+def crop_key(crop_name):
+    """Normalize a crop name into a Firebase-safe bucket key"""
+    key = re.sub(r'[.$#\[\]/\s]+', '_', str(crop_name or '').strip().lower()).strip('_')
+    return key or 'unknown'
+
+
+def harvest_month(harvest_date):
+    """Return the YYYY-MM month of a harvest date, or None if it can't be read"""
+    match = re.match(r'^(\d{4})-(\d{2})', str(harvest_date or ''))
+    return f"{match.group(1)}-{match.group(2)}" if match else None
+
+
+def calculate_score(log_data):
+    """Score a harvest log from its rating, yield and performance metrics"""
+    # Base score from rating (0-5 stars), converted to a 0-100 scale
+    base_score = (log_data.get('rating') or 0) * 20
+
+    # Bonus from yield amount, capped at 50 points
+    yield_bonus = min((log_data.get('yield_amount') or 0) * 5, 50)
+
+    # Average of the performance metrics (assumed 0-100 scale)
+    metrics_bonus = 0
+    metrics_values = [min(value, 100) for value in (log_data.get('performance_metrics') or {}).values()
+                      if isinstance(value, (int, float))]
+    if metrics_values:
+        metrics_bonus = sum(metrics_values) / len(metrics_values)
+
+    return round((base_score * 0.4) + (yield_bonus * 0.4) + (metrics_bonus * 0.2), 2)
+
+
+def _optimal_conditions(profile_data):
+    """Extract the optimal growing conditions shown with a leaderboard entry"""
+    optimal_conditions = {}
+
+    structured_conditions = profile_data.get('optimal_conditions') or {}
+    stage_conditions = {}
+    for stage in ['transplanting', 'vegetative', 'maturation']:
+        if stage in structured_conditions:
+            stage_data = structured_conditions[stage]
+            stage_conditions[stage] = {
+                "temperature": stage_data.get("temperature_range", {}),
+                "humidity": stage_data.get("humidity_range", {}),
+                "ph": stage_data.get("ph_range", {}),
+                "ec": stage_data.get("ec_range", {})
+            }
+    if stage_conditions:
+        optimal_conditions["stages"] = stage_conditions
+
+    # Flat structure, kept alongside the stages for older clients
+    for field in ['temperature', 'humidity', 'ph', 'ec']:
+        optimal_conditions[field] = profile_data.get(f"optimal_{field}", {
+            "min": profile_data.get(f"min_{field}"),
+            "max": profile_data.get(f"max_{field}")
+        })
+    return optimal_conditions
+
+
+def build_leaderboard_entry(log_id, log_data, device_data=None, grow_data=None, loader=None):
+    """
+    Build the leaderboard entry for a harvest log. Device and grow records the
+    caller already holds are used as is; everything else is read from Firebase,
+    through loader when one is given. Only the owner is read from the device.
+    """
+    crop_name = log_data.get('crop_name') or 'Unknown'
+    harvest_date = log_data.get('harvest_date') or ''
+
+    device_id = log_data.get('device_id')
+    grow_id = log_data.get('grow_id')
+    if loader is not None:
+        # The device and grow don't depend on each other, fetch them together
+        loader.prime(f'devices/{device_id}/user_id' if device_data is None and device_id else None,
+                     f'grows/{grow_id}' if grow_data is None and grow_id else None)
+
+    if device_data is not None:
+        user_id = device_data.get('user_id')
+    else:
+        user_id = load_path(f'devices/{device_id}/user_id', loader) if device_id else None
+    user_id = user_id or 'Unknown'
+
+    if grow_data is None and grow_id:
+        grow_data = load_path(f'grows/{grow_id}', loader)
+
+    grow_profile_name = 'Custom Configuration'
+    plant_name = crop_name
+    growth_duration = 0
+    optimal_conditions = {}
+
+    grow_profile_id = (grow_data or {}).get('profile_id') or ''
+    profile_data = load_path(f'grow_profiles/{grow_profile_id}', loader) if grow_profile_id else None
+    if profile_data:
+        grow_profile_name = profile_data.get('name', 'Custom Configuration')
+        optimal_conditions = _optimal_conditions(profile_data)
+
+        plant_profile_id = profile_data.get('plant_profile_id')
+        if plant_profile_id:
+            plant_profile_data = load_path(f'plant_profiles/{plant_profile_id}', loader)
+            if plant_profile_data:
+                plant_name = plant_profile_data.get('name', crop_name)
+
+        growth_duration = profile_data.get('grow_duration_days', 0)
+
+        # Prefer the actual duration when the grow's start date is known
+        if grow_data.get('start_date') and harvest_date:
+            try:
+                start_date = datetime.fromisoformat(grow_data['start_date'].replace('Z', '+00:00'))
+                harvest_datetime = datetime.fromisoformat(harvest_date.replace('Z', '+00:00'))
+                actual_duration = (harvest_datetime - start_date).days
+                if actual_duration > 0:
+                    growth_duration = actual_duration
+            except (ValueError, TypeError, AttributeError) as e:
+                logger.warning(f"Error calculating growth duration for harvest log {log_id}: {str(e)}")
+
+    return {
+        "logId": log_id,
+        "userId": user_id,
+        "cropName": plant_name,
+        "growProfileId": grow_profile_id,
+        "growProfileName": grow_profile_name,
+        "harvestDate": harvest_date,
+        "yieldAmount": log_data.get('yield_amount', 0),
+        "rating": log_data.get('rating', 0),
+        "performanceMetrics": log_data.get('performance_metrics') or {},
+        "score": calculate_score(log_data),
+        "growthDuration": growth_duration,
+        "optimalConditions": optimal_conditions,
+        "remarks": log_data.get('remarks', ''),
+    }
+
+
+def bucket_path(crop=None, period=None):
+    """Return the top-K bucket for a crop and/or YYYY-MM period (None or 'all' for every month)"""
+    if period == ALL_PERIODS:
+        period = None
+    if crop and period:
+        return f'{LEADERBOARD_ROOT}/crop_months/{crop_key(crop)}/{period}'
+    if crop:
+        return f'{LEADERBOARD_ROOT}/crops/{crop_key(crop)}'
+    if period:
+        return f'{LEADERBOARD_ROOT}/months/{period}'
+    return f'{LEADERBOARD_ROOT}/all'
+
+
+def count_path(path):
+    """Return where the size of a bucket's full ranking is kept"""
+    return COUNTS_ROOT + path[len(LEADERBOARD_ROOT):]
+
+
+def _with_query_fields(entry):
+    """Add the fields leaderboard_entries is queried by for crop and month rankings"""
+    crop = crop_key(entry.get('cropName'))
+    month = harvest_month(entry.get('harvestDate'))
+    return {
+        **entry,
+        'cropKey': crop,
+        'harvestMonth': month,
+        'cropMonth': f'{crop}/{month}' if month else None,
+    }
+
+
+def _public(entry):
+    return {field: value for field, value in entry.items() if field not in QUERY_FIELDS}
+
+
+def _entry_buckets(entry):
+    """Return every bucket an entry is ranked in"""
+    crop = entry.get('cropName')
+    month = harvest_month(entry.get('harvestDate'))
+    paths = [bucket_path(), bucket_path(crop=crop)]
+    if month:
+        paths += [bucket_path(period=month), bucket_path(crop=crop, period=month)]
+    return paths
+
+
+def _bucket_filter(path):
+    """Return the (field, value) of leaderboard_entries a bucket ranks, or None for the overall ranking"""
+    kind, *keys = path[len(LEADERBOARD_ROOT) + 1:].split('/')
+    if kind == 'crops':
+        return 'cropKey', keys[0]
+    if kind == 'months':
+        return 'harvestMonth', keys[0]
+    if kind == 'crop_months':
+        return 'cropMonth', '/'.join(keys)
+    return None
+
+
+def _query_bucket_entries(path, depth=None):
+    """
+    Read the leaderboard_entries in a bucket's full ranking; for the overall
+    ranking, only the depth best when given. Without the ".indexOn" rule the
+    query is refused, so every entry is read and filtered here instead.
+    """
+    entries_ref = db.reference(ENTRIES_ROOT)
+    bucket_filter = _bucket_filter(path)
+    try:
+        if bucket_filter:
+            return entries_ref.order_by_child(bucket_filter[0]).equal_to(bucket_filter[1]).get() or {}
+        query = entries_ref.order_by_child('score')
+        return (query.limit_to_last(depth) if depth else query).get() or {}
+    except exceptions.FirebaseError as e:
+        logger.warning(f"Querying {ENTRIES_ROOT} for {path} failed, reading every entry instead "
+                       f"(is .indexOn set in the database rules?): {str(e)}")
+    entries = entries_ref.get() or {}
+    if not bucket_filter:
+        return entries
+    field, value = bucket_filter
+    return {log_id: entry for log_id, entry in entries.items()
+            if isinstance(entry, dict) and entry.get(field) == value}
+
+
+def _ranked_items(bucket):
+    # Ties are broken newest log first, the order a score query returns them in reverse
+    items = [(log_id, entry) for log_id, entry in (bucket or {}).items() if isinstance(entry, dict)]
+    return sorted(items, key=lambda item: (item[1].get('score') or 0, item[0]), reverse=True)
+
+
+def rank_entries(bucket):
+    """Return a bucket's entries best first"""
+    return [_public(entry) for _, entry in _ranked_items(bucket)]
+
+
+def _insert_into_bucket(path, log_id, entry, top_k):
+    """Insert an entry into a bucket and trim it back to top_k, in one transaction"""
+    def insert(bucket):
+        bucket = bucket if isinstance(bucket, dict) else {}
+        bucket[log_id] = entry
+        return dict(_ranked_items(bucket)[:top_k])
+
+    db.reference(path).transaction(insert)
+
+
+def _refill_bucket(path, log_id, top_k):
+    """
+    Recompute a bucket after log_id was demoted in or moved out of it. The
+    entries are read from leaderboard_entries first; the transaction then
+    keeps whatever else was ranked in the bucket meanwhile.
+    """
+    ranked = dict(_ranked_items(_query_bucket_entries(path, top_k))[:top_k])
+
+    def refill(bucket):
+        merged = dict(ranked)
+        merged.update({other_id: other for other_id, other in (bucket or {}).items()
+                       if other_id != log_id and isinstance(other, dict)})
+        return dict(_ranked_items(merged)[:top_k]) or None
+
+    db.reference(path).transaction(refill)
+
+
+def _adjust_count(path, delta):
+    db.reference(count_path(path)).transaction(lambda count: max(0, (count or 0) + delta))
+
+
+def add_leaderboard_entry(entry):
+    """
+    Store a harvest log's entry and rank it in its top-K buckets. A log that
+    was already ranked is re-ranked, and buckets it drops out of are refilled
+    from leaderboard_entries so the next best entry takes its place.
+    """
+    log_id = entry['logId']
+    top_k = _top_k()
+    entry = _with_query_fields(entry)
+    entry_ref = db.reference(f'{ENTRIES_ROOT}/{log_id}')
+    previous = entry_ref.get()
+
+    new_paths = _entry_buckets(entry)
+    old_paths = _entry_buckets(previous) if isinstance(previous, dict) else []
+    demoted = isinstance(previous, dict) and (entry.get('score') or 0) < (previous.get('score') or 0)
+
+    # The entry is written first so refilled buckets are computed from its new score
+    entry_ref.set(entry)
+    for path in new_paths:
+        if demoted and path in old_paths:
+            _refill_bucket(path, log_id, top_k)
+        else:
+            _insert_into_bucket(path, log_id, entry, top_k)
+    for path in old_paths:
+        if path not in new_paths:
+            _refill_bucket(path, log_id, top_k)
+
+    for path in new_paths:
+        if path not in old_paths:
+            _adjust_count(path, 1)
+    for path in old_paths:
+        if path not in new_paths:
+            _adjust_count(path, -1)
+    return _public(entry)
+
+
+def _nest(tree, path, value):
+    node = tree
+    *parents, leaf = path.split('/')[1:]
+    for part in parents:
+        node = node.setdefault(part, {})
+    node[leaf] = value
+
+
+def rebuild_leaderboard():
+    """Score every harvest log and rebuild the top-K buckets, returning the number of logs scored"""
+    logs = db.reference('harvest_logs').get() or {}
+    top_k = _top_k()
+
+    logs = {log_id: log_data for log_id, log_data in logs.items() if isinstance(log_data, dict)}
+
+    # Logs share devices, grows and profiles, so each is read only once, and
+    # every record one level down the log -> grow -> profile chain is fetched
+    # concurrently before the entries are built
+    loader = FirebaseLoader()
+    grows = loader.load_many({f'grows/{log["grow_id"]}' for log in logs.values() if log.get('grow_id')})
+    loader.prime(*{f'devices/{log["device_id"]}/user_id' for log in logs.values() if log.get('device_id')})
+    profiles = loader.load_many({f'grow_profiles/{grow["profile_id"]}' for grow in grows.values()
+                                 if isinstance(grow, dict) and grow.get('profile_id')})
+    loader.prime(*{f'plant_profiles/{profile["plant_profile_id"]}' for profile in profiles.values()
+                   if isinstance(profile, dict) and profile.get('plant_profile_id')})
+
+    entries = {}
+    buckets = {}
+    for log_id, log_data in logs.items():
+        try:
+            entry = _with_query_fields(build_leaderboard_entry(log_id, log_data, loader=loader))
+        except Exception as e:
+            logger.error(f"Error scoring harvest log {log_id}: {str(e)}")
+            continue
+        entries[log_id] = entry
+        for path in _entry_buckets(entry):
+            buckets.setdefault(path, {})[log_id] = entry
+
+    tree = {'built_at': datetime.now().isoformat()}
+    counts = {'all': len(entries)}
+    for path, bucket in buckets.items():
+        _nest(tree, path, dict(_ranked_items(bucket)[:top_k]))
+        _nest(counts, path, len(bucket))
+
+    db.reference().update({LEADERBOARD_ROOT: tree, COUNTS_ROOT: counts, ENTRIES_ROOT: entries or None})
+    logger.info(f"Rebuilt leaderboard from {len(entries)} harvest logs")
+    return len(entries)
+
+
+def ensure_leaderboard():
+    """Build the leaderboard from the harvest logs the first time it is needed"""
+    if db.reference(f'{LEADERBOARD_ROOT}/built_at').get():
+        return
+    with _rebuild_lock:
+        if not db.reference(f'{LEADERBOARD_ROOT}/built_at').get():
+            rebuild_leaderboard()
+
+
+def get_leaderboard_page(limit=None, offset=0, crop=None, period=None):
+    """
+    Return (entries, total) for one page of a ranking, best first, with each
+    entry's rank. total counts every log in the ranking, not just the top K.
+    Without a limit the page is the top K, served from the bucket like every
+    page inside it; only pages reaching past the top K read leaderboard_entries.
+    """
+    ensure_leaderboard()
+    top_k = _top_k()
+    path = bucket_path(crop, period)
+    loader = FirebaseLoader()
+    loader.prime(count_path(path))
+
+    end = offset + (limit or top_k)
+    if end <= top_k:
+        ranked = rank_entries(db.reference(path).get())
+    else:
+        # The overall ranking is read only as deep as the page reaches
+        ranked = rank_entries(_query_bucket_entries(path, end))
+
+    page = [{**entry, "rank": offset + index + 1} for index, entry in enumerate(ranked[offset:end])]
+    return page, loader.load(count_path(path)) or 0
@@ -0,0 +1,179 @@
+from django.conf import settings
+import hashlib
+import itertools
+import joblib
+import json
+import logging
+import numpy as np
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), '..', 'model')
+
+# Registry name -> pickle in MODEL_DIR
+MODEL_FILES = {
+    'color_index': 'color_index_randomForest.pkl',
+    'tipburn': 'tipburn_prediction_model.pkl',
+    'tipburn_label_encoder': 'tipburn_label_encoder.pkl',
+    'leaf_count': 'leaf_count_model.pkl',
+    'suggested_crop': 'suggested_crop_predictor.pkl',
+    'label_encoder': 'label_encoder.pkl',
+    'temperature': 'temperature_model.pkl',
+    'humidity': 'humidity_model.pkl',
+    'ec': 'ec_model.pkl',
+    'ph': 'ph_model.pkl',
+    'crop_encoder': 'crop_encoder.pkl',
+    'stage_encoder': 'stage_encoder.pkl',
+}
+
+
+class ModelRegistry:
+    """
+    Loads joblib models on first use instead of at import time.
+
+    Numpy arrays inside the pickles are memory-mapped read-only, so forked
+    workers share the same pages, and a model is reloaded when its .pkl
+    file's modification time changes.
+    """
+
+    def __init__(self, model_dir, model_files, mmap_mode='r'):
+        self.model_dir = model_dir
+        self.model_files = model_files
+        self.mmap_mode = mmap_mode
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def path(self, name):
+        """Return the pickle path for a registered model"""
+        if name not in self.model_files:
+            raise KeyError(f"Unknown model: {name}")
+        return os.path.join(self.model_dir, self.model_files[name])
+
+    def get(self, name):
+        """Return the model, loading it if it isn't loaded yet or its file has changed"""
+        path = self.path(name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Model file not found: {self.model_files[name]}")
+
+        loaded = self._models.get(name)
+        if loaded is not None and loaded[0] == mtime:
+            return loaded[1]
+
+        with self._lock:
+            loaded = self._models.get(name)
+            if loaded is None or loaded[0] != mtime:
+                model = joblib.load(path, mmap_mode=self.mmap_mode)
+                if loaded is not None:
+                    logger.info(f"Reloaded model {name} from {self.model_files[name]}")
+                self._models[name] = (mtime, model)
+                loaded = self._models[name]
+        return loaded[1]
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def unload(self, name=None):
+        """Drop one or all loaded models so the next get() reloads them"""
+        with self._lock:
+            if name is None:
+                self._models.clear()
+            else:
+                self._models.pop(name, None)
+
+
+class EnvironmentTable:
+    """
+    Precomputed crop x stage environment recommendations.
+
+    The environment regressors only take the encoded crop and growth stage,
+    so every possible output is computed in one vectorized pass per model
+    and served from a dict. The table is persisted next to the pickles and
+    rebuilt whenever one of the encoders or models changes.
+    """
+    MODELS = ('crop_encoder', 'stage_encoder', 'temperature', 'humidity', 'ec', 'ph')
+    PARAMETERS = ('temperature', 'humidity', 'ec', 'ph')
+    FILENAME = 'environment_table.json'
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._table = {}
+
+    def fingerprint(self):
+        """Identify the current versions of the model files the table is built from"""
+        digest = hashlib.sha256()
+        for name in self.MODELS:
+            stat = os.stat(self.registry.path(name))
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        return digest.hexdigest()
+
+    def _persisted_path(self):
+        return os.path.join(self.registry.model_dir, self.FILENAME)
+
+    def _load_persisted(self, fingerprint):
+        try:
+            with open(self._persisted_path()) as table_file:
+                persisted = json.load(table_file)
+        except (OSError, ValueError):
+            return None
+        if persisted.get('fingerprint') != fingerprint:
+            return None
+        return persisted.get('table')
+
+    def _persist(self, fingerprint, table):
+        try:
+            with open(self._persisted_path(), 'w') as table_file:
+                json.dump({'fingerprint': fingerprint, 'table': table}, table_file)
+        except OSError as e:
+            logger.warning(f"Could not persist environment table: {str(e)}")
+
+    def build(self):
+        """Run every regressor once over the full crop x stage grid"""
+        crops = list(self.registry['crop_encoder'].classes_)
+        stages = list(self.registry['stage_encoder'].classes_)
+        grid = list(itertools.product(crops, stages))
+        input_features = np.column_stack([
+            self.registry['crop_encoder'].transform([crop for crop, _ in grid]),
+            self.registry['stage_encoder'].transform([stage for _, stage in grid]),
+        ])
+        predictions = {
+            parameter: np.round(self.registry[parameter].predict(input_features), 2).tolist()
+            for parameter in self.PARAMETERS
+        }
+
+        table = {}
+        for index, (crop, stage) in enumerate(grid):
+            table.setdefault(str(crop), {})[str(stage)] = {
+                parameter: predictions[parameter][index] for parameter in self.PARAMETERS
+            }
+        return table
+
+    def get_table(self):
+        """Return {crop: {stage: environment}}, rebuilding it if the models changed"""
+        fingerprint = self.fingerprint()
+        if fingerprint == self._fingerprint:
+            return self._table
+
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                table = self._load_persisted(fingerprint)
+                if table is None:
+                    table = self.build()
+                    if getattr(settings, 'ENVIRONMENT_TABLE_PERSIST', True):
+                        self._persist(fingerprint, table)
+                    logger.info(f"Built environment table for {len(table)} crops")
+                self._table, self._fingerprint = table, fingerprint
+        return self._table
+
+    def lookup(self, crop_type, growth_stage):
+        """Return the recommended environment, or None for an unknown crop or stage"""
+        return self.get_table().get(crop_type, {}).get(growth_stage)
+
+
+model_registry = ModelRegistry(MODEL_DIR, MODEL_FILES)
+environment_table = EnvironmentTable(model_registry)
@@ -0,0 +1,61 @@
+import random
+import threading
+import time
+
+# Same alphabet and layout as Firebase push IDs: 8 characters of millisecond
+# timestamp followed by 12 random characters, so IDs sort chronologically and
+# can be generated locally without a round-trip to the database.
+PUSH_CHARS = '-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz'
+
+_lock = threading.Lock()
+_last_push_time = 0
+_last_rand_chars = [0] * 12
+_random = random.SystemRandom()
+
+
+def generate_push_id(timestamp_ms=None):
+    """Generate a chronologically ordered, collision-free Firebase-style push ID"""
+    global _last_push_time, _last_rand_chars
+
+    now = int(time.time() * 1000) if timestamp_ms is None else int(timestamp_ms)
+
+    with _lock:
+        duplicate_time = now == _last_push_time
+        _last_push_time = now
+
+        if not duplicate_time:
+            _last_rand_chars = [_random.randrange(64) for _ in range(12)]
+        else:
+            # Same millisecond: increment the random part so IDs stay unique and ordered
+            i = 11
+            while i >= 0 and _last_rand_chars[i] == 63:
+                _last_rand_chars[i] = 0
+                i -= 1
+            if i >= 0:
+                _last_rand_chars[i] += 1
+        rand_chars = list(_last_rand_chars)
+
+    return push_id_prefix(now) + ''.join(PUSH_CHARS[c] for c in rand_chars)
+
+
+def push_id_prefix(timestamp_ms):
+    """Return the 8 character time prefix of push IDs created at timestamp_ms"""
+    timestamp_ms = int(timestamp_ms)
+    time_chars = []
+    for _ in range(8):
+        time_chars.append(PUSH_CHARS[timestamp_ms % 64])
+        timestamp_ms //= 64
+    return ''.join(reversed(time_chars))
+
+
+def push_id_timestamp(push_id):
+    """Decode the millisecond timestamp embedded in a push ID, or None if it is not one"""
+    if not push_id or len(push_id) != 20:
+        return None
+    timestamp = 0
+    for char in push_id[:8]:
+        index = PUSH_CHARS.find(char)
+        if index < 0:
+            return None
+        timestamp = timestamp * 64 + index
+    return timestamp
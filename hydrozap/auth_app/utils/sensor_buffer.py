@@ -0,0 +1,116 @@
+from django.conf import settings
+from firebase_admin import db
+from .device_latest import latest_path
+from .sensor_history import history_updates
+from .sensor_rollups import late_reading_updates
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+SENSOR_FIELDS = ['temperature', 'humidity', 'ph', 'ec', 'tds', 'waterLevel']
+
+
+def sensor_reading_updates(device_id, reading, include_latest=True):
+    """
+    Build the multi-path updates that store one sensor reading.
+
+    The reading is written to its sensor_history day bucket, and a late
+    reading marks its day for another rollup. With include_latest it also
+    replaces the device's latest node; the device record itself no longer
+    accumulates readings.
+    """
+    updates = history_updates(device_id, reading)
+    updates.update(late_reading_updates(device_id, reading))
+    if include_latest:
+        updates[latest_path(device_id)] = reading
+    return updates
+
+
+class SensorWriteBuffer:
+    """
+    Write-behind buffer for sensor readings.
+
+    Readings are collected in memory and written to Firebase as a single
+    multi-path update every flush interval, or sooner once max_readings are
+    pending, instead of one push() and one update() per reading.
+    """
+
+    def __init__(self, flush_interval=2.0, max_readings=500):
+        self.flush_interval = flush_interval
+        self.max_readings = max_readings
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = {}
+        self._latest = {}
+        self._count = 0
+        self._thread = None
+
+    def add(self, device_id, reading):
+        """Queue a reading for the next flush"""
+        with self._lock:
+            self._pending.update(sensor_reading_updates(device_id, reading, include_latest=False))
+
+            # Only the newest reading per device ends up in its latest node
+            latest = self._latest.get(device_id)
+            if latest is None or reading.get('timestamp', '') >= latest.get('timestamp', ''):
+                self._latest[device_id] = reading
+
+            self._count += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sensor-write-buffer', daemon=True)
+                self._thread.start()
+            if self._count >= self.max_readings:
+                self._wakeup.set()
+
+    def flush(self):
+        """Write every pending reading to Firebase in one multi-path update"""
+        with self._flush_lock:
+            with self._lock:
+                pending, latest, count = self._pending, self._latest, self._count
+                self._pending, self._latest, self._count = {}, {}, 0
+
+            if not pending:
+                return 0
+
+            updates = dict(pending)
+            for device_id, reading in latest.items():
+                updates[latest_path(device_id)] = reading
+
+            try:
+                db.reference().update(updates)
+            except Exception as e:
+                logger.error(f"Error flushing {count} buffered sensor readings: {str(e)}")
+                self._requeue(pending, latest, count)
+                return 0
+
+            logger.debug(f"Flushed {count} buffered sensor readings for {len(latest)} devices")
+            return count
+
+    def _requeue(self, pending, latest, count):
+        """Put readings from a failed flush back, dropping them if the buffer has filled up meanwhile"""
+        with self._lock:
+            if self._count + count > self.max_readings * 10:
+                logger.error(f"Dropping {count} sensor readings, write buffer is full")
+                return
+            self._pending = {**pending, **self._pending}
+            for device_id, reading in latest.items():
+                self._latest.setdefault(device_id, reading)
+            self._count += count
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+sensor_write_buffer = SensorWriteBuffer(
+    flush_interval=getattr(settings, 'SENSOR_BUFFER_FLUSH_INTERVAL', 2.0),
+    max_readings=getattr(settings, 'SENSOR_BUFFER_MAX_READINGS', 500),
+)
+
+# Don't lose buffered readings when the worker shuts down cleanly
+atexit.register(sensor_write_buffer.flush)
@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.core.cache import cache
+from firebase_admin import db
+import logging
+from .grow_index import get_device_grow_ids, get_grows
+
+logger = logging.getLogger(__name__)
+
+# Short-lived caches for the lookups the sensor ingestion path would otherwise
+# repeat on every reading. The invalidate_* helpers only reach other workers
+# when CACHE_REDIS_URL configures a shared cache; with the per-process default
+# other workers see a change once SENSOR_LOOKUP_CACHE_TTL runs out, so
+# deployments with APP_WORKERS or APP_HOSTS above 1 must set CACHE_REDIS_URL.
+
+
+def has_shared_cache():
+    """Return True if the Django cache is the Redis every worker shares"""
+    return bool(getattr(settings, 'CACHE_REDIS_URL', ''))
+
+
+def runs_multiple_workers():
+    """Return True if more than one process serves the app, on one host or several"""
+    return getattr(settings, 'APP_WORKERS', 1) > 1 or getattr(settings, 'APP_HOSTS', 1) > 1
+
+
+def check_shared_cache():
+    """
+    Cache invalidations only reach the worker that makes them unless the cache
+    is shared, so return False (and log why) when several workers use the
+    per-process cache.
+    """
+    if runs_multiple_workers() and not has_shared_cache():
+        logger.error(f"APP_WORKERS is {getattr(settings, 'APP_WORKERS', 1)} and APP_HOSTS is "
+                     f"{getattr(settings, 'APP_HOSTS', 1)} but the Django cache is per process; set "
+                     "CACHE_REDIS_URL so cache invalidations reach every worker (until then FCM tokens "
+                     "are cached for at most FCM_TOKEN_LOCAL_CACHE_TTL seconds)")
+        return False
+    return True
+
+
+def _cache_ttl():
+    return getattr(settings, 'SENSOR_LOOKUP_CACHE_TTL', 60)
+
+
+def _device_key(device_id):
+    return f'sensor:device_exists:{device_id}'
+
+
+def _conditions_key(device_id):
+    return f'sensor:grow_conditions:{device_id}'
+
+
+def device_exists(device_id):
+    """Return True if the device has been added, using a cached shallow lookup"""
+    exists = cache.get(_device_key(device_id))
+    if exists is None:
+        exists = db.reference(f'devices/{device_id}').get(shallow=True) is not None
+        # Don't hold on to a miss for long, the device may be added at any moment
+        cache.set(_device_key(device_id), exists, _cache_ttl() if exists else min(_cache_ttl(), 10))
+    return exists
+
+
+def get_grow_conditions(device_id):
+    """Return [{grow_id, user_id, conditions}] for the active grows on a device, cached"""
+    conditions = cache.get(_conditions_key(device_id))
+    if conditions is None:
+        conditions = []
+        for grow_id, grow in get_grows(get_device_grow_ids(device_id, status='active')).items():
+            conditions.append({
+                "grow_id": grow_id,
+                "user_id": grow.get('user_id'),
+                "conditions": grow.get('controls', {}).get('condition', []),
+            })
+        cache.set(_conditions_key(device_id), conditions, _cache_ttl())
+    return conditions
+
+
+def invalidate_device(device_id):
+    """Forget the cached existence check for a device"""
+    if device_id:
+        cache.delete(_device_key(device_id))
+
+
+def invalidate_grow_conditions(*device_ids):
+    """Forget the cached grow conditions for the given devices"""
+    keys = [_conditions_key(device_id) for device_id in device_ids if device_id]
+    if keys:
+        cache.delete_many(keys)
@@ -0,0 +1,259 @@
+from firebase_admin import db
+from .push_id import generate_push_id
+from datetime import datetime, timedelta, timezone
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Sensor readings are partitioned by device and UTC day, keyed by epoch
+# milliseconds so a day bucket can be range-queried with order_by_key():
+#   sensor_history/{device_id}/{YYYY-MM-DD}/{epoch_ms}-{suffix} -> reading
+# Epoch-millisecond prefixes all have 13 digits, so Firebase's lexicographic
+# key ordering matches chronological order. The suffix is the random tail of
+# a push ID, so two readings in the same millisecond never overwrite each
+# other. Keys written before the suffix was added are the bare epoch_ms.
+HISTORY_ROOT = 'sensor_history'
+# Sorts after every push ID character, closing a key range on a millisecond
+KEY_RANGE_END = '~'
+
+
+def parse_timestamp(value):
+    """Parse an ISO timestamp into an aware UTC datetime (naive values are treated as UTC)"""
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def to_epoch_ms(value):
+    """Convert a datetime or ISO timestamp into epoch milliseconds"""
+    return int(parse_timestamp(value).timestamp() * 1000)
+
+
+def from_epoch_ms(epoch_ms):
+    """Convert epoch milliseconds into an aware UTC datetime"""
+    return datetime.fromtimestamp(int(epoch_ms) / 1000, tz=timezone.utc)
+
+
+def history_bucket(value):
+    """Return the YYYY-MM-DD day bucket for a datetime or ISO timestamp"""
+    return parse_timestamp(value).strftime('%Y-%m-%d')
+
+
+def reading_key(epoch_ms, suffix=None):
+    """Return the sensor_history key for a reading taken at epoch_ms"""
+    suffix = suffix or generate_push_id(epoch_ms)[8:]
+    return f"{int(epoch_ms)}-{suffix}"
+
+
+def reading_key_ms(key):
+    """Return the epoch milliseconds a sensor_history key was taken at, or None if it isn't one"""
+    epoch_ms = str(key).split('-', 1)[0]
+    return int(epoch_ms) if epoch_ms.isdigit() else None
+
+
+def history_path(device_id, reading, suffix=None):
+    """Return the sensor_history path a reading is stored under"""
+    reading_time = parse_timestamp(reading['timestamp'])
+    return f"{HISTORY_ROOT}/{device_id}/{history_bucket(reading_time)}/{reading_key(to_epoch_ms(reading_time), suffix)}"
+
+
+def history_updates(device_id, reading, suffix=None):
+    """Build the multi-path update that stores a reading in its day bucket"""
+    return {history_path(device_id, reading, suffix): reading}
+
+
+def _bucket_readings(bucket):
+    readings = []
+    for key, reading in (bucket or {}).items():
+        epoch_ms = reading_key_ms(key)
+        if isinstance(reading, dict) and epoch_ms is not None:
+            readings.append((epoch_ms, reading))
+    return readings
+
+
+def has_sensor_history(device_id):
+    """Return True if the device has any readings in the bucketed layout"""
+    return bool(db.reference(f'{HISTORY_ROOT}/{device_id}').get(shallow=True))
+
+
+def fetch_sensor_history(device_id, start_date, end_date):
+    """
+    Return [(epoch_ms, reading)] for a device between start_date and end_date.
+
+    Only the day buckets overlapping the range are read; the first and last
+    buckets are trimmed server-side with order_by_key().start_at().end_at()
+    on the millisecond prefix of the keys.
+    """
+    start = parse_timestamp(start_date)
+    end = parse_timestamp(end_date)
+    if end < start:
+        return []
+
+    start_key = str(to_epoch_ms(start))
+    end_key = str(to_epoch_ms(end)) + KEY_RANGE_END
+    first_day = start.date()
+    last_day = end.date()
+
+    readings = []
+    day = first_day
+    while day <= last_day:
+        bucket_ref = db.reference(f"{HISTORY_ROOT}/{device_id}/{day.strftime('%Y-%m-%d')}")
+        if day == first_day or day == last_day:
+            query = bucket_ref.order_by_key()
+            if day == first_day:
+                query = query.start_at(start_key)
+            if day == last_day:
+                query = query.end_at(end_key)
+            bucket = query.get()
+        else:
+            bucket = bucket_ref.get()
+
+        readings.extend(_bucket_readings(bucket))
+        day += timedelta(days=1)
+
+    readings.sort(key=lambda item: item[0])
+    return readings
+
+
+def fetch_recent_readings(device_id, count):
+    """Return the newest count readings as [(epoch_ms, reading)], oldest first"""
+    days = sorted(db.reference(f'{HISTORY_ROOT}/{device_id}').get(shallow=True) or {}, reverse=True)
+    readings = []
+    for day in days:
+        bucket = (db.reference(f'{HISTORY_ROOT}/{device_id}/{day}')
+                  .order_by_key()
+                  .limit_to_last(count - len(readings))
+                  .get()) or {}
+        readings.extend(_bucket_readings(bucket))
+        if len(readings) >= count:
+            break
+    readings.sort(key=lambda item: item[0])
+    return readings[-count:]
+
+
+def merge_readings(*reading_lists):
+    """
+    Merge [(epoch_ms, reading)] lists into one time-ordered list. Readings a
+    later list has for a millisecond replace the earlier lists' readings for
+    it, while readings sharing a millisecond within one list are all kept.
+    """
+    merged = {}
+    for readings in reading_lists:
+        by_time = {}
+        for epoch_ms, reading in readings:
+            by_time.setdefault(epoch_ms, []).append(reading)
+        merged.update(by_time)
+    return [(epoch_ms, reading) for epoch_ms in sorted(merged) for reading in merged[epoch_ms]]
+
+
+def backfill_device_history(device_id, batch_size=500):
+    """Copy a device's legacy devices/{id}/sensors readings into the bucketed layout"""
+    legacy_readings = db.reference(f'devices/{device_id}/sensors').get() or {}
+    if not isinstance(legacy_readings, dict):
+        return 0
+
+    updates = {}
+    copied = 0
+    for key, reading in legacy_readings.items():
+        if not isinstance(reading, dict) or not reading.get('timestamp'):
+            continue
+        try:
+            # Reusing the push ID's tail keeps a re-run from copying a reading twice
+            updates.update(history_updates(device_id, reading, suffix=key[-12:]))
+        except (ValueError, TypeError):
+            continue
+        copied += 1
+
+        if len(updates) >= batch_size:
+            db.reference().update(updates)
+            updates = {}
+
+    if updates:
+        db.reference().update(updates)
+
+    logger.info(f"Backfilled {copied} sensor readings for device {device_id}")
+    return copied
+
+
+# Chart resolutions (bucket width in milliseconds) and the aggregations
+# HistoricalSensorDataView can apply per bucket
+RESOLUTIONS = {
+    'raw': None,
+    '1m': 60 * 1000,
+    '5m': 5 * 60 * 1000,
+    '1h': 60 * 60 * 1000,
+    '1d': 24 * 60 * 60 * 1000,
+}
+AGGREGATIONS = ('mean', 'min', 'max', 'last')
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def downsample(readings, sensor_types, resolution='raw', agg='mean'):
+    """
+    Bucket time-ordered readings into fixed-width windows with NumPy.
+
+    readings is a list of (epoch_ms, reading) sorted by time. Returns
+    (timestamps, series): an int64 array of bucket start times in epoch ms and
+    a {sensor_type: float64 array} of aggregated values, NaN where a bucket
+    had no value for that sensor. With resolution 'raw' the readings are
+    returned unbucketed.
+    """
+    timestamps = np.fromiter((epoch_ms for epoch_ms, _ in readings), dtype=np.int64, count=len(readings))
+    series = {
+        s_type: np.fromiter((_to_float(reading.get(s_type)) for _, reading in readings),
+                            dtype=np.float64, count=len(readings))
+        for s_type in sensor_types
+    }
+
+    width = RESOLUTIONS[resolution]
+    if not width or not len(timestamps):
+        return timestamps, series
+
+    buckets = timestamps // width
+    # Readings are sorted, so each bucket is a contiguous run starting where the bucket id changes
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    bucket_times = buckets[starts] * width
+
+    aggregated = {}
+    for s_type, values in series.items():
+        present = ~np.isnan(values)
+        if agg == 'mean':
+            sums = np.add.reduceat(np.where(present, values, 0.0), starts)
+            counts = np.add.reduceat(present.astype(np.int64), starts)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                aggregated[s_type] = np.where(counts > 0, sums / counts, np.nan)
+        elif agg == 'min':
+            aggregated[s_type] = np.fmin.reduceat(values, starts)
+        elif agg == 'max':
+            aggregated[s_type] = np.fmax.reduceat(values, starts)
+        elif agg == 'last':
+            positions = np.where(present, np.arange(len(values)), -1)
+            last_positions = np.maximum.reduceat(positions, starts)
+            aggregated[s_type] = np.where(last_positions >= 0, values[last_positions], np.nan)
+        else:
+            raise ValueError(f"Unsupported aggregation: {agg}")
+
+    return bucket_times, aggregated
+
+
+def columnar_series(timestamps, series):
+    """Convert downsample() output into {sensor_type: {timestamps, values}} lists, dropping empty buckets"""
+    result = {}
+    for s_type, values in series.items():
+        present = ~np.isnan(values)
+        result[s_type] = {
+            "timestamps": timestamps[present].tolist(),
+            "values": np.round(values[present], 3).tolist(),
+        }
+    return result
@@ -0,0 +1,140 @@
+from django.conf import settings
+from firebase_admin import db
+from datetime import datetime, timezone
+from .sensor_history import to_epoch_ms, from_epoch_ms
+import numpy as np
+
+# Pre-computed per-bucket sensor aggregates written by tasks/sensor_rollup.py:
+#   sensor_rollups/{device_id}/{hour|day}/{bucket} -> {sensor: {min, max, sum, count, mean}}
+#   sensor_rollup_checkpoints/{device_id}          -> epoch ms up to which readings are rolled up
+#   sensor_rollup_dirty/{device_id}/{YYYY-MM-DD}   -> epoch ms a late reading was written to that day
+# Bucket keys are fixed-width UTC timestamps, so key order is chronological.
+# Readings written with timestamps older than SENSOR_ROLLUP_LAG_SECONDS (batch
+# uploads from devices that were offline) may land behind the checkpoint, so
+# their day is marked dirty and re-rolled up to the checkpoint.
+ROLLUP_ROOT = 'sensor_rollups'
+CHECKPOINT_ROOT = 'sensor_rollup_checkpoints'
+DIRTY_ROOT = 'sensor_rollup_dirty'
+
+GRANULARITIES = {
+    'hour': '%Y-%m-%dT%H',
+    'day': '%Y-%m-%d',
+}
+
+# HistoricalSensorDataView resolutions that can be served from a rollup
+RESOLUTION_GRANULARITIES = {'1h': 'hour', '1d': 'day'}
+ROLLUP_AGGREGATIONS = ('mean', 'min', 'max')
+
+
+def bucket_key(epoch_ms, granularity):
+    """Return the rollup bucket key for a reading time"""
+    return from_epoch_ms(epoch_ms).strftime(GRANULARITIES[granularity])
+
+
+def bucket_start_ms(bucket, granularity):
+    """Return the start of a rollup bucket in epoch ms"""
+    bucket_time = datetime.strptime(bucket, GRANULARITIES[granularity]).replace(tzinfo=timezone.utc)
+    return to_epoch_ms(bucket_time)
+
+
+def aggregate_readings(readings, sensor_types, granularity):
+    """Fold [(epoch_ms, reading)] into {bucket: {sensor: {min, max, sum, count}}}"""
+    buckets = {}
+    for epoch_ms, reading in readings:
+        bucket = buckets.setdefault(bucket_key(epoch_ms, granularity), {})
+        for s_type in sensor_types:
+            try:
+                value = float(reading.get(s_type))
+            except (TypeError, ValueError):
+                continue
+            if np.isnan(value):
+                continue
+            stats = bucket.get(s_type)
+            if stats is None:
+                bucket[s_type] = {'min': value, 'max': value, 'sum': value, 'count': 1}
+            else:
+                stats['min'] = min(stats['min'], value)
+                stats['max'] = max(stats['max'], value)
+                stats['sum'] += value
+                stats['count'] += 1
+    return buckets
+
+
+def merge_stats(existing, new):
+    """Combine two {sensor: stats} rollup entries and refresh the means"""
+    merged = {}
+    for s_type in set(existing or {}) | set(new or {}):
+        a = (existing or {}).get(s_type)
+        b = (new or {}).get(s_type)
+        if not a or not b:
+            stats = dict(a or b)
+        else:
+            stats = {
+                'min': min(a['min'], b['min']),
+                'max': max(a['max'], b['max']),
+                'sum': a['sum'] + b['sum'],
+                'count': a['count'] + b['count'],
+            }
+        stats['mean'] = stats['sum'] / stats['count'] if stats['count'] else None
+        merged[s_type] = stats
+    return merged
+
+
+def get_rollup_checkpoint(device_id):
+    """Return the epoch ms up to which a device's readings are rolled up, or None"""
+    checkpoint = db.reference(f'{CHECKPOINT_ROOT}/{device_id}').get()
+    return int(checkpoint) if checkpoint else None
+
+
+def late_reading_updates(device_id, reading, now=None):
+    """Mark the reading's day dirty if it is old enough to land behind the rollup checkpoint"""
+    now_ms = to_epoch_ms(now or datetime.now(timezone.utc))
+    lag_ms = getattr(settings, 'SENSOR_ROLLUP_LAG_SECONDS', 120) * 1000
+    try:
+        reading_ms = to_epoch_ms(reading['timestamp'])
+    except (KeyError, ValueError, TypeError, AttributeError):
+        return {}
+    if reading_ms > now_ms - lag_ms:
+        return {}
+    return {f"{DIRTY_ROOT}/{device_id}/{bucket_key(reading_ms, 'day')}": now_ms}
+
+
+def get_dirty_days(device_id):
+    """Return {YYYY-MM-DD: marked_at_ms} for the days that need to be rolled up again"""
+    return db.reference(f'{DIRTY_ROOT}/{device_id}').get() or {}
+
+
+def fetch_rollups(device_id, granularity, start_ms, end_ms):
+    """Return {bucket: {sensor: stats}} for the rollup buckets overlapping [start_ms, end_ms]"""
+    if end_ms < start_ms:
+        return {}
+    rollups = (
+        db.reference(f'{ROLLUP_ROOT}/{device_id}/{granularity}')
+        .order_by_key()
+        .start_at(bucket_key(start_ms, granularity))
+        .end_at(bucket_key(end_ms, granularity))
+        .get()
+    )
+    return dict(rollups or {})
+
+
+def rollup_series(rollups, sensor_types, granularity, agg='mean'):
+    """
+    Convert {bucket: {sensor: stats}} into the (timestamps, series) arrays
+    returned by sensor_history.downsample().
+    """
+    buckets = sorted(rollups)
+    timestamps = np.array([bucket_start_ms(bucket, granularity) for bucket in buckets], dtype=np.int64)
+    series = {}
+    for s_type in sensor_types:
+        values = []
+        for bucket in buckets:
+            stats = (rollups[bucket] or {}).get(s_type)
+            if not stats or not stats.get('count'):
+                values.append(np.nan)
+            elif agg == 'mean':
+                values.append(stats['sum'] / stats['count'])
+            else:
+                values.append(stats[agg])
+        series[s_type] = np.array(values, dtype=np.float64)
+    return timestamps, series
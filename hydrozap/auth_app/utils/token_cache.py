@@ -0,0 +1,155 @@
+from collections import OrderedDict
+from django.conf import settings
+from firebase_admin import auth
+import hashlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ID_TOKEN_CERT_URI = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+
+
+def token_hash(token):
+    """Key tokens by digest so raw credentials are never kept in memory as keys"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of verified Firebase ID tokens.
+
+    A token's decoded claims are kept until the token's exp, so a client
+    polling with the same token pays for the signature check once. With a
+    revocation_interval the token is re-verified with check_revoked at most
+    that often; 0 never checks for revocation.
+    """
+
+    def __init__(self, max_size=1024, revocation_interval=0):
+        self.max_size = max_size
+        self.revocation_interval = revocation_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _verify(self, token):
+        return auth.verify_id_token(token, check_revoked=self.revocation_interval > 0)
+
+    def verify(self, token):
+        """Return the decoded claims of a token, raising like auth.verify_id_token if it is invalid"""
+        key = token_hash(token)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now >= entry[0].get('exp', 0):
+                    # Expired tokens go back to firebase_admin, which raises the usual error
+                    del self._entries[key]
+                    entry = None
+                else:
+                    self._entries.move_to_end(key)
+
+        if entry is not None:
+            claims, checked_at = entry
+            if not self.revocation_interval or now - checked_at < self.revocation_interval:
+                return claims
+
+        try:
+            claims = self._verify(token)
+        except Exception:
+            self.invalidate(token)
+            raise
+
+        with self._lock:
+            self._entries[key] = (claims, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return claims
+
+    def invalidate(self, token):
+        with self._lock:
+            self._entries.pop(token_hash(token), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class CertificateRefresher:
+    """
+    Keep the Google certificates used to verify ID tokens fresh in the
+    background, so no request stalls on the certificate fetch when the
+    cached copy expires.
+    """
+
+    def __init__(self, interval=3600):
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+        self._unsupported = False
+
+    def _cert_request(self):
+        """
+        Return the cached-session request firebase_admin verifies tokens with.
+        It is internal to firebase_admin, so None is returned when this
+        version doesn't expose it the way we expect.
+        """
+        get_client = getattr(auth, '_get_client', None)
+        if not callable(get_client):
+            return None
+        verifier = getattr(get_client(None), '_token_verifier', None)
+        request = getattr(verifier, 'request', None)
+        return request if callable(request) else None
+
+    def refresh(self):
+        """Re-fetch the certificates through firebase_admin's cache-control session"""
+        if self._unsupported:
+            return False
+        try:
+            request = self._cert_request()
+            if request is None:
+                # Log once and stop trying, verify_id_token keeps fetching certificates itself
+                self._unsupported = True
+                logger.error("This firebase_admin version does not expose its token verifier's "
+                             "certificate session, background certificate refresh is disabled")
+                return False
+            # no-cache skips the cached copy but stores the new response for verify_id_token
+            response = request(url=ID_TOKEN_CERT_URI, headers={'Cache-Control': 'no-cache'})
+            if response.status != 200:
+                logger.warning(f"Certificate refresh returned HTTP {response.status}")
+                return False
+            return True
+        except Exception as e:
+            logger.warning(f"Error refreshing ID token certificates: {str(e)}")
+            return False
+
+    def start(self):
+        """Start the refresh thread once per process; an interval of 0 disables it"""
+        if not self.interval:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='token-cert-refresher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._unsupported:
+            self.refresh()
+            time.sleep(self.interval)
+
+
+verified_token_cache = VerifiedTokenCache(
+    max_size=getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 1024),
+    revocation_interval=getattr(settings, 'AUTH_REVOCATION_CHECK_SECONDS', 0),
+)
+
+certificate_refresher = CertificateRefresher(
+    interval=getattr(settings, 'AUTH_CERT_REFRESH_SECONDS', 3600),
+)
+
+
+def verify_id_token(token):
+    """Verify a Firebase ID token through the process-wide verified token cache"""
+    return verified_token_cache.verify(token)
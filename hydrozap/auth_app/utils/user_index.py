@@ -0,0 +1,172 @@
+from firebase_admin import db, exceptions
+from .firebase_loader import FirebaseLoader
+import hashlib
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Lookup indexes maintained alongside users so a login or feedback form can
+# resolve a user without downloading every user record:
+#   usernames/{username_key}  -> uid
+#   emails/{sha256 of email}  -> uid
+INDEX_ROOTS = ['usernames', 'emails']
+
+_INVALID_KEY_CHARS = re.compile(r'[.$#\[\]/%]')
+
+
+def username_key(username):
+    """Percent-encode the characters Firebase keys can't hold, keeping distinct usernames distinct"""
+    return _INVALID_KEY_CHARS.sub(lambda match: f'%{ord(match.group()):02X}', str(username))
+
+
+def email_key(email):
+    """Hash an email so addresses aren't readable from the index keys"""
+    return hashlib.sha256(str(email).strip().lower().encode()).hexdigest()
+
+
+def _index_entries(uid, user_data):
+    """Return the index paths and values for a single user record"""
+    if not user_data:
+        return {}
+    entries = {}
+    if user_data.get('username'):
+        entries[f"usernames/{username_key(user_data['username'])}"] = uid
+    if user_data.get('email'):
+        entries[f"emails/{email_key(user_data['email'])}"] = uid
+    return entries
+
+
+def user_index_updates(uid, user_data=None, previous_data=None):
+    """Build multi-path updates that move a user's index entries from previous_data to user_data"""
+    updates = {path: None for path in _index_entries(uid, previous_data)}
+    updates.update(_index_entries(uid, user_data))
+    return updates
+
+
+def _find_unindexed_username(username):
+    """
+    Look a username up in the users tree for users written before the index
+    existed, and index it so the next lookup is a single read. Needs
+    ".indexOn": ["username"] on users in the database rules.
+    """
+    try:
+        matches = db.reference('users').order_by_child('username').equal_to(username).limit_to_first(1).get() or {}
+    except exceptions.FirebaseError as e:
+        logger.warning(f"Querying users by username failed (is .indexOn set in the database rules?): {str(e)}")
+        return None
+    if not matches:
+        return None
+    uid = next(iter(matches))
+    if not claim_username(uid, username):
+        # Claimed by another user meanwhile, the index entry wins
+        return db.reference(f'usernames/{username_key(username)}').get()
+    logger.info(f"Indexed username of legacy user {uid}")
+    return uid
+
+
+def get_uid_by_username(username):
+    """Return the uid a username belongs to, or None"""
+    if not username:
+        return None
+    uid = db.reference(f'usernames/{username_key(username)}').get()
+    if uid is None:
+        uid = _find_unindexed_username(username)
+    return uid
+
+
+def get_uid_by_email(email):
+    """Return the uid an email belongs to, or None"""
+    if not email:
+        return None
+    return db.reference(f'emails/{email_key(email)}').get()
+
+
+def is_username_taken(username, uid=None):
+    """Check whether a username belongs to a user other than uid"""
+    owner = get_uid_by_username(username)
+    return owner is not None and owner != uid
+
+
+def claim_username(uid, username):
+    """
+    Atomically reserve a username for uid. Returns False if another user
+    already holds it, so two users can never end up with the same username.
+    """
+    def reserve(owner):
+        return uid if owner in (None, uid) else owner
+    return db.reference(f'usernames/{username_key(username)}').transaction(reserve) == uid
+
+
+def release_username(uid, username):
+    """Give up a username reservation, leaving it alone if another user holds it"""
+    def release(owner):
+        return None if owner == uid else owner
+    db.reference(f'usernames/{username_key(username)}').transaction(release)
+
+
+def claim_unique_username(uid, base, max_attempts=100):
+    """Reserve base, or the first of base1, base2, ... that is free, and return the username claimed"""
+    base = str(base or 'user')
+    for attempt in range(max_attempts):
+        username = base if attempt == 0 else f'{base}{attempt}'
+        if claim_username(uid, username):
+            return username
+    # Every numbered variant is taken, fall back to one derived from the uid
+    username = f'{base}_{uid[:8]}'
+    if claim_username(uid, username):
+        return username
+    raise ValueError(f"Could not find a free username for {base}")
+
+
+def save_user(uid, user_data, previous_data=None, replace=False):
+    """
+    Write a user record together with its index entries in one multi-path update.
+
+    With replace=False only the given fields are written, matching the
+    semantics of user_ref.update(). Index entries held by other users (legacy
+    duplicate usernames) are never taken over or removed, so a new username
+    should be reserved with claim_username() first.
+    """
+    if replace:
+        updates = {f'users/{uid}': user_data}
+        merged_data = user_data
+    else:
+        updates = {f'users/{uid}/{field}': value for field, value in user_data.items()}
+        merged_data = {**(previous_data or {}), **user_data}
+
+    index_updates = user_index_updates(uid, merged_data, previous_data)
+    owners = FirebaseLoader().load_many(list(index_updates))
+    for path, value in index_updates.items():
+        owner = owners[path]
+        if owner is not None and owner != uid:
+            logger.warning(f"Index entry {path} belongs to user {owner}, not changing it for user {uid}")
+            continue
+        if value is None and owner is None:
+            continue
+        updates[path] = value
+
+    db.reference().update(updates)
+    return merged_data
+
+
+def rebuild_user_indexes():
+    """Rebuild the username and email indexes from the users tree and return the number of users indexed"""
+    users = db.reference('users').get() or {}
+    roots = {root: {} for root in INDEX_ROOTS}
+    count = 0
+    for uid, user_data in users.items():
+        if not isinstance(user_data, dict):
+            continue
+        for path, value in _index_entries(uid, user_data).items():
+            root, key = path.split('/')
+            if key in roots[root]:
+                # The old login scan matched the first user with the username
+                logger.warning(f"Duplicate {root} entry for users {roots[root][key]} and {uid}, keeping the first")
+                continue
+            roots[root][key] = value
+        count += 1
+
+    db.reference().update({root: tree or None for root, tree in roots.items()})
+    logger.info(f"Rebuilt user indexes for {count} users")
+    return count
@@ -0,0 +1,98 @@
+from firebase_admin import db
+from .grow_index import count_user_grows
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Materialized per-user dashboard counters, moved by the device, alert and
+# grow write paths in the same multi-path update as the change they count:
+#   user_stats/{user_id} -> {devices, alerts_unread, alerts_total, active_grows}
+# The deltas are server-side increments, so concurrent writers don't need a
+# transaction. An increment on a user without counters leaves a partial node,
+# which get_user_stats() rebuilds from the source data.
+STATS_ROOT = 'user_stats'
+STAT_FIELDS = ('devices', 'alerts_unread', 'alerts_total', 'active_grows')
+
+
+def is_unread(alert):
+    """Return True if an alert record counts towards alerts_unread"""
+    return bool(alert) and alert.get('status', 'unread') == 'unread'
+
+
+def user_stats_updates(user_id, **deltas):
+    """Build multi-path updates that add deltas (e.g. devices=1, alerts_unread=-1) to a user's counters"""
+    if not user_id:
+        return {}
+    return {f'{STATS_ROOT}/{user_id}/{field}': {'.sv': {'increment': delta}}
+            for field, delta in deltas.items() if delta}
+
+
+def alert_stats_updates(user_id, previous_alert=None, alert=None):
+    """Build multi-path updates that move the alert counters from previous_alert to alert (None for create/delete)"""
+    return user_stats_updates(
+        user_id,
+        alerts_total=int(bool(alert)) - int(bool(previous_alert)),
+        alerts_unread=int(is_unread(alert)) - int(is_unread(previous_alert)),
+    )
+
+
+def compute_user_stats(user_id):
+    """Count a user's devices, alerts and active grows from the source data"""
+    devices = db.reference('devices').order_by_child('user_id').equal_to(user_id).get() or {}
+    alerts = db.reference(f'alerts/{user_id}').get() or {}
+    return {
+        'devices': len(devices),
+        'alerts_unread': sum(1 for alert in alerts.values() if isinstance(alert, dict) and is_unread(alert)),
+        'alerts_total': len(alerts),
+        'active_grows': count_user_grows(user_id, status='active'),
+    }
+
+
+def rebuild_user_stats(user_id):
+    """Recompute and store a user's counters"""
+    stats = compute_user_stats(user_id)
+    db.reference(f'{STATS_ROOT}/{user_id}').set(stats)
+    return stats
+
+
+def get_user_stats(user_id):
+    """Return a user's counters, building them on first use"""
+    stats = db.reference(f'{STATS_ROOT}/{user_id}').get()
+    if not isinstance(stats, dict) or any(field not in stats for field in STAT_FIELDS):
+        return rebuild_user_stats(user_id)
+    # Increments are unclamped, rebuild_user_stats reconciles any drift
+    return {field: max(0, stats[field] or 0) for field in STAT_FIELDS}
+
+
+def rebuild_all_user_stats():
+    """Recompute every user's counters from devices, alerts and the grow index"""
+    stats = {}
+
+    def entry(user_id):
+        return stats.setdefault(user_id, {field: 0 for field in STAT_FIELDS})
+
+    for user_id in (db.reference('users').get(shallow=True) or {}):
+        entry(user_id)
+
+    for device in (db.reference('devices').get() or {}).values():
+        if isinstance(device, dict) and device.get('user_id'):
+            entry(device['user_id'])['devices'] += 1
+
+    for user_id, alerts in (db.reference('alerts').get() or {}).items():
+        if not isinstance(alerts, dict):
+            continue
+        entry(user_id)['alerts_total'] = len(alerts)
+        entry(user_id)['alerts_unread'] = sum(
+            1 for alert in alerts.values() if isinstance(alert, dict) and is_unread(alert)
+        )
+
+    for user_id in (db.reference('grows_by_user').get(shallow=True) or {}):
+        entry(user_id)['active_grows'] = count_user_grows(user_id, status='active')
+
+    if stats:
+        db.reference(STATS_ROOT).set(stats)
+    else:
+        db.reference(STATS_ROOT).delete()
+
+    logger.info(f"Rebuilt user stats for {len(stats)} users")
+    return len(stats)
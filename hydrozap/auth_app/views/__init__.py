@@ -10,11 +10,13 @@ from .auth_views import (
 from .device_views import (
     RegisteredDeviceView,
     DeviceView,
-    DeviceCountView
+    DeviceCountView,
+    DeviceInsightsView
 )
 
 from .sensor_views import (
     SensorDataView,
+    SensorBatchView,
     ActuatorDataView,
     HistoricalSensorDataView,
     DosingLogDataView
@@ -43,7 +45,8 @@ from .analytics_views import (
     ColorIndexPredictorView,
     LeafCountPredictorView,
     CropSuggestionView,
-    EnvironmentRecommendationView
+    EnvironmentRecommendationView,
+    BatchPredictionView
 )
 
 from .notification_views import (
@@ -79,9 +82,11 @@ __all__ = [
     'RegisteredDeviceView',
     'DeviceView',
     'DeviceCountView',
+    'DeviceInsightsView',
     
     # Sensor views
     'SensorDataView',
+    'SensorBatchView',
     'ActuatorDataView',
     'HistoricalSensorDataView',
     'DosingLogDataView',
@@ -108,6 +113,7 @@ __all__ = [
     'LeafCountPredictorView',
     'CropSuggestionView',
     'EnvironmentRecommendationView',
+    'BatchPredictionView',
     
     # Notification views
     'FcmTokenView',
@@ -7,6 +7,14 @@ import logging
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 from .notification_utils import send_fcm_notification, should_send_notification, notify_alert_update, user_prefers_notification
+from ..utils.user_stats import get_user_stats
+from ..utils.alert_index import save_alert, delete_alert, get_alert_page, iter_alerts
+from ..utils.push_id import generate_push_id
+from ..utils.device_latest import get_latest_reading, latest_path
+from ..utils.firebase_loader import get_request_loader
+from django.conf import settings
+from django.http import StreamingHttpResponse
+import json
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +39,26 @@ def get_suggested_action(alert_type, message=None):
     else:
         return 'Check your system and address the issue according to the alert message.'
 
+def store_alert(user_id, alert_data):
+    """Save a new alert under a push ID and return the ID"""
+    # Push IDs sort by creation time and don't collide like per-second keys did
+    alert_id = generate_push_id()
+    save_alert(user_id, alert_id, alert_data)
+    return alert_id
+
+
+def stream_alerts(user_id, status=None, alert_type=None):
+    """Yield a JSON document of the matching alerts, newest first, a chunk of alerts at a time"""
+    yield '{"alerts": ['
+    separator = ''
+    for alert_id, alert in iter_alerts(user_id, status, alert_type):
+        alert['alert_id'] = alert_id
+        alert['suggested_action'] = get_suggested_action(alert.get('alert_type', 'sensor'), alert.get('message', ''))
+        yield separator + json.dumps(alert, default=str)
+        separator = ','
+    yield ']}'
+
+
 class AlertView(APIView):
     def get(self, request, user_id=None, alert_id=None):
         """Retrieve alerts based on the URL pattern"""
@@ -48,18 +76,41 @@ class AlertView(APIView):
             return Response({"alert": alert}, status=status.HTTP_200_OK)
             
         elif user_id:
-            # Get all alerts for a user
-            alerts_ref = db.reference(f'alerts/{user_id}')
-            alerts = alerts_ref.get()
+            limit = request.query_params.get('limit')
+            before = request.query_params.get('before')
+            status_filter = request.query_params.get('status')
+            type_filter = request.query_params.get('alert_type')
+            response_data = {}
+
+            if request.query_params.get('export', '').lower() == 'true':
+                # Stream the full (filtered) history instead of building it in memory
+                response = StreamingHttpResponse(stream_alerts(user_id, status_filter, type_filter),
+                                                 content_type='application/json')
+                response['Content-Disposition'] = f'attachment; filename="alerts_{user_id}.json"'
+                return response
+
+            # Cursor pagination, newest first: ?limit=50 then ?limit=50&before=<next_before>.
+            # Without a limit the first ALERT_PAGE_DEFAULT_SIZE alerts are returned;
+            # the full history is only available through ?export=true
+            max_limit = getattr(settings, 'ALERT_PAGE_MAX_SIZE', 500)
+            try:
+                limit = int(limit or getattr(settings, 'ALERT_PAGE_DEFAULT_SIZE', 50))
+            except ValueError:
+                return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+            if limit < 1 or limit > max_limit:
+                return Response({"error": f"limit must be between 1 and {max_limit}"}, status=status.HTTP_400_BAD_REQUEST)
+
+            alerts, next_before = get_alert_page(user_id, limit, before, status_filter, type_filter)
+            response_data["next_before"] = next_before
 
             if not alerts:
-                return Response({"alerts": []}, status=status.HTTP_200_OK)
+                return Response(dict(response_data, alerts=[]), status=status.HTTP_200_OK)
             # Add suggested action to each alert
             for alert in alerts.values():
                 alert_type = alert.get('alert_type', 'sensor')
                 message = alert.get('message', '')
                 alert['suggested_action'] = get_suggested_action(alert_type, message)
-            return Response({"alerts": alerts}, status=status.HTTP_200_OK)
+            return Response(dict(response_data, alerts=alerts), status=status.HTTP_200_OK)
             
         else:
             # Invalid URL pattern
@@ -77,24 +128,19 @@ class AlertView(APIView):
         if not user_id or not device_id or not message:
             return Response({"error": "user_id, device_id, and message are required"}, status=400)
 
+        # The latest readings, device name and notification preferences are
+        # independent reads, so fetch them all at once
+        loader = get_request_loader(request)
+        loader.prime(latest_path(device_id), f'devices/{device_id}/device_name',
+                     f'users/{user_id}/notification_preferences')
+
         # Fetch the latest sensor data for the device
         latest_sensor_data = None
         try:
-            sensors_ref = db.reference(f'devices/{device_id}/sensors')
-            sensors = sensors_ref.get()
-            if sensors and isinstance(sensors, dict):
-                # Find the latest reading by timestamp
-                latest = None
-                for reading in sensors.values():
-                    if isinstance(reading, dict) and 'timestamp' in reading:
-                        if not latest or reading['timestamp'] > latest['timestamp']:
-                            latest = reading
-                latest_sensor_data = latest
+            latest_sensor_data = get_latest_reading(device_id, loader) or None
         except Exception:
             latest_sensor_data = None
 
-        # Create a unique alert ID
-        alert_id = f"alert_{int(datetime.now().timestamp())}"
         alert_data = {
             "device_id": device_id,
             "message": message,
@@ -108,7 +154,7 @@ class AlertView(APIView):
         try:
             # Always create the alert in the database regardless of notification preferences
             # This ensures the alert history is complete even if notifications are disabled
-            db.reference(f'alerts/{user_id}/{alert_id}').set(alert_data)
+            alert_id = store_alert(user_id, alert_data)
             
             # Determine notification title based on alert type
             title = "\ud83c\udf31 HydroZap Alert"
@@ -128,8 +174,7 @@ class AlertView(APIView):
                     specific_alert_type = 'ph'  # Use generic 'ph' for unspecified pH alerts
                 # Get user preferences to check pH setting
                 try:
-                    user_prefs_ref = db.reference(f'users/{user_id}/notification_preferences')
-                    user_prefs = user_prefs_ref.get() or {}
+                    user_prefs = loader.load(f'users/{user_id}/notification_preferences') or {}
                     ph_enabled = user_prefs.get('ph_level_alerts_enabled')
                 except Exception:
                     pass
@@ -152,10 +197,7 @@ class AlertView(APIView):
             # Get device name to include in notification data
             device_name = None
             try:
-                device_ref = db.reference(f'devices/{device_id}')
-                device_data = device_ref.get()
-                if device_data:
-                    device_name = device_data.get('device_name', f"Device {device_id}")
+                device_name = loader.load(f'devices/{device_id}/device_name') or f"Device {device_id}"
             except Exception:
                 pass
             
@@ -171,12 +213,10 @@ class AlertView(APIView):
             
             # Update the alert in the database with the specific alert type if it was changed
             if specific_alert_type != alert_type:
-                db.reference(f'alerts/{user_id}/{alert_id}').update({"alert_type": specific_alert_type})
-                # Also update our local copy
-                alert_data["alert_type"] = specific_alert_type
+                alert_data = save_alert(user_id, alert_id, {"alert_type": specific_alert_type}, alert_data)
             
             # Check if we should send FCM notification based on user preferences
-            if priority == 'high' or user_prefers_notification(user_id, specific_alert_type):
+            if priority == 'high' or user_prefers_notification(user_id, specific_alert_type, loader):
                 # Send FCM notification (high priority alerts bypass user preferences)
                 fcm_result = send_fcm_notification(user_id, title, message, notification_data)
             else:
@@ -225,10 +265,7 @@ class AlertView(APIView):
             return Response({"error": "No valid update fields provided"}, status=status.HTTP_400_BAD_REQUEST)
         
         # Update the alert
-        alert_ref.update(updates)
-        
-        # Get the updated alert
-        updated_alert = alert_ref.get()
+        updated_alert = save_alert(user_id, alert_id, updates, alert)
         
         return Response({
             "message": "Alert updated successfully",
@@ -238,22 +275,19 @@ class AlertView(APIView):
     def delete(self, request, user_id, alert_id):
         """Delete a specific alert"""
         alert_ref = db.reference(f'alerts/{user_id}/{alert_id}')
-        if not alert_ref.get():
+        alert = alert_ref.get()
+        if not alert:
             return Response({"error": "Alert not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        alert_ref.delete()
+        delete_alert(user_id, alert_id, alert)
         return Response({"message": "Alert deleted successfully"}, status=status.HTTP_200_OK)
 
 class AlertCountView(APIView):
     def get(self, request, user_id):
         """Get count of alerts for a user"""
         try:
-            # Get alerts for the user
-            alerts_ref = db.reference(f'alerts/{user_id}')
-            alerts = alerts_ref.get()
-            
-            # Count alerts
-            alert_count = len(alerts) if alerts else 0
+            # Count alerts from the user's materialized counters
+            alert_count = get_user_stats(user_id)['alerts_total']
             
             return Response({"alert_count": alert_count}, status=status.HTTP_200_OK)
         except Exception as e:
@@ -2,32 +2,15 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 import pandas as pd
-import joblib
 import os
 import numpy as np
 import logging
 from django.conf import settings
-from ..utils.crop_suggester import suggest_crops_by_env
+from ..utils.crop_suggester import suggest_crops_by_env, get_crop_matrix, builtin_crop_matrix, environment_row
+from ..utils.model_registry import model_registry, environment_table
 
 logger = logging.getLogger(__name__)
 
-# Get the path to the model directory
-MODEL_DIR = os.path.join(os.path.dirname(__file__), '..', 'model')
-
-# Load each model
-color_index_model = joblib.load(os.path.join(MODEL_DIR, 'color_index_randomForest.pkl'))
-tipburn_model = joblib.load(os.path.join(MODEL_DIR, 'tipburn_prediction_model.pkl'))
-tipburn_label_encoder = joblib.load(os.path.join(MODEL_DIR, 'tipburn_label_encoder.pkl'))
-leaf_count_model = joblib.load(os.path.join(MODEL_DIR, 'leaf_count_model.pkl'))
-suggested_crop_model = joblib.load(os.path.join(MODEL_DIR, 'suggested_crop_predictor.pkl'))
-label_encoder = joblib.load(os.path.join(MODEL_DIR, 'label_encoder.pkl'))
-model_temp = joblib.load(os.path.join(MODEL_DIR, 'temperature_model.pkl'))
-model_hum = joblib.load(os.path.join(MODEL_DIR, 'humidity_model.pkl'))
-model_ec = joblib.load(os.path.join(MODEL_DIR, 'ec_model.pkl'))
-model_ph = joblib.load(os.path.join(MODEL_DIR, 'ph_model.pkl'))
-crop_encoder = joblib.load(os.path.join(MODEL_DIR, 'crop_encoder.pkl'))
-stage_encoder = joblib.load(os.path.join(MODEL_DIR, 'stage_encoder.pkl'))
-
 class TipburnPredictorView(APIView):
     def post(self, request):
         try:
@@ -46,7 +29,7 @@ class TipburnPredictorView(APIView):
                 return Response({"error": "Missing input values"}, status=400)
 
             # Encode the crop type using the label encoder
-            encoded_crop_type = tipburn_label_encoder.transform([feature_values[4]])[0]  # Transform crop type
+            encoded_crop_type = model_registry['tipburn_label_encoder'].transform([feature_values[4]])[0]  # Transform crop type
             feature_values[4] = encoded_crop_type
 
             # Define the feature names (as used during training)
@@ -55,14 +38,17 @@ class TipburnPredictorView(APIView):
             # Prepare the input DataFrame for prediction
             df = pd.DataFrame([feature_values], columns=feature_names)
 
+            tipburn_model = model_registry['tipburn']
+
             # Get predicted probabilities
-            prediction_proba = tipburn_model.predict_proba(df)
+            prediction_proba = tipburn_model.predict_proba(df)[0]
 
-            # Get the predicted class (0 or 1)
-            predicted_class = tipburn_model.predict(df)[0]
+            # Get the predicted class (0 or 1) from the probabilities instead of a second predict()
+            best = int(np.argmax(prediction_proba))
+            predicted_class = tipburn_model.classes_[best]
 
             # Get the confidence level (probability of the predicted class)
-            confidence_level = prediction_proba[0][predicted_class]
+            confidence_level = float(prediction_proba[best])
 
             # Convert the prediction to a boolean (True for tipburn, False for no tipburn)
             tipburn_absent = False if predicted_class == 1 else True
@@ -95,7 +81,7 @@ class ColorIndexPredictorView(APIView):
             feature_names = ["EC", "pH", "Growth_Days", "Temperature"]
             df = pd.DataFrame([feature_values], columns=feature_names)
 
-            prediction = color_index_model.predict(df)[0]
+            prediction = model_registry['color_index'].predict(df)[0]
             return Response({"leaf_color_index": float(prediction)}, status=200)
 
         except Exception as e:
@@ -119,7 +105,7 @@ class LeafCountPredictorView(APIView):
             feature_names = ["Crop_Type", "Growth_Days", "Temperature","pH"]
             df = pd.DataFrame([feature_values], columns=feature_names)
 
-            prediction = leaf_count_model.predict(df)[0]
+            prediction = model_registry['leaf_count'].predict(df)[0]
             return Response({"leaf_count": int(prediction)}, status=200)
 
         except Exception as e:
@@ -127,10 +113,33 @@ class LeafCountPredictorView(APIView):
 
 class CropSuggestionView(APIView):
     def post(self, request):
+        """
+        Suggest crops for one environment or a batch of them.
+
+        Accepts temperature, humidity and optionally ph and ec, or
+        {"rows": [{...}, ...]} to rank every crop for many environments in one
+        pass. Crop ranges come from the plant profiles visible to user_id
+        (optionally for one growth stage), or the built-in table with
+        source=builtin. include_partial also returns crops that only match
+        some parameters, ranked by distance to their ranges.
+        """
         try:
+            data = request.data
+            top_n = int(data.get('top_n', 4))
+            include_partial = str(data.get('include_partial', False)).lower() == 'true'
+
+            if data.get('source') == 'builtin':
+                matrix = builtin_crop_matrix
+            else:
+                matrix = get_crop_matrix(user_id=data.get('user_id'), stage=data.get('stage'))
+
+            rows = data.get('rows')
+            if rows is not None:
+                return self.rank_batch(matrix, rows, top_n, include_partial)
+
             # Get environmental parameters from request
-            temperature = request.data.get('temperature')
-            humidity = request.data.get('humidity')
+            temperature = data.get('temperature')
+            humidity = data.get('humidity')
             
             # Validate inputs
             if temperature is None or humidity is None:
@@ -142,9 +151,14 @@ class CropSuggestionView(APIView):
             # Convert to appropriate types
             temperature = float(temperature)
             humidity = float(humidity)
+            ph = float(data['ph']) if data.get('ph') is not None else None
+            ec = float(data['ec']) if data.get('ec') is not None else None
             
             # Get crop suggestions using the crop_suggester utility
-            suggestions = suggest_crops_by_env(temperature, humidity)
+            if include_partial:
+                suggestions = matrix.rank([environment_row(temperature, humidity, ph, ec)], top_n, full_match_only=False)[0]
+            else:
+                suggestions = suggest_crops_by_env(temperature, humidity, top_n, ph=ph, ec=ec, matrix=matrix)
             
             if isinstance(suggestions, str):
                 # If it's a string, it's an error message
@@ -185,6 +199,39 @@ class CropSuggestionView(APIView):
                 {"error": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+    def rank_batch(self, matrix, rows, top_n, include_partial):
+        """Rank crops for every environment row with one matrix evaluation"""
+        if not isinstance(rows, list) or not rows:
+            return Response({"error": "rows must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_rows = getattr(settings, 'PREDICTION_BATCH_MAX_ROWS', 5000)
+        if len(rows) > max_rows:
+            return Response({"error": f"At most {max_rows} rows per request"}, status=status.HTTP_400_BAD_REQUEST)
+
+        environments = []
+        errors = []
+        valid_indexes = []
+        for index, row in enumerate(rows):
+            try:
+                environment = environment_row(row.get('temperature'), row.get('humidity'), row.get('ph'), row.get('ec'))
+            except (AttributeError, TypeError, ValueError):
+                errors.append({"index": index, "error": "Invalid input values"})
+                continue
+            if all(np.isnan(environment)):
+                errors.append({"index": index, "error": "At least one of temperature, humidity, ph or ec is required"})
+                continue
+            environments.append(environment)
+            valid_indexes.append(index)
+
+        results = [None] * len(rows)
+        if environments:
+            ranked = matrix.rank(environments, top_n, full_match_only=not include_partial)
+            for index, suggestions in zip(valid_indexes, ranked):
+                results[index] = suggestions
+
+        return Response({"results": results, "errors": errors}, status=status.HTTP_200_OK)
+
 class EnvironmentRecommendationView(APIView):
     def post(self, request):
         try:
@@ -201,19 +248,15 @@ class EnvironmentRecommendationView(APIView):
             crop_type = feature_values[0]
             growth_stage = feature_values[1]
 
-            try:
-                crop_encoded = crop_encoder.transform([crop_type])[0]
-                stage_encoded = stage_encoder.transform([growth_stage])[0]
-            except ValueError:
+            # Served from the precomputed crop x stage table instead of running four forests
+            environment = environment_table.lookup(crop_type, growth_stage)
+            if environment is None:
                 return Response({"error": "Invalid crop_type or growth_stage"}, status=400)
 
-            input_features = np.array([[crop_encoded, stage_encoded]])
-
-            # Run predictions
-            temperature = round(model_temp.predict(input_features)[0], 2)
-            humidity = round(model_hum.predict(input_features)[0], 2)
-            ec = round(model_ec.predict(input_features)[0], 2)
-            ph = round(model_ph.predict(input_features)[0], 2)
+            temperature = environment['temperature']
+            humidity = environment['humidity']
+            ec = environment['ec']
+            ph = environment['ph']
 
             # Add recommendation message
             recommendation_message = (
@@ -232,4 +275,149 @@ class EnvironmentRecommendationView(APIView):
             }, status=200)
 
         except Exception as e:
-            return Response({"error": str(e)}, status=500)
\ No newline at end of file
+            return Response({"error": str(e)}, status=500)
+
+
+def _tipburn_batch(rows):
+    """Vectorized tipburn prediction for validated rows"""
+    encoded = model_registry['tipburn_label_encoder'].transform([row['crop_type'] for row in rows])
+    df = pd.DataFrame({
+        "temperature": [row['temperature'] for row in rows],
+        "humidity": [row['humidity'] for row in rows],
+        "ec": [row['ec'] for row in rows],
+        "ph": [row['ph'] for row in rows],
+        "crop_type_encoded": encoded,
+    })
+    tipburn_model = model_registry['tipburn']
+
+    # predict_proba once, the predicted class is the most probable one
+    proba = tipburn_model.predict_proba(df)
+    best = proba.argmax(axis=1)
+    predicted = tipburn_model.classes_[best]
+    return {
+        "tipburn_absent": (predicted != 1).tolist(),
+        "confidence_level": proba[np.arange(len(rows)), best].tolist(),
+    }
+
+
+def _color_index_batch(rows):
+    """Vectorized leaf color index prediction for validated rows"""
+    df = pd.DataFrame({
+        "EC": [row['ec'] for row in rows],
+        "pH": [row['ph'] for row in rows],
+        "Growth_Days": [row['growth_days'] for row in rows],
+        "Temperature": [row['temperature'] for row in rows],
+    })
+    return {"leaf_color_index": model_registry['color_index'].predict(df).astype(float).tolist()}
+
+
+def _leaf_count_batch(rows):
+    """Vectorized leaf count prediction for validated rows"""
+    df = pd.DataFrame({
+        "Crop_Type": [row['crop_type'] for row in rows],
+        "Growth_Days": [row['growth_days'] for row in rows],
+        "Temperature": [row['temperature'] for row in rows],
+        "pH": [row['ph'] for row in rows],
+    })
+    return {"leaf_count": model_registry['leaf_count'].predict(df).astype(int).tolist()}
+
+
+def _environment_batch(rows):
+    """Environment recommendations for validated rows from the precomputed table"""
+    table = environment_table.get_table()
+    recommendations = [table[row['crop_type']][row['growth_stage']] for row in rows]
+    return {
+        parameter: [recommendation[parameter] for recommendation in recommendations]
+        for parameter in environment_table.PARAMETERS
+    }
+
+
+# Batch model name -> (numeric features, categorical features with the encoder that must know them, predictor)
+BATCH_MODELS = {
+    'tipburn': (['temperature', 'humidity', 'ec', 'ph'], {'crop_type': 'tipburn_label_encoder'}, _tipburn_batch),
+    'color-index': (['ec', 'ph', 'growth_days', 'temperature'], {}, _color_index_batch),
+    'leaf-count': (['growth_days', 'temperature', 'ph'], {'crop_type': None}, _leaf_count_batch),
+    'environment-recommendation': ([], {'crop_type': 'crop_encoder', 'growth_stage': 'stage_encoder'}, _environment_batch),
+}
+
+
+class BatchPredictionView(APIView):
+    def post(self, request, model_name):
+        """
+        Run one vectorized prediction over many feature rows.
+
+        Request body: {"rows": [{feature: value, ...}, ...]}. Results are
+        returned as arrays aligned with the input rows; rows that fail
+        validation are null in every array and listed under "errors".
+        """
+        if model_name not in BATCH_MODELS:
+            return Response(
+                {"error": f"Unknown model. Use one of: {', '.join(BATCH_MODELS)}"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        rows = request.data.get('rows')
+        if not isinstance(rows, list) or not rows:
+            return Response({"error": "rows must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_rows = getattr(settings, 'PREDICTION_BATCH_MAX_ROWS', 5000)
+        if len(rows) > max_rows:
+            return Response({"error": f"At most {max_rows} rows per request"}, status=status.HTTP_400_BAD_REQUEST)
+
+        numeric_features, categorical_features, predictor = BATCH_MODELS[model_name]
+
+        try:
+            # Labels each encoder was fitted on, so unknown values only reject their own row
+            known_labels = {
+                feature: set(model_registry[encoder].classes_) if encoder else None
+                for feature, encoder in categorical_features.items()
+            }
+
+            valid_rows = []
+            valid_indexes = []
+            errors = []
+            for index, row in enumerate(rows):
+                if not isinstance(row, dict):
+                    errors.append({"index": index, "error": "Row must be an object"})
+                    continue
+
+                missing = [feature for feature in numeric_features + list(categorical_features) if row.get(feature) is None]
+                if missing:
+                    errors.append({"index": index, "error": f"Missing input values: {', '.join(missing)}"})
+                    continue
+
+                try:
+                    clean_row = {feature: float(row[feature]) for feature in numeric_features}
+                except (TypeError, ValueError):
+                    errors.append({"index": index, "error": "Numeric input values are invalid"})
+                    continue
+
+                invalid = [feature for feature, labels in known_labels.items()
+                           if not isinstance(row[feature], str) or (labels is not None and row[feature] not in labels)]
+                if invalid:
+                    errors.append({"index": index, "error": f"Invalid {', '.join(invalid)}"})
+                    continue
+
+                clean_row.update({feature: row[feature] for feature in categorical_features})
+                valid_rows.append(clean_row)
+                valid_indexes.append(index)
+
+            # Scatter the predictions back onto the input positions
+            predictions = {}
+            if valid_rows:
+                for output, values in predictor(valid_rows).items():
+                    column = [None] * len(rows)
+                    for index, value in zip(valid_indexes, values):
+                        column[index] = value
+                    predictions[output] = column
+
+            return Response({
+                "model": model_name,
+                "count": len(rows),
+                "predicted": len(valid_rows),
+                "predictions": predictions,
+                "errors": errors
+            }, status=200)
+
+        except Exception as e:
+            return Response({"error": str(e)}, status=500)
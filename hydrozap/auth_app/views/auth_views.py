@@ -7,6 +7,15 @@ from datetime import datetime
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.conf import settings
+from ..utils.token_cache import verify_id_token
+from ..utils.user_index import (
+    claim_unique_username,
+    claim_username,
+    get_uid_by_username,
+    is_username_taken,
+    release_username,
+    save_user,
+)
 
 class RegisterView(APIView):
     def post(self, request):
@@ -18,6 +27,9 @@ class RegisterView(APIView):
         phone = data.get('phone')
 
         try:
+            if username and is_username_taken(username):
+                return Response({"error": "Username is already taken"}, status=status.HTTP_400_BAD_REQUEST)
+
             # Create user with email and password
             user = auth.create_user(
                 email=email,
@@ -25,6 +37,12 @@ class RegisterView(APIView):
                 display_name=name
             )
 
+            # Reserve the username atomically; another registration may have
+            # taken it since the check above, in which case undo the signup
+            if username and not claim_username(user.uid, username):
+                auth.delete_user(user.uid)
+                return Response({"error": "Username is already taken"}, status=status.HTTP_400_BAD_REQUEST)
+
             # Format phone number for PH (+63)
             formatted_phone = f"+63{phone}" if phone else ""
 
@@ -36,8 +54,8 @@ class RegisterView(APIView):
                 "phone": formatted_phone
             }
 
-            # Store data under the user's UID
-            db.reference(f'users/{user.uid}').set(user_data)
+            # Store data under the user's UID, together with the username and email indexes
+            save_user(user.uid, user_data, replace=True)
 
             # ✅ Initialize onboarding status
             initialize_onboarding_status(user.uid)
@@ -72,13 +90,9 @@ class LoginView(APIView):
                 # Login using email
                 email = identifier
             else:
-                # Search for user by username in the database
-                users_ref = db.reference('users').get()
-                email = None
-                for uid, user_data in users_ref.items():
-                    if user_data.get('username') == identifier:
-                        email = user_data.get('email')
-                        break
+                # Resolve the username through the usernames index, indexing legacy users on a miss
+                uid = get_uid_by_username(identifier)
+                email = db.reference(f'users/{uid}/email').get() if uid else None
 
                 if not email:
                     return Response({"error": "Invalid username"}, status=status.HTTP_400_BAD_REQUEST)
@@ -123,8 +137,8 @@ class GoogleLoginView(APIView):
             return Response({"error": "ID token is required"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            # 1. Verify token
-            decoded_token = auth.verify_id_token(id_token)
+            # 1. Verify token (cached, the client sends this token on its next requests)
+            decoded_token = verify_id_token(id_token)
             uid = decoded_token['uid']
             email = decoded_token.get('email')
             name = decoded_token.get('name')
@@ -138,10 +152,10 @@ class GoogleLoginView(APIView):
                 user_data = {
                     "name": name,
                     "email": email,
-                    "username": email.split("@")[0],
+                    "username": claim_unique_username(uid, email.split("@")[0]),
                     "phone": ""
                 }
-                user_ref.set(user_data)
+                save_user(uid, user_data, replace=True)
 
             return Response({
                 "message": "Google login success",
@@ -261,13 +275,22 @@ class UserProfileView(APIView):
             return Response({"error": "No valid fields to update"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            # Update Firebase Auth user fields
-            if auth_updates:
-                auth.update_user(uid, **auth_updates)
-
-            # Update Realtime Database user fields
-            if updates:
-                db.reference(f'users/{uid}').update(updates)
+            new_username = updates.get('username')
+            if new_username and not claim_username(uid, new_username):
+                return Response({"error": "Username is already taken"}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                # Update Firebase Auth user fields
+                if auth_updates:
+                    auth.update_user(uid, **auth_updates)
+
+                # Update Realtime Database user fields; the old username's index entry is released
+                if updates:
+                    save_user(uid, updates, {"username": db.reference(f'users/{uid}/username').get()})
+            except Exception:
+                if new_username and db.reference(f'users/{uid}/username').get() != new_username:
+                    release_username(uid, new_username)
+                raise
 
             return Response({"message": "User profile updated successfully"}, status=status.HTTP_200_OK)
 
@@ -7,6 +7,7 @@ import logging
 from .plant_views import GrowCountView
 from .device_views import DeviceCountView
 from .alert_views import AlertCountView
+from ..utils.user_stats import get_user_stats
 
 logger = logging.getLogger(__name__)
 
@@ -19,35 +20,14 @@ class DashboardCountsView(APIView):
             return Response({"error": "User ID is required"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            # Get device count
-            devices_ref = db.reference('devices')
-            devices = devices_ref.order_by_child('user_id').equal_to(user_id).get()
-            device_count = len(devices) if devices else 0
-            
-            # Get alert count
-            alerts_ref = db.reference(f'alerts/{user_id}')
-            alerts = alerts_ref.get()
-            alert_count = len(alerts) if alerts else 0
-            
-            # Get grow count (only active grows)
-            grows_ref = db.reference('grows')
-            grows = grows_ref.get()  # Get all grows
-            
-            if grows:
-                # Filter grows by user_id and status 'active'
-                filtered_grows = {
-                    grow_id: grow_data 
-                    for grow_id, grow_data in grows.items() 
-                    if grow_data.get('user_id') == user_id and grow_data.get('status') == 'active'
-                }
-                grow_count = len(filtered_grows)
-            else:
-                grow_count = 0
+            # All counts come from the user's materialized counters
+            stats = get_user_stats(user_id)
             
             return Response({
-                "device_count": device_count,
-                "alert_count": alert_count,
-                "grow_count": grow_count
+                "device_count": stats['devices'],
+                "alert_count": stats['alerts_total'],
+                "unread_alert_count": stats['alerts_unread'],
+                "grow_count": stats['active_grows']
             }, status=status.HTTP_200_OK)
             
         except Exception as e:
@@ -4,6 +4,10 @@ from rest_framework import status
 from firebase_admin import db
 from datetime import datetime
 import logging
+from ..utils.grow_index import get_device_grow_ids, get_grows, get_active_device_grow
+from ..utils.sensor_cache import invalidate_device
+from ..utils.user_stats import user_stats_updates
+from ..utils.device_latest import with_sensor_compat
 
 logger = logging.getLogger(__name__)
 
@@ -128,18 +132,14 @@ class DeviceView(APIView):
             if not device_data:
                 return Response({"error": "Device not found"}, status=status.HTTP_404_NOT_FOUND)
                 
-            # Check if device is assigned to any active grow
-            grows_ref = db.reference('grows')
-            existing_grows = grows_ref.get() or {}
-            
-            # Find any grows using this device
+            # Find any grows using this device from the device index
+            existing_grows = get_grows(get_device_grow_ids(device_id))
             active_grows = []
             for grow_id, grow_data in existing_grows.items():
-                if grow_data.get('device_id') == device_id:
-                    active_grows.append({
-                        "grow_id": grow_id,
-                        "grow_name": grow_data.get("grow_name", "Unnamed Grow")
-                    })
+                active_grows.append({
+                    "grow_id": grow_id,
+                    "grow_name": grow_data.get("grow_name", "Unnamed Grow")
+                })
             
             # If the device is actively used in grows, return conflict
             if active_grows:
@@ -163,6 +163,7 @@ class DeviceView(APIView):
             if not devices:
                 return Response({"devices": {}, "device_count": 0}, status=status.HTTP_200_OK)
             device_count = len(devices)
+            devices = {device_id: with_sensor_compat(device) for device_id, device in devices.items()}
 
             return Response({"devices": devices, "device_count": device_count}, status=status.HTTP_200_OK)
 
@@ -174,7 +175,7 @@ class DeviceView(APIView):
             if not device_data:
                 return Response({"error": "Device not found"}, status=status.HTTP_404_NOT_FOUND)
 
-            return Response({"device_data": device_data}, status=status.HTTP_200_OK)
+            return Response({"device_data": with_sensor_compat(device_data)}, status=status.HTTP_200_OK)
 
         # If no parameters provided, return all devices
         else:
@@ -185,6 +186,7 @@ class DeviceView(APIView):
                 return Response({"devices": {}, "device_count": 0}, status=status.HTTP_200_OK)
                 
             device_count = len(devices)
+            devices = {device_id: with_sensor_compat(device) for device_id, device in devices.items()}
             return Response({"devices": devices, "device_count": device_count}, status=status.HTTP_200_OK)
 
     def post(self, request):
@@ -250,7 +252,7 @@ class DeviceView(APIView):
             "water_volume_liters": water_volume_liters,
             "auto_dose_enabled": data.get('auto_dose_enabled', False),
             "actuators": actuator_data,
-            "sensors": {
+            "latest": {
                 "ec": sensor_data.get("ec", 0.0),
                 "tds": sensor_data.get("tds", 0.0),
                 "humidity": sensor_data.get("humidity", 0),
@@ -261,8 +263,9 @@ class DeviceView(APIView):
             }
         }
 
-        # Save device data in Firebase
-        db.reference(f'devices/{device_id}').set(device_data)
+        # Save device data in Firebase, counted in the same update
+        db.reference().update({f'devices/{device_id}': device_data, **user_stats_updates(user_id, devices=1)})
+        invalidate_device(device_id)
 
         # Update the registered device status to in_use
         registered_device_ref = db.reference(f'registered_devices/{device_id}')
@@ -351,18 +354,14 @@ class DeviceView(APIView):
         if not device_data:
             return Response({"error": "Device not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        # Check if device is assigned to any active grow
-        grows_ref = db.reference('grows')
-        existing_grows = grows_ref.get() or {}
-        
-        # Find any grows using this device
+        # Find any grows using this device from the device index
+        existing_grows = get_grows(get_device_grow_ids(device_id))
         active_grows = []
         for grow_id, grow_data in existing_grows.items():
-            if grow_data.get('device_id') == device_id:
-                active_grows.append({
-                    "grow_id": grow_id,
-                    "grow_name": grow_data.get("grow_name", "Unnamed Grow")
-                })
+            active_grows.append({
+                "grow_id": grow_id,
+                "grow_name": grow_data.get("grow_name", "Unnamed Grow")
+            })
         
         # If the device is actively used in grows, prevent deletion
         if active_grows:
@@ -376,7 +375,8 @@ class DeviceView(APIView):
         user_id = device_data.get('user_id')
 
         # Device is not assigned to any grow, safe to delete
-        device_ref.delete()
+        db.reference().update({f'devices/{device_id}': None, **user_stats_updates(user_id, devices=-1)})
+        invalidate_device(device_id)
 
         # After deleting, notify WebSocket clients
         if user_id:
@@ -394,15 +394,9 @@ class DeviceView(APIView):
             return Response({"error": "Device not found"}, status=status.HTTP_404_NOT_FOUND)
 
         # Get active grow for this device
-        grows_ref = db.reference('grows')
-        grows = grows_ref.get() or {}
-        
-        active_grow = None
-        for grow_id, grow_data in grows.items():
-            if grow_data.get('device_id') == device_id and grow_data.get('status') == 'active':
-                active_grow = grow_data
-                active_grow['grow_id'] = grow_id
-                break
+        active_grow_id, active_grow = get_active_device_grow(device_id)
+        if active_grow:
+            active_grow['grow_id'] = active_grow_id
 
         if not active_grow:
             return Response({"error": "No active grow found for this device"}, status=status.HTTP_404_NOT_FOUND)
@@ -510,4 +504,16 @@ class DeviceCountView(APIView):
             
             return Response({"device_count": device_count}, status=status.HTTP_200_OK)
         except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST) 
\ No newline at end of file
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST) 
+
+
+class DeviceInsightsView(APIView):
+    def get(self, request, device_id):
+        """Get the precomputed crop suitability and tipburn risk for a device"""
+        try:
+            insights = db.reference(f'device_insights/{device_id}').get()
+            if not insights:
+                return Response({"error": "No insights available for this device yet"}, status=status.HTTP_404_NOT_FOUND)
+            return Response({"device_id": device_id, "insights": insights}, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -6,6 +6,7 @@ from datetime import datetime
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
 import logging
+from ..utils.user_index import get_uid_by_email
 
 logger = logging.getLogger(__name__)
 
@@ -41,11 +42,9 @@ class FeedbackView(APIView):
             
             # Add user ID if we can determine it from the email
             try:
-                users_ref = db.reference('users').get() or {}
-                for uid, user_data in users_ref.items():
-                    if user_data.get('email') == email:
-                        feedback_data['user_id'] = uid
-                        break
+                uid = get_uid_by_email(email)
+                if uid:
+                    feedback_data['user_id'] = uid
             except Exception as e:
                 print(f"Error finding user by email: {e}")
             
@@ -1,66 +1,240 @@
+from django.conf import settings
+from django.core.cache import cache
 from firebase_admin import messaging
 from firebase_admin import db
+from firebase_admin import exceptions
 import logging
+import queue
+import threading
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from ..utils.firebase_loader import load_path
+from ..utils.sensor_cache import has_shared_cache, runs_multiple_workers
 
 logger = logging.getLogger(__name__)
 
-def send_fcm_notification(user_id, title, body, data=None):
-    """Send FCM notification to a user's devices"""
+# FCM accepts at most 500 tokens per multicast message
+FCM_MULTICAST_LIMIT = 500
+
+# A token's last_used is refreshed after a successful send at most this often
+LAST_USED_REFRESH = timedelta(days=1)
+
+
+def _fcm_tokens_key(user_id):
+    return f'fcm_tokens:{user_id}'
+
+
+def _fcm_tokens_ttl():
+    """
+    Seconds to cache a user's FCM tokens. invalidate_fcm_tokens only reaches
+    other workers through a shared cache, so with several workers on the
+    per-process cache (see check_shared_cache) tokens are cached only briefly.
+    """
+    ttl = getattr(settings, 'FCM_TOKEN_CACHE_TTL', 300)
+    if runs_multiple_workers() and not has_shared_cache():
+        ttl = min(ttl, getattr(settings, 'FCM_TOKEN_LOCAL_CACHE_TTL', 30))
+    return ttl
+
+
+def _parse_time(value):
+    """Parse an ISO timestamp into an aware UTC datetime; naive values were written in local time"""
+    if not value:
+        return None
     try:
-        logger.info(f"Attempting to send FCM notification for user_id: {user_id}")
-        # Get user's FCM tokens
-        user_ref = db.reference(f'users/{user_id}/fcm_tokens')
-        tokens = user_ref.get()
-        
-        if not tokens:
-            logger.warning(f"No FCM tokens found for user {user_id}")
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).astimezone(timezone.utc)
+    except ValueError:
+        return None
+
+
+def _is_stale(token_info, cutoff):
+    """Return True if a token hasn't been registered, refreshed or used since cutoff"""
+    last_used = _parse_time(token_info.get('last_used') or token_info.get('created_at'))
+    return last_used is not None and last_used < cutoff
+
+
+def get_user_fcm_tokens(user_id):
+    """
+    Return [(token_key, token, last_used)] for a user's active FCM tokens,
+    cached for _fcm_tokens_ttl() seconds. Tokens neither refreshed nor
+    successfully sent to for FCM_TOKEN_STALE_DAYS are marked inactive and skipped.
+    """
+    token_list = cache.get(_fcm_tokens_key(user_id))
+    if token_list is None:
+        tokens = db.reference(f'users/{user_id}/fcm_tokens').get() or {}
+        cutoff = datetime.now(timezone.utc) - timedelta(days=getattr(settings, 'FCM_TOKEN_STALE_DAYS', 60))
+
+        token_list = []
+        stale = {}
+        for token_key, token_info in tokens.items():
+            if not isinstance(token_info, dict) or not token_info.get('token'):
+                continue
+            if token_info.get('is_active') is False:
+                continue
+            if _is_stale(token_info, cutoff):
+                stale[f'users/{user_id}/fcm_tokens/{token_key}/is_active'] = False
+                continue
+            token_list.append((token_key, str(token_info['token']),
+                               token_info.get('last_used') or token_info.get('created_at')))
+
+        if stale:
+            db.reference().update(stale)
+            logger.info(f"Marked {len(stale)} stale FCM tokens inactive for user_id: {user_id}")
+
+        cache.set(_fcm_tokens_key(user_id), token_list, _fcm_tokens_ttl())
+    return token_list
+
+
+def touch_fcm_tokens(user_id, token_list, delivered_keys):
+    """
+    Record last_used for tokens a notification was delivered to, so tokens
+    that keep working never go stale. Each token is written at most once per
+    LAST_USED_REFRESH, all in one multi-path update.
+    """
+    now = datetime.now(timezone.utc)
+    due = [token_key for token_key, _, last_used in token_list if token_key in delivered_keys
+           and (_parse_time(last_used) is None or now - _parse_time(last_used) >= LAST_USED_REFRESH)]
+    if not due:
+        return
+    db.reference().update({f'users/{user_id}/fcm_tokens/{token_key}/last_used': now.isoformat() for token_key in due})
+    invalidate_fcm_tokens(user_id)
+
+
+def prune_fcm_tokens(user_id, token_keys):
+    """Delete dead tokens from a user's FCM tokens in one multi-path update"""
+    if not token_keys:
+        return
+    db.reference().update({f'users/{user_id}/fcm_tokens/{token_key}': None for token_key in token_keys})
+    invalidate_fcm_tokens(user_id)
+    logger.info(f"Pruned {len(token_keys)} invalid FCM tokens for user_id: {user_id}")
+
+
+def _dead_token_keys(batch, responses):
+    """Return the keys of tokens FCM reported as unregistered or invalid"""
+    dead = []
+    invalid = []
+    for (token_key, _, _), response in zip(batch, responses):
+        if response.success or response.exception is None:
+            continue
+        if isinstance(response.exception, messaging.UnregisteredError):
+            dead.append(token_key)
+        elif getattr(response.exception, 'code', None) == exceptions.INVALID_ARGUMENT:
+            invalid.append(token_key)
+
+    # INVALID_ARGUMENT for every token points at the message itself rather
+    # than the tokens, so only prune those when some tokens were accepted
+    if invalid and len(invalid) < len(batch):
+        dead.extend(invalid)
+    return dead
+
+
+def invalidate_fcm_tokens(user_id):
+    """
+    Forget a user's cached FCM tokens after one is registered or removed.
+    Other workers only see this through a shared cache (CACHE_REDIS_URL);
+    without one they keep their copy for up to _fcm_tokens_ttl() seconds.
+    """
+    if user_id:
+        cache.delete(_fcm_tokens_key(user_id))
+
+
+class FcmDispatcher:
+    """
+    Sends FCM notifications from a small pool of background workers.
+
+    Request handlers only enqueue; workers look up the user's cached active
+    tokens and send up to 500 tokens per send_each_for_multicast call over
+    the SDK's pooled HTTP session, deleting tokens FCM reports as dead. When
+    the bounded queue is full new notifications are dropped rather than
+    blocking the caller.
+    """
+
+    def __init__(self, workers=4, queue_size=1000):
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _ensure_workers(self):
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name='fcm-dispatcher', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def enqueue(self, user_id, title, body, data=None):
+        """Queue a notification for a user, returning False if the queue is full"""
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait((user_id, title, body, data))
+            return True
+        except queue.Full:
+            logger.error(f"FCM dispatch queue is full, dropping notification for user_id: {user_id}")
             return False
-            
-        # Extract the 'token' field from each token dict
-        token_list = [
-            str(token_info['token'])
-            for token_info in tokens.values()
-            if isinstance(token_info, dict) and token_info.get('token')
-        ]
-        
+
+    def _run(self):
+        while True:
+            user_id, title, body, data = self._queue.get()
+            try:
+                self.deliver(user_id, title, body, data)
+            except Exception as e:
+                logger.error(f"Error sending FCM notification for user_id {user_id}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def deliver(self, user_id, title, body, data=None):
+        """Send a notification to all of a user's active devices now and prune dead tokens"""
+        token_list = get_user_fcm_tokens(user_id)
         if not token_list:
             logger.warning(f"No valid FCM tokens found for user {user_id}")
-            return False
-        
-        if len(token_list) == 1:
-            # Send to a single token
-            message = messaging.Message(
-                data=data or {},
-                notification=messaging.Notification(
-                    title=title,
-                    body=body
-                ),
-                token=token_list[0]
-            )
-            response = messaging.send(message)
-            logger.info(f"Sent FCM notification with message ID: {response} for user_id: {user_id}")
-            return True
-        else:
-            # Send to multiple tokens
+            return {"success_count": 0, "failure_count": 0, "pruned_count": 0}
+
+        # FCM data payloads only carry string values
+        payload = {str(key): str(value) for key, value in (data or {}).items() if value is not None}
+
+        success_count = 0
+        failure_count = 0
+        dead_keys = []
+        delivered_keys = set()
+        for start in range(0, len(token_list), FCM_MULTICAST_LIMIT):
+            batch = token_list[start:start + FCM_MULTICAST_LIMIT]
             message = messaging.MulticastMessage(
-                data=data or {},
+                data=payload,
                 notification=messaging.Notification(
                     title=title,
                     body=body
                 ),
-                tokens=token_list
+                tokens=[token for _, token, _ in batch]
             )
-            response = messaging.send_multicast(message)
-            if hasattr(response, 'failure_count') and response.failure_count > 0:
+            response = messaging.send_each_for_multicast(message)
+            success_count += response.success_count
+            failure_count += response.failure_count
+            delivered_keys.update(token_key for (token_key, _, _), result in zip(batch, response.responses)
+                                  if result.success)
+            if response.failure_count > 0:
                 logger.warning(f"Some notifications failed to send: {response.failure_count} failures for user_id: {user_id}")
-            return getattr(response, 'success_count', 0) > 0
-    
-    except Exception as e:
-        logger.error(f"Error sending FCM notification for user_id {user_id}: {str(e)}")
+                dead_keys.extend(_dead_token_keys(batch, response.responses))
+
+        prune_fcm_tokens(user_id, dead_keys)
+        touch_fcm_tokens(user_id, token_list, delivered_keys)
+
+        logger.info(f"Sent FCM notification to {success_count} devices for user_id: {user_id}")
+        return {"success_count": success_count, "failure_count": failure_count, "pruned_count": len(dead_keys)}
+
+
+fcm_dispatcher = FcmDispatcher(
+    workers=getattr(settings, 'FCM_DISPATCH_WORKERS', 4),
+    queue_size=getattr(settings, 'FCM_DISPATCH_QUEUE_SIZE', 1000),
+)
+
+
+def send_fcm_notification(user_id, title, body, data=None):
+    """Queue an FCM notification to a user's devices, returning True once queued"""
+    if not user_id:
         return False
+    logger.info(f"Queueing FCM notification for user_id: {user_id}")
+    return fcm_dispatcher.enqueue(user_id, title, body, data)
 
 def should_send_notification(alert_type, current_value, threshold_value):
     """Determine if a notification should be sent based on alert type and values"""
@@ -92,11 +266,10 @@ def notify_alert_update(user_id, alert_id, message, alert_type):
     except Exception as e:
         logger.error(f"Error sending WebSocket notification: {str(e)}")
 
-def user_prefers_notification(user_id, alert_type):
+def user_prefers_notification(user_id, alert_type, loader=None):
     """Check if the user has enabled notifications for the given alert type."""
     try:
-        user_prefs_ref = db.reference(f'users/{user_id}/notification_preferences')
-        user_prefs = user_prefs_ref.get() or {}
+        user_prefs = load_path(f'users/{user_id}/notification_preferences', loader) or {}
         # Map alert_type to the correct preference key
         pref_key = {
             'ph': 'ph_level_alerts_enabled',
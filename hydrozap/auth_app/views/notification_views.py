@@ -1,11 +1,11 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from firebase_admin import db, messaging
+from firebase_admin import db
 from datetime import datetime
 import hashlib
 import logging
-from .sensor_views import send_fcm_notification
+from .notification_utils import invalidate_fcm_tokens, fcm_dispatcher
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +35,7 @@ class FcmTokenView(APIView):
             }
             
             tokens_ref.child(token_hash).set(token_data)
+            invalidate_fcm_tokens(user_id)
             
             return Response({
                 "message": "FCM token registered successfully",
@@ -70,6 +71,7 @@ class FcmTokenView(APIView):
             
             # Delete the token
             token_ref.delete()
+            invalidate_fcm_tokens(user_id)
             
             return Response({
                 "message": "FCM token unregistered successfully",
@@ -96,8 +98,8 @@ class TestFcmNotificationView(APIView):
                           status=status.HTTP_400_BAD_REQUEST)
             
         try:
-            # Send test notification
-            result = send_fcm_notification(user_id, title, body, payload)
+            # Send test notification right away instead of queueing it
+            result = fcm_dispatcher.deliver(user_id, title, body, payload)
             
             return Response({
                 "message": "Test notification sent",
@@ -150,62 +152,3 @@ class NotificationPreferencesView(APIView):
             
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-def send_fcm_notification(user_id, title, body, data=None):
-    """Send FCM notification to a user"""
-    try:
-        # Get user's FCM tokens
-        tokens_ref = db.reference(f'users/{user_id}/fcm_tokens')
-        tokens = tokens_ref.get()
-        
-        if not tokens:
-            return {"error": "No FCM tokens found for user"}
-        
-        # Get active tokens
-        active_tokens = [
-            token_data['token'] 
-            for token_data in tokens.values() 
-            if token_data.get('is_active', False)
-        ]
-        
-        if not active_tokens:
-            return {"error": "No active FCM tokens found for user"}
-        
-        # Prepare message
-        message = messaging.MulticastMessage(
-            data=data or {},
-            notification=messaging.Notification(
-                title=title,
-                body=body
-            ),
-            tokens=active_tokens
-        )
-        
-        # Send message
-        response = messaging.send_multicast(message)
-        
-        # Update token status based on response
-        for idx, result in enumerate(response.responses):
-            token = active_tokens[idx]
-            token_hash = hashlib.md5(token.encode()).hexdigest()
-            
-            if result.success:
-                # Update last used timestamp
-                tokens_ref.child(token_hash).update({
-                    "last_used": datetime.now().isoformat()
-                })
-            else:
-                # Mark token as inactive if it failed
-                tokens_ref.child(token_hash).update({
-                    "is_active": False,
-                    "error": str(result.error)
-                })
-        
-        return {
-            "success_count": response.success_count,
-            "failure_count": response.failure_count
-        }
-        
-    except Exception as e:
-        print(f"Error sending FCM notification: {str(e)}")
-        return {"error": str(e)} 
\ No newline at end of file
@@ -1,6 +1,7 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from django.conf import settings
 from firebase_admin import db
 from datetime import datetime, timedelta
 import logging
@@ -8,9 +9,22 @@ from .device_views import notify_device_update
 from .alert_views import notify_alert_update
 import uuid
 from .notification_utils import send_fcm_notification
+from ..utils.grow_index import (
+    save_grow,
+    delete_grow,
+    get_device_grow_ids,
+    get_profile_grow_ids,
+    count_user_grows,
+)
+from ..utils.crop_suggester import invalidate_crop_matrix
+from ..utils.firebase_loader import get_request_loader
+from ..utils.harvest_index import get_harvest_log_page, save_harvest_log
+from ..utils.push_id import generate_push_id
+from ..utils.leaderboard import ALL_PERIODS, add_leaderboard_entry, build_leaderboard_entry, get_leaderboard_page
 import io
 import csv
 import json
+import re
 logger = logging.getLogger(__name__)
 
 class PlantProfileView(APIView):
@@ -73,6 +87,7 @@ class PlantProfileView(APIView):
         # Save plant profile data with user_id
         data['mode'] = data.get('mode', 'simple')  # Add mode field with default "simple"
         plant_profiles_ref.set(data)
+        invalidate_crop_matrix()
 
         return Response({"message": "Plant profile added successfully"}, status=status.HTTP_201_CREATED)
 
@@ -83,6 +98,7 @@ class PlantProfileView(APIView):
             return Response({"error": "Plant profile not found"}, status=status.HTTP_404_NOT_FOUND)
 
         plant_profiles_ref.delete()
+        invalidate_crop_matrix()
         return Response({"message": "Plant profile deleted successfully"}, status=status.HTTP_200_OK)
 
     def patch(self, request, identifier):
@@ -112,6 +128,7 @@ class PlantProfileView(APIView):
 
         # Update the profile
         plant_profiles_ref.update(updated_data)
+        invalidate_crop_matrix()
 
         # Get the updated profile
         updated_profile = plant_profiles_ref.get()
@@ -190,6 +207,7 @@ class PlantProfileCSVUploadView(APIView):
 
             # Save to Firebase
             plant_ref.set(row)
+            invalidate_crop_matrix()
             success_count += 1
 
         return Response({
@@ -461,24 +479,20 @@ class GrowView(APIView):
         if not device_id:
             return Response({"error": "Device ID is required"}, status=400)
 
-        # Check if device is already assigned to an active grow
-        grows_ref = db.reference('grows')
-        existing_grows = grows_ref.get() or {}
-        
         # Check if the device is already assigned to any active grow
-        for existing_grow_id, grow_data in existing_grows.items():
-            if grow_data.get('device_id') == device_id and grow_data.get('status') == 'active':
-                return Response({
-                    "error": "Device is already assigned to an active grow",
-                    "device_id": device_id,
-                    "grow_id": existing_grow_id
-                }, status=status.HTTP_409_CONFLICT)  # 409 Conflict is appropriate here
+        active_grow_ids = list(get_device_grow_ids(device_id, status='active'))
+        if active_grow_ids:
+            return Response({
+                "error": "Device is already assigned to an active grow",
+                "device_id": device_id,
+                "grow_id": active_grow_ids[0]
+            }, status=status.HTTP_409_CONFLICT)  # 409 Conflict is appropriate here
 
         # Simplify grow data with necessary fields only
-            grow_data = {
+        grow_data = {
             "user_id": data.get("user_id"),
             "grow_name": data.get("grow_name"),
-                "device_id": device_id,
+            "device_id": device_id,
             "profile_id": data.get("profile_id"),  # Link to grow profile
             "start_date": data.get("start_date", None),  # Optional if you want
             "status": "active"  # Explicitly set status to active
@@ -499,9 +513,8 @@ class GrowView(APIView):
             if user_id:
                 notify_device_update(user_id)
 
-        # Save the grow record to Firebase
-        grow_ref = db.reference(f'grows/{grow_id}')
-        grow_ref.set(grow_data)
+        # Save the grow record and its index entries to Firebase
+        save_grow(grow_id, grow_data, replace=True)
             
         return Response({"message": "Grow record added successfully"}, status=status.HTTP_201_CREATED)
 
@@ -542,21 +555,17 @@ class GrowView(APIView):
         # Check if trying to update device_id
         new_device_id = data.get("device_id")
         if new_device_id and new_device_id != existing_data.get("device_id"):
-            # Check if device is already assigned to another grow
-            grows_ref = db.reference('grows')
-            all_grows = grows_ref.get() or {}
-            
-            for existing_grow_id, grow_data in all_grows.items():
-                # Skip the current grow being updated
-                if existing_grow_id == grow_id:
-                    continue
-                    
-                if grow_data.get('device_id') == new_device_id:
-                    return Response({
-                        "error": "Device is already assigned to an active grow",
-                        "device_id": new_device_id,
-                        "grow_id": existing_grow_id
-                    }, status=status.HTTP_409_CONFLICT)
+            # Check if device is already assigned to another grow (skipping the one being updated)
+            other_grow_ids = [
+                existing_grow_id for existing_grow_id in get_device_grow_ids(new_device_id)
+                if existing_grow_id != grow_id
+            ]
+            if other_grow_ids:
+                return Response({
+                    "error": "Device is already assigned to an active grow",
+                    "device_id": new_device_id,
+                    "grow_id": other_grow_ids[0]
+                }, status=status.HTTP_409_CONFLICT)
 
         # Update grow data with relevant fields
         updated_data = {
@@ -587,8 +596,8 @@ class GrowView(APIView):
                         "last_updated": datetime.now().isoformat()
                     })
 
-        # Update the record in Firebase
-        grow_ref.update(updated_data)
+        # Update the record and its index entries in Firebase
+        save_grow(grow_id, updated_data, existing_data)
 
         # After updating, notify WebSocket clients
         user_id = data.get('user_id')
@@ -625,7 +634,7 @@ class GrowView(APIView):
         user_id = existing_data.get('user_id')
 
         # Grow is harvested or has a harvest date, safe to delete
-        grow_ref.delete()
+        delete_grow(grow_id, existing_data)
 
         # After deleting, notify WebSocket clients
         if user_id:
@@ -655,7 +664,7 @@ class HarvestLogView(APIView):
             if missing:
                 return Response({"error": f"Missing required fields: {', '.join(missing)}"}, status=400)
 
-            log_id = str(uuid.uuid4())
+            log_id = generate_push_id()
 
             log_data = {
                 "device_id": device_id,
@@ -668,35 +677,37 @@ class HarvestLogView(APIView):
                 "remarks": remarks
             }
 
-            db.reference(f"harvest_logs/{log_id}").set(log_data)
+            # Fetch the grow and device while the log is written
+            loader = get_request_loader(request)
+            loader.prime(f'grows/{grow_id}' if grow_id else None, f'devices/{device_id}')
+
+            save_harvest_log(log_id, log_data)
 
             # Mark the grow as harvested if grow_id is provided
+            grow_data = None
+            device_data = None
             if grow_id:
-                grow_ref = db.reference(f'grows/{grow_id}')
-                grow_data = grow_ref.get()
+                grow_data = loader.load(f'grows/{grow_id}')
                 
                 if grow_data:
                     # Get the profile ID from the grow data
                     profile_id = grow_data.get('profile_id')
+                    if profile_id:
+                        # Needed for the leaderboard entry below
+                        loader.prime(f'grow_profiles/{profile_id}')
                     
                     # Update the grow with harvested status and harvest date
-                    grow_ref.update({
+                    save_grow(grow_id, {
                         "status": "harvested",
                         "harvest_date": harvest_date,
-                    })
+                    }, grow_data)
                     
                     # Update the grow profile status if profile_id exists
                     if profile_id:
-                        # Check if any other active grows are using this profile
-                        grows_ref = db.reference('grows')
-                        all_grows = grows_ref.get() or {}
-                        
-                        # Count active grows using this profile
+                        # Count other active grows using this profile
                         active_grows_count = sum(
-                            1 for g in all_grows.values()
-                            if g.get('profile_id') == profile_id 
-                            and g.get('status') == 'active'
-                            and g.get('grow_id') != grow_id  # Exclude current grow
+                            1 for other_grow_id in get_profile_grow_ids(profile_id, status='active')
+                            if other_grow_id != grow_id  # Exclude current grow
                         )
                         
                         # Update profile status based on active grows count
@@ -707,7 +718,7 @@ class HarvestLogView(APIView):
                     
                     # Update device status to available
                     device_ref = db.reference(f'devices/{device_id}')
-                    device_data = device_ref.get()
+                    device_data = loader.load(f'devices/{device_id}')
                     
                     if device_data:
                         # Update device status to available and clear grow-related data
@@ -723,6 +734,12 @@ class HarvestLogView(APIView):
                         if user_id:
                             notify_device_update(user_id)
 
+            # Score the log once and rank it in the materialized leaderboard
+            try:
+                add_leaderboard_entry(build_leaderboard_entry(log_id, log_data, device_data, grow_data, loader))
+            except Exception as e:
+                logger.error(f"Error adding harvest log {log_id} to the leaderboard: {str(e)}")
+
             # Format the response to match the expected client model
             response_data = {
                 "logId": log_id,
@@ -742,33 +759,32 @@ class HarvestLogView(APIView):
             return Response({"error": str(e)}, status=500)
 
     def get(self, request, device_id, grow_id=None):
+        """Return a device's harvest logs newest first, optionally for one grow and paginated with limit/offset"""
         try:
-            ref = db.reference("harvest_logs")
-            logs = ref.get()
-            
-            if not logs:
-                return Response({"logs": []}, status=200)
+            grow_id = grow_id or request.query_params.get('grow_id') or None
+            try:
+                limit = request.query_params.get('limit')
+                limit = max(1, int(limit)) if limit else None
+                offset = max(0, int(request.query_params.get('offset', 0)))
+            except ValueError:
+                return Response({"error": "limit and offset must be integers"}, status=400)
 
-            # Filter logs by device_id and optionally grow_id
-            filtered_logs = []
-            for log_id, log_data in logs.items():
-                if log_data.get("device_id") == device_id:
-                    if grow_id is None or log_data.get("grow_id") == grow_id:
-                        # Rename fields for client-side compatibility
-                        formatted_log = {
-                            "logId": log_id,
-                            "deviceId": log_data.get("device_id"),
-                            "growId": log_data.get("grow_id", ""),
-                            "cropName": log_data.get("crop_name", ""),
-                            "harvestDate": log_data.get("harvest_date", ""),
-                            "yieldAmount": log_data.get("yield_amount", 0),
-                            "rating": log_data.get("rating", 0),
-                            "performanceMetrics": log_data.get("performance_metrics", {}),
-                            "remarks": log_data.get("remarks", "")
-                        }
-                        filtered_logs.append(formatted_log)
-
-            return Response({"logs": filtered_logs}, status=200)
+            logs, total = get_harvest_log_page(device_id, grow_id, limit, offset, get_request_loader(request))
+
+            # Rename fields for client-side compatibility
+            filtered_logs = [{
+                "logId": log_id,
+                "deviceId": log_data.get("device_id"),
+                "growId": log_data.get("grow_id", ""),
+                "cropName": log_data.get("crop_name", ""),
+                "harvestDate": log_data.get("harvest_date", ""),
+                "yieldAmount": log_data.get("yield_amount", 0),
+                "rating": log_data.get("rating", 0),
+                "performanceMetrics": log_data.get("performance_metrics", {}),
+                "remarks": log_data.get("remarks", "")
+            } for log_id, log_data in logs]
+
+            return Response({"logs": filtered_logs, "total": total, "offset": offset, "limit": limit}, status=200)
             
         except Exception as e:
             return Response({"error": str(e)}, status=500)
@@ -856,18 +872,7 @@ class GrowCountView(APIView):
     def get(self, request, user_id):  # Accept user_id from path
         """Get the count of grows for a user (only active grows)"""
         try:
-            grows_ref = db.reference('grows')
-            grows = grows_ref.get()
-
-            if grows:
-                filtered_grows = {
-                    grow_id: grow_data 
-                    for grow_id, grow_data in grows.items()
-                    if grow_data.get('user_id') == user_id and grow_data.get('status') == 'active'
-                }
-                grow_count = len(filtered_grows)
-            else:
-                grow_count = 0
+            grow_count = count_user_grows(user_id, status='active')
 
             return Response({"grow_count": grow_count}, status=status.HTTP_200_OK)
         
@@ -980,163 +985,31 @@ class ProfileChangeLogView(APIView):
 
 class GlobalLeaderboardView(APIView):
     def get(self, request):
+        """Serve a page of the materialized leaderboard, optionally for one crop and/or month"""
         try:
-            # Get all harvest logs from Firebase
-            ref = db.reference("harvest_logs")
-            logs = ref.get()
-            
-            if not logs:
-                return Response({"leaderboard": []}, status=200)
+            crop = request.query_params.get('crop') or None
+            period = request.query_params.get('period') or ALL_PERIODS
+            if period != ALL_PERIODS and not re.match(r'^\d{4}-\d{2}$', period):
+                return Response({"error": "period must be 'all' or YYYY-MM"}, status=400)
 
-            # Process logs and calculate performance scores
-            leaderboard_entries = []
-            for log_id, log_data in logs.items():
-                # Extract basic information from harvest log
-                crop_name_from_log = log_data.get("crop_name", "Unknown")
-                yield_amount = log_data.get("yield_amount", 0)
-                rating = log_data.get("rating", 0)
-                harvest_date = log_data.get("harvest_date", "")
-                
-                # Get user information (device owner)
-                device_id = log_data.get("device_id", "")
-                device_ref = db.reference(f"devices/{device_id}")
-                device_data = device_ref.get()
-                user_id = device_data.get("user_id", "Unknown") if device_data else "Unknown"
-                
-                # Get grow profile information 
-                grow_id = log_data.get("grow_id", "")
-                grow_profile_id = ""
-                grow_profile_name = "Custom Configuration"
-                plant_name = crop_name_from_log  # Default to what's in the log
-                growth_duration = 0  # Default growth duration
-                optimal_conditions = {}  # Initialize optimal conditions
-                
-                if grow_id:
-                    grow_ref = db.reference(f"grows/{grow_id}")
-                    grow_data = grow_ref.get()
-                    if grow_data:
-                        # Get grow profile information
-                        grow_profile_id = grow_data.get("profile_id", "")
-                        if grow_profile_id:
-                            profile_ref = db.reference(f"grow_profiles/{grow_profile_id}")
-                            profile_data = profile_ref.get()
-                            if profile_data:
-                                grow_profile_name = profile_data.get("name", "Custom Configuration")
-                                
-                                # Extract optimal growing conditions
-                                optimal_conditions = {}
-                                
-                                # Handle structured optimal conditions format
-                                if "optimal_conditions" in profile_data:
-                                    # Get the structured optimal conditions
-                                    structured_conditions = profile_data.get("optimal_conditions", {})
-                                    
-                                    # Extract conditions for each growth stage if available
-                                    stages = ["transplanting", "vegetative", "maturation"]
-                                    stage_conditions = {}
-                                    
-                                    for stage in stages:
-                                        if stage in structured_conditions:
-                                            stage_data = structured_conditions[stage]
-                                            stage_conditions[stage] = {
-                                                "temperature": stage_data.get("temperature_range", {}),
-                                                "humidity": stage_data.get("humidity_range", {}),
-                                                "ph": stage_data.get("ph_range", {}),
-                                                "ec": stage_data.get("ec_range", {})
-                                            }
-                                    
-                                    if stage_conditions:
-                                        optimal_conditions["stages"] = stage_conditions
-                                
-                                # Fall back to flat structure if no structured data or as additional info
-                                optimal_conditions.update({
-                                    "temperature": profile_data.get("optimal_temperature", {
-                                        "min": profile_data.get("min_temperature"),
-                                        "max": profile_data.get("max_temperature")
-                                    }),
-                                    "humidity": profile_data.get("optimal_humidity", {
-                                        "min": profile_data.get("min_humidity"),
-                                        "max": profile_data.get("max_humidity")
-                                    }),
-                                    "ph": profile_data.get("optimal_ph", {
-                                        "min": profile_data.get("min_ph"),
-                                        "max": profile_data.get("max_ph")
-                                    }),
-                                    "ec": profile_data.get("optimal_ec", {
-                                        "min": profile_data.get("min_ec"),
-                                        "max": profile_data.get("max_ec")
-                                    })
-                                })
-                                
-                                # Get plant profile information to get the actual plant name
-                                plant_profile_id = profile_data.get("plant_profile_id", "")
-                                if plant_profile_id:
-                                    plant_profile_ref = db.reference(f"plant_profiles/{plant_profile_id}")
-                                    plant_profile_data = plant_profile_ref.get()
-                                    if plant_profile_data:
-                                        plant_name = plant_profile_data.get("name", crop_name_from_log)
-                                
-                                # Get growth duration from profile
-                                growth_duration = profile_data.get("grow_duration_days", 0)
-                                
-                                # If we have start_date in grow_data and harvest_date, calculate actual duration
-                                if grow_data.get("start_date") and harvest_date:
-                                    try:
-                                        start_date = datetime.fromisoformat(grow_data.get("start_date").replace('Z', '+00:00'))
-                                        harvest_datetime = datetime.fromisoformat(harvest_date.replace('Z', '+00:00'))
-                                        actual_duration = (harvest_datetime - start_date).days
-                                        if actual_duration > 0:
-                                            growth_duration = actual_duration
-                                    except Exception as e:
-                                        print(f"Error calculating growth duration: {e}")
-                
-                # Calculate performance score
-                # Base score from rating (0-5 stars)
-                base_score = rating * 20  # Convert 0-5 scale to 0-100
-                
-                # Add bonus from yield amount (normalized)
-                # We'll use a simple formula here, but this could be more sophisticated
-                yield_bonus = min(yield_amount * 5, 50)  # Cap at 50 points
-                
-                # Add bonus from performance metrics if available
-                metrics_bonus = 0
-                performance_metrics = log_data.get("performance_metrics", {})
-                if performance_metrics:
-                    # Calculate average of normalized metrics (assuming 0-100 scale)
-                    metrics_values = [min(value, 100) for value in performance_metrics.values()]
-                    if metrics_values:
-                        metrics_bonus = sum(metrics_values) / len(metrics_values)
-                
-                # Total score (weighted)
-                total_score = (base_score * 0.4) + (yield_bonus * 0.4) + (metrics_bonus * 0.2)
-                
-                # Create leaderboard entry
-                entry = {
-                    "logId": log_id,
-                    "userId": user_id,
-                    "cropName": plant_name,  # Use the plant name from plant profile
-                    "growProfileId": grow_profile_id,
-                    "growProfileName": grow_profile_name,  # This is the grow profile name
-                    "harvestDate": harvest_date,
-                    "yieldAmount": yield_amount,
-                    "rating": rating,
-                    "performanceMetrics": performance_metrics,
-                    "score": round(total_score, 2),
-                    "growthDuration": growth_duration,  # Add growth duration to the entry
-                    "optimalConditions": optimal_conditions,  # Add optimal growing conditions
-                    "remarks": log_data.get("remarks", "")  # Add remarks if present
-                }
-                
-                leaderboard_entries.append(entry)
-            
-            # Sort by score (highest first)
-            leaderboard_entries.sort(key=lambda x: x["score"], reverse=True)
-            
-            # Add rank to each entry
-            for i, entry in enumerate(leaderboard_entries):
-                entry["rank"] = i + 1
-            
-            return Response({"leaderboard": leaderboard_entries}, status=200)
+            try:
+                # Without a limit the page is the top K, which is served from the bucket
+                limit = request.query_params.get('limit')
+                limit = max(1, int(limit)) if limit else getattr(settings, 'LEADERBOARD_TOP_K', 100)
+                offset = max(0, int(request.query_params.get('offset', 0)))
+            except ValueError:
+                return Response({"error": "limit and offset must be integers"}, status=400)
+
+            leaderboard_entries, total = get_leaderboard_page(limit, offset, crop, period)
+
+            return Response({
+                "leaderboard": leaderboard_entries,
+                "total": total,
+                "offset": offset,
+                "limit": limit,
+                "crop": crop,
+                "period": period,
+            }, status=200)
             
         except Exception as e:
-            return Response({"error": str(e)}, status=500)
\ No newline at end of file
+            return Response({"error": str(e)}, status=500)
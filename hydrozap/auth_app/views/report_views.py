@@ -13,6 +13,9 @@ from django.conf import settings
 import logging
 import json
 from django.http import JsonResponse
+from ..utils.grow_index import get_active_device_grow
+from ..utils.device_latest import latest_reading
+from ..utils.sensor_history import fetch_recent_readings
 
 logger = logging.getLogger(__name__)
 
@@ -60,12 +63,7 @@ class MonitoringReportPDFView(View):
         grow_start_date = None
 
         # 1. Find the active grow for this device
-        grows_ref = db.reference('grows')
-        grows = grows_ref.get() or {}
-        for grow_id, grow in grows.items():
-            if grow.get('device_id') == device_id and str(grow.get('status', '')).lower() == 'active':
-                grow_data = grow
-                break
+        grow_id, grow_data = get_active_device_grow(device_id)
 
         # --- Determine current stage ---
         current_stage = (grow_data.get('stage') if grow_data and grow_data.get('stage') else 'vegetative')
@@ -120,16 +118,7 @@ class MonitoringReportPDFView(View):
 
         # --- Prepare parameters from latest sensor readings ---
         parameters = []
-        sensors = device_data.get('sensors', {})
-
-        # If sensors is a dict of readings (from .push()), get the latest one
-        if isinstance(sensors, dict) and any(isinstance(v, dict) for v in sensors.values()):
-            latest = None
-            for reading in sensors.values():
-                if isinstance(reading, dict) and 'timestamp' in reading:
-                    if not latest or reading['timestamp'] > latest['timestamp']:
-                        latest = reading
-            sensors = latest or {}
+        sensors = latest_reading(device_data)
 
         if sensors:
             parameters = [
@@ -142,16 +131,19 @@ class MonitoringReportPDFView(View):
         # --- Fetch historical sensor readings ---
         historical_readings = []
         try:
-            # Get all sensor readings from the device
+            # Get the newest sensor readings from the device's history
+            readings_list = [reading for _, reading in fetch_recent_readings(device_id, 20)]
             all_sensors = device_data.get('sensors', {})
             
             if isinstance(all_sensors, dict):
-                # Convert sensor readings to list format for sorting
-                readings_list = []
+                # Devices that have not been migrated off the sensors node yet
                 for reading_id, reading_data in all_sensors.items():
                     if isinstance(reading_data, dict) and 'timestamp' in reading_data:
                         readings_list.append(reading_data)
                 
+                # Readings copied to the history as well only count once
+                readings_list = list({reading['timestamp']: reading for reading in readings_list}.values())
+
                 # Sort by timestamp (newest first) and take the last 20 readings
                 readings_list.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
                 recent_readings = readings_list[:20]  # Get last 20 readings
@@ -5,7 +5,8 @@ from firebase_admin import db
 from datetime import datetime
 from .device_views import DeviceView
 from .notification_utils import send_fcm_notification, should_send_notification, notify_alert_update
-from .alert_views import get_suggested_action
+from .alert_views import get_suggested_action, store_alert
+from ..utils.alert_index import save_alert
 import os
 import random
 from datetime import timedelta
@@ -17,40 +18,67 @@ import jwt
 from django.core.cache import cache
 from firebase_admin import messaging
 from ..firebase import initialize_firebase, is_fcm_available
+from ..utils.sensor_buffer import SENSOR_FIELDS, sensor_reading_updates, sensor_write_buffer
+from ..utils.sensor_cache import device_exists, get_grow_conditions
+from ..utils.alert_engine import TRIGGERED, RECOVERED, STILL_FIRING, alert_engine, condition_key, is_violated
+from ..utils.sensor_history import (
+    RESOLUTIONS,
+    AGGREGATIONS,
+    has_sensor_history,
+    fetch_sensor_history,
+    from_epoch_ms,
+    to_epoch_ms,
+    downsample,
+    columnar_series,
+    merge_readings,
+)
+from ..utils.archive import get_archive_watermark, read_archive_if_needed
+from ..utils.sensor_rollups import (
+    RESOLUTION_GRANULARITIES,
+    ROLLUP_AGGREGATIONS,
+    aggregate_readings,
+    merge_stats,
+    get_rollup_checkpoint,
+    fetch_rollups,
+    rollup_series,
+)
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+REQUIRED_SENSOR_FIELDS = ['device_id'] + SENSOR_FIELDS
+
+def build_sensor_reading(data, allow_timestamp=False):
+    """Validate a sensor payload and return (device_id, reading, error)"""
+    missing_fields = [field for field in REQUIRED_SENSOR_FIELDS if field not in data]
+    if missing_fields:
+        return None, None, f"Missing fields: {', '.join(missing_fields)}"
+
+    reading = {field: data[field] for field in SENSOR_FIELDS}
+    timestamp = data.get('timestamp') if allow_timestamp else None
+    if timestamp:
+        try:
+            timestamp = datetime.fromisoformat(str(timestamp).replace('Z', '+00:00')).isoformat()
+        except ValueError:
+            return None, None, "Invalid timestamp format. Use ISO format (YYYY-MM-DDTHH:MM:SS.sss)"
+    reading['timestamp'] = timestamp or datetime.now().isoformat()
+    return data['device_id'], reading, None
+
 class SensorDataView(APIView):
     def post(self, request):
         data = request.data
-        required_fields = ['device_id', 'temperature', 'humidity', 'ph', 'ec', 'tds', 'waterLevel']
-        missing_fields = [field for field in required_fields if field not in data]
-
-        if missing_fields:
-            return Response({"error": f"Missing fields: {', '.join(missing_fields)}"}, status=400)
-
-        device_id = data['device_id']
-        sensor_data = {
-            'temperature': data['temperature'],
-            'humidity': data['humidity'],
-            'ph': data['ph'],
-            'ec': data['ec'],
-            'tds': data['tds'],
-            'waterLevel': data['waterLevel'],
-            'timestamp': datetime.now().isoformat()
-        }
+        device_id, sensor_data, error = build_sensor_reading(data)
 
-        # 🔍 Check if device exists
-        device_ref = db.reference(f'devices/{device_id}')
-        if not device_ref.get():
-            return Response({"error": "Add the device first before the sensor sends data."}, status=404)
+        if error:
+            return Response({"error": error}, status=400)
 
-        # ✅ Save new sensor data under unique key
-        sensors_ref = device_ref.child('sensors')
-        sensors_ref.push(sensor_data)
+        # 🔍 Check if device exists (cached)
+        if not device_exists(device_id):
+            return Response({"error": "Add the device first before the sensor sends data."}, status=404)
 
-        # 🔄 Update top-level sensor values (for easy access)
-        sensors_ref.update(sensor_data)
+        # ✅ Save the reading in its history bucket and replace the device's
+        # latest values (for easy access) in a single multi-path write
+        db.reference().update(sensor_reading_updates(device_id, sensor_data))
 
         # 🚨 Check for alerts
         triggered_alerts = self.check_conditions(device_id, data['ph'], data['ec'])
@@ -67,15 +95,15 @@ class SensorDataView(APIView):
 
     def check_conditions(self, device_id, ph, ec):
         """Check grow conditions and trigger alerts if necessary"""
-        grows_ref = db.reference('grows')
-        grows = grows_ref.order_by_child('device_id').equal_to(device_id).get()
+        grows = get_grow_conditions(device_id)
         
         triggered_alerts = []  # Track triggered alerts for response
 
         if grows:
-            for grow_id, grow in grows.items():
-                controls = grow.get('controls', {}).get('condition', [])
-                user_id = grow.get('user_id')
+            for grow in grows:
+                grow_id = grow['grow_id']
+                controls = grow['conditions']
+                user_id = grow['user_id']
 
                 for condition in controls:
                     sensor_type = condition['sensor']
@@ -102,34 +130,69 @@ class SensorDataView(APIView):
                             specific_alert_type = "ec"
                     # You can add more sensor types here (e.g., tds_high/low, temp_high/low, etc.)
 
-                    if (sensor_type == "pH" and self.evaluate_condition(ph, operator, value)) or (
-                            sensor_type == "EC" and self.evaluate_condition(ec, operator, value)):
+                    if sensor_type == "pH":
+                        sensor_value = ph
+                    elif sensor_type == "EC":
+                        sensor_value = ec
+                    else:
+                        continue
+                    try:
+                        sensor_value, threshold = float(sensor_value), float(value)
+                    except (TypeError, ValueError):
+                        continue
+
+                    key = condition_key(device_id, grow_id, sensor_type, operator)
+                    event, state = alert_engine.evaluate(key, sensor_type, sensor_value, operator, threshold)
+
+                    if event == TRIGGERED:
                         message = f"{sensor_type} {operator} {value}: {action} {actuator}"
                         alert_id, alert_data = self.create_alert(user_id, device_id, message, specific_alert_type)
-                        
-                        # Add to triggered alerts
-                        triggered_alerts.append({
-                            "alert_id": alert_id,
-                            "alert_data": alert_data,
-                            "grow_id": grow_id
-                        })
+                        alert_engine.attach_alert(key, alert_id)
+                    elif event == RECOVERED:
+                        minutes = int((datetime.now().timestamp() - state['since']) // 60)
+                        message = f"{sensor_type} back to normal at {sensor_value} after {minutes} min ({operator} {value})"
+                        alert_id, alert_data = self.create_alert(user_id, device_id, message, specific_alert_type,
+                                                                 recovered=True)
+                    elif event == STILL_FIRING:
+                        # Fold the readings since the last report into the open alert
+                        self.update_firing_alert(user_id, state)
+                        continue
+                    else:
+                        continue
+
+                    # Add to triggered alerts
+                    triggered_alerts.append({
+                        "alert_id": alert_id,
+                        "alert_data": alert_data,
+                        "grow_id": grow_id,
+                        "event": event
+                    })
         
         return triggered_alerts
 
     def evaluate_condition(self, sensor_value, operator, threshold):
         """Evaluate sensor value based on operator"""
-        if operator == "<":
-            return sensor_value < threshold
-        elif operator == ">":
-            return sensor_value > threshold
-        elif operator == "==":
-            return sensor_value == threshold
-        return False
-
-    def create_alert(self, user_id, device_id, message, alert_type):
+        return is_violated(sensor_value, operator, threshold)
+
+    def update_firing_alert(self, user_id, state):
+        """Record how long and how often a condition has kept firing on its alert"""
+        try:
+            alert_id = state['alert_id']
+            previous_alert = db.reference(f"alerts/{user_id}/{alert_id}").get()
+            if not isinstance(previous_alert, dict):
+                # Deleted or archived meanwhile, don't write a partial alert back
+                return
+            save_alert(user_id, alert_id, {
+                "occurrences": state.get('occurrences', 1),
+                "last_value": state.get('last_value'),
+                "last_seen": datetime.now().isoformat(),
+            }, previous_alert)
+        except Exception as e:
+            logger.error(f"Error updating firing alert {state.get('alert_id')}: {str(e)}")
+
+    def create_alert(self, user_id, device_id, message, alert_type, recovered=False):
         """Create and store alert for user"""
-        alert_ref = db.reference(f'alerts/{user_id}')
-        alert_id = f"alert_{int(datetime.now().timestamp())}"
+        alert_id = None
         
         # Determine specific alert type
         specific_alert_type = alert_type
@@ -145,15 +208,17 @@ class SensorDataView(APIView):
             "status": "unread",
             "timestamp": datetime.now().isoformat()
         }
+        if recovered:
+            alert_data["recovered"] = True
         
         # Verify the alert can be written to Firebase
         try:
-            alert_ref.child(alert_id).set(alert_data)
+            alert_id = store_alert(user_id, alert_data)
             
             # Send push notification for the alert
             # Extract sensor type from message (e.g., "pH > 7.5: Add acid to nutrient tank")
             if "pH" in message:
-                title = "⚠️ pH Alert"
+                title = "✅ pH Recovered" if recovered else "⚠️ pH Alert"
                 notification_data = {
                     "alert_id": alert_id,
                     "device_id": device_id,
@@ -162,7 +227,7 @@ class SensorDataView(APIView):
                 }
                 fcm_result = send_fcm_notification(user_id, title, message, notification_data)
             elif "EC" in message:
-                title = "⚠️ EC/TDS Alert"
+                title = "✅ EC/TDS Recovered" if recovered else "⚠️ EC/TDS Alert"
                 notification_data = {
                     "alert_id": alert_id,
                     "device_id": device_id,
@@ -174,10 +239,76 @@ class SensorDataView(APIView):
             pass
         
         # Notify WebSocket clients about the new alert
-        notify_alert_update(user_id, alert_id, message, specific_alert_type)
+        if alert_id:
+            notify_alert_update(user_id, alert_id, message, specific_alert_type)
         
         return alert_id, alert_data
 
+class SensorBatchView(APIView):
+    def post(self, request):
+        """
+        Accept a batch of sensor readings from one or many devices.
+
+        Body: {"readings": [{device_id, temperature, humidity, ph, ec, tds, waterLevel, timestamp?}, ...]}
+        (a bare list of readings is accepted too).
+
+        Readings are queued in the write-behind buffer and stored with the next
+        flush; alert conditions are evaluated once per device on its newest reading.
+        """
+        data = request.data
+        readings = data.get('readings') if isinstance(data, dict) else data
+
+        if not isinstance(readings, list) or not readings:
+            return Response({"error": "readings must be a non-empty list"}, status=400)
+
+        max_readings = getattr(settings, 'SENSOR_BATCH_MAX_READINGS', 1000)
+        if len(readings) > max_readings:
+            return Response({"error": f"A batch may contain at most {max_readings} readings"}, status=400)
+
+        accepted = 0
+        rejected = []
+        latest_by_device = {}
+
+        for index, item in enumerate(readings):
+            if not isinstance(item, dict):
+                rejected.append({"index": index, "error": "Reading must be an object"})
+                continue
+
+            device_id, reading, error = build_sensor_reading(item, allow_timestamp=True)
+            if error:
+                rejected.append({"index": index, "error": error})
+                continue
+
+            if not device_exists(device_id):
+                rejected.append({"index": index, "device_id": device_id,
+                                 "error": "Add the device first before the sensor sends data."})
+                continue
+
+            sensor_write_buffer.add(device_id, reading)
+            accepted += 1
+
+            latest = latest_by_device.get(device_id)
+            if latest is None or reading['timestamp'] >= latest['timestamp']:
+                latest_by_device[device_id] = reading
+
+        # 🚨 Check for alerts on the newest reading of each device
+        triggered_alerts = []
+        checker = SensorDataView()
+        for device_id, reading in latest_by_device.items():
+            triggered_alerts.extend(checker.check_conditions(device_id, reading['ph'], reading['ec']))
+
+        response_data = {
+            "message": "Sensor readings accepted",
+            "accepted": accepted,
+            "rejected": rejected,
+        }
+
+        if triggered_alerts:
+            response_data["alerts_triggered"] = len(triggered_alerts)
+            response_data["alerts"] = triggered_alerts
+
+        return Response(response_data, status=status.HTTP_202_ACCEPTED if accepted else status.HTTP_400_BAD_REQUEST)
+
 def send_fcm_via_http(token, title, body, data=None):
     """
     Fallback method to send FCM via HTTP v1 API directly
@@ -323,6 +454,10 @@ class HistoricalSensorDataView(APIView):
         - start_date: ISO format datetime string (e.g., 2024-01-01T00:00:00.000)
         - end_date: ISO format datetime string
         - sensor_type: Type of sensor data to retrieve (temperature, humidity, ph, ec, tds, all)
+        - resolution: raw (default), 1m, 5m, 1h or 1d bucket width
+        - agg: Aggregation applied per bucket (mean, min, max, last), default mean
+        - layout: map (default) for readings keyed by ISO timestamp, or columnar for
+          parallel epoch-millisecond timestamp and value arrays per sensor type
         
         Returns:
         - Dictionary of sensor data points structured by sensor type
@@ -332,6 +467,25 @@ class HistoricalSensorDataView(APIView):
             start_date_str = request.query_params.get('start_date')
             end_date_str = request.query_params.get('end_date')
             sensor_type = request.query_params.get('sensor_type', 'all').lower()
+            resolution = request.query_params.get('resolution', 'raw').lower()
+            agg = request.query_params.get('agg', 'mean').lower()
+            output_format = request.query_params.get('layout', 'map').lower()
+            
+            if resolution not in RESOLUTIONS:
+                return Response(
+                    {"error": f"Invalid resolution. Use one of: {', '.join(RESOLUTIONS)}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if agg not in AGGREGATIONS:
+                return Response(
+                    {"error": f"Invalid agg. Use one of: {', '.join(AGGREGATIONS)}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if output_format not in ('map', 'columnar'):
+                return Response(
+                    {"error": "Invalid layout. Use 'map' or 'columnar'"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
             # Validate required parameters
             if not start_date_str or not end_date_str:
@@ -350,136 +504,92 @@ class HistoricalSensorDataView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Get device data
-            device_ref = db.reference(f'devices/{device_id}')
-            device_data = device_ref.get()
-            
-            if not device_data:
+            # Make sure the device exists without downloading its sensor history
+            if not device_exists(device_id):
                 return Response(
                     {"error": f"Device with ID {device_id} not found"}, 
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Check if device has sensors data
-            device_sensors = device_data.get('sensors')
-            if not device_sensors:
-                return Response(
-                    {"error": "No sensor data available for this device"},
-                    status=status.HTTP_404_NOT_FOUND
-                )
-            
-            # Filter sensor readings by date range and organize by sensor type
-            filtered_data = {}
-            result = {"sensor_data": {}}
-            
             # Initialize data structure for each requested sensor type
             if sensor_type == 'all':
                 sensor_types = ['temperature', 'humidity', 'ph', 'ec', 'tds', 'waterLevel']
             else:
                 sensor_types = [sensor_type]
-                
-            # Two possible structures:
-            # 1. Sensors as a dict directly in device data with timestamp (simpler format)
-            # 2. Sensors as a collection of readings with timestamps (more complex, historical format)
-            
-            # Case 1: Sensors stored directly in device data
-            if isinstance(device_sensors, dict) and not any(isinstance(v, dict) for v in device_sensors.values()):
-                # Check if there's a timestamp in the sensors dict
-                sensor_timestamp = device_sensors.get('timestamp')
-                if sensor_timestamp:
-                    try:
-                        reading_time = datetime.fromisoformat(sensor_timestamp.replace('Z', '+00:00'))
-                        # Only include if within date range
-                        if start_date <= reading_time <= end_date:
-                            timestamp_key = reading_time.isoformat()
-                            filtered_data[timestamp_key] = {'timestamp': timestamp_key}
-                            
-                            # Add each requested sensor type if present
-                            for s_type in sensor_types:
-                                if s_type in device_sensors:
-                                    filtered_data[timestamp_key][s_type] = device_sensors[s_type]
-                    except (ValueError, TypeError):
-                        # If timestamp parsing fails, add current data anyway with current timestamp
-                        timestamp_key = datetime.now().isoformat()
-                        filtered_data[timestamp_key] = {'timestamp': timestamp_key}
-                        
-                        for s_type in sensor_types:
-                            if s_type in device_sensors:
-                                filtered_data[timestamp_key][s_type] = device_sensors[s_type]
-                else:
-                    # No timestamp, use current time
-                    timestamp_key = datetime.now().isoformat()
-                    filtered_data[timestamp_key] = {'timestamp': timestamp_key}
-                    
-                    for s_type in sensor_types:
-                        if s_type in device_sensors:
-                            filtered_data[timestamp_key][s_type] = device_sensors[s_type]
             
-            # Case 2: Try getting data from sensor readings collection
+            rolled_up = None
+            readings = []
+            start_ms, end_ms = to_epoch_ms(start_date), to_epoch_ms(end_date)
+            if has_sensor_history(device_id) or get_archive_watermark('sensor_history', device_id) is not None:
+                legacy_watermark = get_archive_watermark('sensors', device_id)
+                # Rollups are computed from sensor_history only, so they miss legacy
+                # readings that were archived before the device was backfilled
+                covers_legacy_archive = legacy_watermark is not None and start_ms <= legacy_watermark
+                if (resolution in RESOLUTION_GRANULARITIES and agg in ROLLUP_AGGREGATIONS
+                        and not covers_legacy_archive):
+                    # Hourly and daily charts are served from the pre-computed rollups
+                    rolled_up = self.get_rollup_series(device_id, start_date, end_date, sensor_types, resolution, agg)
+                if rolled_up is None:
+                    # Read only the day buckets that overlap the requested range, plus
+                    # any older readings the compaction job has moved to the archive.
+                    # Legacy devices/{id}/sensors readings archived before the device
+                    # was backfilled only exist in the sensors archive.
+                    legacy_archived = read_archive_if_needed('sensors', device_id, start_ms, end_ms)
+                    archived = read_archive_if_needed('sensor_history', device_id, start_ms, end_ms)
+                    readings = merge_readings(
+                        [(epoch_ms, reading) for _, epoch_ms, reading in legacy_archived],
+                        [(epoch_ms, reading) for _, epoch_ms, reading in archived],
+                        fetch_sensor_history(device_id, start_date, end_date)
+                    )
             else:
-                # Get the sensors reference to look for historical readings
-                sensors_ref = db.reference(f'devices/{device_id}/sensors')
-                all_sensor_data = sensors_ref.get() or {}
-                
-                # Check if it's a dictionary of readings
-                if isinstance(all_sensor_data, dict):
-                    for reading_id, reading in all_sensor_data.items():
-                        # Skip entries that aren't dictionaries
-                        if not isinstance(reading, dict):
-                            continue
-                            
-                        # Skip entries without timestamp
-                        if 'timestamp' not in reading:
-                            continue
-                        
-                        # Parse reading timestamp
-                        try:
-                            reading_time = datetime.fromisoformat(reading['timestamp'].replace('Z', '+00:00'))
-                        except (ValueError, TypeError):
-                            continue
-                        
-                        # Check if reading is within date range
-                        if start_date <= reading_time <= end_date:
-                            # Add to filtered data with timestamp as key for sorting
-                            timestamp_key = reading_time.isoformat()
-                            if timestamp_key not in filtered_data:
-                                filtered_data[timestamp_key] = {}
-                            
-                            # Add each requested sensor value if present
-                            for s_type in sensor_types:
-                                if s_type in reading:
-                                    filtered_data[timestamp_key][s_type] = reading[s_type]
-                            
-                            # Always include timestamp
-                            filtered_data[timestamp_key]['timestamp'] = timestamp_key
+                # Devices whose readings have not been backfilled into sensor_history yet
+                legacy_data = self.get_legacy_sensor_data(device_id, start_date, end_date, sensor_types)
+                archived = read_archive_if_needed('sensors', device_id, start_ms, end_ms)
+                if legacy_data is None and not archived:
+                    return Response(
+                        {"error": "No sensor data available for this device"},
+                        status=status.HTTP_404_NOT_FOUND
+                    )
+                readings = merge_readings(
+                    [(epoch_ms, reading) for _, epoch_ms, reading in archived],
+                    ((to_epoch_ms(timestamp_key), reading) for timestamp_key, reading in (legacy_data or {}).items())
+                )
             
             # If no data found, generate mock data for testing
-            if not filtered_data and os.environ.get('GENERATE_MOCK_DATA', 'False').lower() == 'true':
-                # Generate mock data with timestamps within the range
-                days_range = (end_date - start_date).days + 1
-                for i in range(days_range):
-                    # Create a timestamp for each day
-                    mock_date = start_date + timedelta(days=i)
-                    timestamp_key = mock_date.isoformat()
-                    
-                    # Create mock data for each sensor type
-                    filtered_data[timestamp_key] = {'timestamp': timestamp_key}
-                    for s_type in sensor_types:
-                        if s_type == 'temperature':
-                            filtered_data[timestamp_key][s_type] = round(20 + (random.random() * 10), 1)  # 20-30°C
-                        elif s_type == 'humidity':
-                            filtered_data[timestamp_key][s_type] = round(40 + (random.random() * 40), 1)  # 40-80%
-                        elif s_type == 'ph':
-                            filtered_data[timestamp_key][s_type] = round(5.5 + (random.random() * 2), 1)  # 5.5-7.5
-                        elif s_type == 'ec':
-                            filtered_data[timestamp_key][s_type] = round(1 + (random.random() * 2), 2)  # 1-3 mS/cm
-                        elif s_type == 'tds':
-                            filtered_data[timestamp_key][s_type] = int(500 + (random.random() * 1000))  # 500-1500 ppm
-                        elif s_type == 'waterLevel':
-                            filtered_data[timestamp_key][s_type] = round(50 + (random.random() * 50), 1)  # 50-100%
+            if rolled_up is None and not readings and os.environ.get('GENERATE_MOCK_DATA', 'False').lower() == 'true':
+                readings = self.generate_mock_readings(start_date, end_date, sensor_types)
+            
+            result = {"resolution": resolution, "layout": output_format}
             
-            # Convert filtered data to the desired response format
-            result["sensor_data"] = filtered_data
+            if resolution == 'raw' and output_format == 'map':
+                # Every reading keyed by its ISO timestamp
+                filtered_data = {}
+                for epoch_ms, reading in readings:
+                    timestamp_key = self.timestamp_key(epoch_ms, reading)
+                    filtered_data[timestamp_key] = {
+                        s_type: reading[s_type] for s_type in sensor_types if s_type in reading
+                    }
+                    filtered_data[timestamp_key]['timestamp'] = timestamp_key
+                result["sensor_data"] = filtered_data
+            else:
+                timestamps, series = rolled_up or downsample(readings, sensor_types, resolution, agg)
+                if resolution != 'raw':
+                    result["agg"] = agg
+                
+                if output_format == 'columnar':
+                    # Parallel epoch-millisecond timestamp and value arrays per sensor type
+                    result["sensor_data"] = columnar_series(timestamps, series)
+                else:
+                    # One entry per bucket keyed by the bucket start time
+                    filtered_data = {}
+                    for index, epoch_ms in enumerate(timestamps.tolist()):
+                        timestamp_key = from_epoch_ms(epoch_ms).isoformat()
+                        filtered_data[timestamp_key] = {
+                            s_type: round(float(values[index]), 3)
+                            for s_type, values in series.items() if not np.isnan(values[index])
+                        }
+                        filtered_data[timestamp_key]['timestamp'] = timestamp_key
+                    result["sensor_data"] = filtered_data
             
             # Return the filtered sensor data
             return Response(result, status=status.HTTP_200_OK)
@@ -491,6 +601,150 @@ class HistoricalSensorDataView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def get_rollup_series(self, device_id, start_date, end_date, sensor_types, resolution, agg):
+        """
+        Build downsampled series from sensor_rollups, topping up the buckets
+        after the rollup checkpoint from raw readings. Returns None if the
+        device has not been rolled up yet.
+        """
+        checkpoint = get_rollup_checkpoint(device_id)
+        if checkpoint is None:
+            return None
+
+        granularity = RESOLUTION_GRANULARITIES[resolution]
+        start_ms = to_epoch_ms(start_date)
+        end_ms = to_epoch_ms(end_date)
+        rollups = fetch_rollups(device_id, granularity, start_ms, min(end_ms, checkpoint))
+
+        if end_ms > checkpoint:
+            recent = fetch_sensor_history(device_id, from_epoch_ms(max(start_ms, checkpoint + 1)), end_date)
+            for bucket, stats in aggregate_readings(recent, sensor_types, granularity).items():
+                rollups[bucket] = merge_stats(rollups.get(bucket), stats)
+
+        return rollup_series(rollups, sensor_types, granularity, agg)
+
+    @staticmethod
+    def timestamp_key(epoch_ms, reading):
+        """ISO key for a reading, preferring its own stored timestamp"""
+        try:
+            return datetime.fromisoformat(reading['timestamp'].replace('Z', '+00:00')).isoformat()
+        except (KeyError, ValueError, TypeError, AttributeError):
+            return from_epoch_ms(epoch_ms).isoformat()
+
+    def generate_mock_readings(self, start_date, end_date, sensor_types):
+        """Generate one mock reading per day in the range for testing"""
+        readings = []
+        days_range = (end_date - start_date).days + 1
+        for i in range(days_range):
+            # Create a timestamp for each day
+            mock_date = start_date + timedelta(days=i)
+            reading = {'timestamp': mock_date.isoformat()}
+            
+            # Create mock data for each sensor type
+            for s_type in sensor_types:
+                if s_type == 'temperature':
+                    reading[s_type] = round(20 + (random.random() * 10), 1)  # 20-30°C
+                elif s_type == 'humidity':
+                    reading[s_type] = round(40 + (random.random() * 40), 1)  # 40-80%
+                elif s_type == 'ph':
+                    reading[s_type] = round(5.5 + (random.random() * 2), 1)  # 5.5-7.5
+                elif s_type == 'ec':
+                    reading[s_type] = round(1 + (random.random() * 2), 2)  # 1-3 mS/cm
+                elif s_type == 'tds':
+                    reading[s_type] = int(500 + (random.random() * 1000))  # 500-1500 ppm
+                elif s_type == 'waterLevel':
+                    reading[s_type] = round(50 + (random.random() * 50), 1)  # 50-100%
+            readings.append((to_epoch_ms(mock_date), reading))
+        return readings
+
+    def get_legacy_sensor_data(self, device_id, start_date, end_date, sensor_types):
+        """
+        Filter readings stored under devices/{id}/sensors by date range.
+
+        Returns None when the device has no sensor data at all.
+        """
+        device_sensors = db.reference(f'devices/{device_id}/sensors').get()
+        if not device_sensors:
+            return None
+        
+        filtered_data = {}
+        
+        # Two possible structures:
+        # 1. Sensors as a dict directly in device data with timestamp (simpler format)
+        # 2. Sensors as a collection of readings with timestamps (more complex, historical format)
+
+        # Case 1: Sensors stored directly in device data
+        if isinstance(device_sensors, dict) and not any(isinstance(v, dict) for v in device_sensors.values()):
+            # Check if there's a timestamp in the sensors dict
+            sensor_timestamp = device_sensors.get('timestamp')
+            if sensor_timestamp:
+                try:
+                    reading_time = datetime.fromisoformat(sensor_timestamp.replace('Z', '+00:00'))
+                    # Only include if within date range
+                    if start_date <= reading_time <= end_date:
+                        timestamp_key = reading_time.isoformat()
+                        filtered_data[timestamp_key] = {'timestamp': timestamp_key}
+
+                        # Add each requested sensor type if present
+                        for s_type in sensor_types:
+                            if s_type in device_sensors:
+                                filtered_data[timestamp_key][s_type] = device_sensors[s_type]
+                except (ValueError, TypeError):
+                    # If timestamp parsing fails, add current data anyway with current timestamp
+                    timestamp_key = datetime.now().isoformat()
+                    filtered_data[timestamp_key] = {'timestamp': timestamp_key}
+
+                    for s_type in sensor_types:
+                        if s_type in device_sensors:
+                            filtered_data[timestamp_key][s_type] = device_sensors[s_type]
+            else:
+                # No timestamp, use current time
+                timestamp_key = datetime.now().isoformat()
+                filtered_data[timestamp_key] = {'timestamp': timestamp_key}
+
+                for s_type in sensor_types:
+                    if s_type in device_sensors:
+                        filtered_data[timestamp_key][s_type] = device_sensors[s_type]
+
+        # Case 2: Try getting data from sensor readings collection
+        else:
+            # The sensors node already holds the historical readings
+            all_sensor_data = device_sensors
+
+            # Check if it's a dictionary of readings
+            if isinstance(all_sensor_data, dict):
+                for reading_id, reading in all_sensor_data.items():
+                    # Skip entries that aren't dictionaries
+                    if not isinstance(reading, dict):
+                        continue
+
+                    # Skip entries without timestamp
+                    if 'timestamp' not in reading:
+                        continue
+
+                    # Parse reading timestamp
+                    try:
+                        reading_time = datetime.fromisoformat(reading['timestamp'].replace('Z', '+00:00'))
+                    except (ValueError, TypeError):
+                        continue
+
+                    # Check if reading is within date range
+                    if start_date <= reading_time <= end_date:
+                        # Add to filtered data with timestamp as key for sorting
+                        timestamp_key = reading_time.isoformat()
+                        if timestamp_key not in filtered_data:
+                            filtered_data[timestamp_key] = {}
+
+                        # Add each requested sensor value if present
+                        for s_type in sensor_types:
+                            if s_type in reading:
+                                filtered_data[timestamp_key][s_type] = reading[s_type]
+
+                        # Always include timestamp
+                        filtered_data[timestamp_key]['timestamp'] = timestamp_key
+        
+        return filtered_data
+
 class DosingLogDataView(APIView):
     def get(self, request, device_id):
         """
@@ -528,8 +782,15 @@ class DosingLogDataView(APIView):
             if not device_data:
                 return Response({"error": f"Device with ID {device_id} not found"}, status=status.HTTP_404_NOT_FOUND)
 
-            # Get dosing_logs
-            dosing_logs = device_data.get('dosing_logs')
+            # Get dosing_logs, including logs the compaction job has moved to the archive
+            dosing_logs = {
+                log_id: log for log_id, _, log in read_archive_if_needed(
+                    'dosing_logs', device_id,
+                    to_epoch_ms(start_date) if start_date else None,
+                    to_epoch_ms(end_date) if end_date else None
+                )
+            }
+            dosing_logs.update(device_data.get('dosing_logs') or {})
             if not dosing_logs:
                 return Response({"error": "No dosing logs available for this device"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -101,6 +101,29 @@ DATABASES = {
     }
 }
 
+# Cache
+# Cached Firebase lookups (sensor ingestion, FCM tokens, crop profiles) are
+# invalidated with cache.delete() when the records change. The default
+# LocMemCache is per process, so an invalidation only reaches the worker that
+# made the change; deployments running several workers must set
+# CACHE_REDIS_URL so every worker shares one cache, and an error is logged at
+# startup when APP_WORKERS or APP_HOSTS is above 1 without it.
+APP_WORKERS = int(os.getenv('APP_WORKERS', '1'))  # worker processes per host, e.g. gunicorn --workers
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', '')  # e.g. redis://localhost:6379/2
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -206,5 +229,67 @@ FIREBASE_CONFIG = {
 # Firebase Web API Key for client-side authentication
 FIREBASE_API_KEY = os.getenv('FIREBASE_API_KEY')
 
+# Worker threads for Firebase calls made from async code (consumers)
+FIREBASE_ASYNC_MAX_WORKERS = int(os.getenv('FIREBASE_ASYNC_MAX_WORKERS', '10'))
+# Worker threads the request-scoped loaders fetch independent paths on concurrently
+FIREBASE_LOADER_MAX_WORKERS = int(os.getenv('FIREBASE_LOADER_MAX_WORKERS', '16'))
+
+# ID token verification
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', '1024'))  # verified tokens kept in memory until they expire
+AUTH_CERT_REFRESH_SECONDS = int(os.getenv('AUTH_CERT_REFRESH_SECONDS', '3600'))  # seconds between background certificate refreshes, 0 disables
+AUTH_REVOCATION_CHECK_SECONDS = int(os.getenv('AUTH_REVOCATION_CHECK_SECONDS', '0'))  # re-check cached tokens for revocation this often, 0 never checks
+
+# Push notifications
+FCM_TOKEN_CACHE_TTL = int(os.getenv('FCM_TOKEN_CACHE_TTL', '300'))  # seconds to cache a user's FCM tokens
+FCM_TOKEN_LOCAL_CACHE_TTL = int(os.getenv('FCM_TOKEN_LOCAL_CACHE_TTL', '30'))  # cap on FCM_TOKEN_CACHE_TTL when several workers run without CACHE_REDIS_URL
+FCM_TOKEN_STALE_DAYS = int(os.getenv('FCM_TOKEN_STALE_DAYS', '60'))  # tokens not refreshed for this long are marked inactive
+FCM_DISPATCH_WORKERS = int(os.getenv('FCM_DISPATCH_WORKERS', '4'))  # background notification senders
+FCM_DISPATCH_QUEUE_SIZE = int(os.getenv('FCM_DISPATCH_QUEUE_SIZE', '1000'))  # pending notifications before new ones are dropped
+
+# Sensor ingestion
+SENSOR_BUFFER_FLUSH_INTERVAL = float(os.getenv('SENSOR_BUFFER_FLUSH_INTERVAL', '2'))  # seconds between buffered writes
+SENSOR_BUFFER_MAX_READINGS = int(os.getenv('SENSOR_BUFFER_MAX_READINGS', '500'))  # flush early past this many readings
+SENSOR_BATCH_MAX_READINGS = int(os.getenv('SENSOR_BATCH_MAX_READINGS', '1000'))  # per request to the batch endpoint
+SENSOR_LOOKUP_CACHE_TTL = int(os.getenv('SENSOR_LOOKUP_CACHE_TTL', '60'))  # seconds to cache device/grow lookups
+SENSOR_ROLLUP_INTERVAL_MINUTES = int(os.getenv('SENSOR_ROLLUP_INTERVAL_MINUTES', '15'))  # minutes between rollup runs
+SENSOR_ROLLUP_LAG_SECONDS = int(os.getenv('SENSOR_ROLLUP_LAG_SECONDS', '120'))  # skip readings newer than this so buffered writes land first
+
+# Alerting
+ALERT_COOLDOWN_SECONDS = int(os.getenv('ALERT_COOLDOWN_SECONDS', '900'))  # a condition re-firing within this window of its last alert stays quiet
+ALERT_AGGREGATE_SECONDS = int(os.getenv('ALERT_AGGREGATE_SECONDS', '300'))  # seconds between "still firing" updates to an open alert
+ALERT_HYSTERESIS = {  # how far back past the threshold a value must go before a condition recovers
+    'pH': float(os.getenv('ALERT_HYSTERESIS_PH', '0.1')),
+    'EC': float(os.getenv('ALERT_HYSTERESIS_EC', '0.1')),
+}
+ALERT_STATE_REDIS_URL = os.getenv('ALERT_STATE_REDIS_URL', '')  # share alert state between workers, e.g. redis://localhost:6379/1; defaults to CACHE_REDIS_URL
+ALERT_STATE_TTL = int(os.getenv('ALERT_STATE_TTL', str(7 * 24 * 3600)))  # seconds before idle alert state expires
+ALERT_PAGE_MAX_SIZE = int(os.getenv('ALERT_PAGE_MAX_SIZE', '500'))  # largest ?limit= for paginated alert lists
+ALERT_PAGE_DEFAULT_SIZE = int(os.getenv('ALERT_PAGE_DEFAULT_SIZE', '50'))  # alerts returned when no ?limit= is given
+
+# Scheduled jobs
+# Every process that loads the app starts the scheduler unless this is off;
+# in production turn it off and run the jobs in one `manage.py run_scheduler` process
+SCHEDULER_AUTOSTART = os.getenv('SCHEDULER_AUTOSTART', 'True').lower() == 'true'
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '600'))  # a job's single-runner lease expires this long after its holder stops renewing it
+
+# Archival of old records
+ARCHIVE_INTERVAL_HOURS = int(os.getenv('ARCHIVE_INTERVAL_HOURS', '24'))  # hours between archive compaction runs
+ARCHIVE_SENSOR_RETENTION_DAYS = int(os.getenv('ARCHIVE_SENSOR_RETENTION_DAYS', '30'))  # raw sensor readings kept in Firebase
+ARCHIVE_LOG_RETENTION_DAYS = int(os.getenv('ARCHIVE_LOG_RETENTION_DAYS', '90'))  # actuator and dosing logs kept in Firebase
+ARCHIVE_ALERT_RETENTION_DAYS = int(os.getenv('ARCHIVE_ALERT_RETENTION_DAYS', '90'))  # alerts kept in Firebase
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '5000'))  # records archived per device or user per run and log type
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))  # local archive location
+ARCHIVE_GCS_BUCKET = os.getenv('ARCHIVE_GCS_BUCKET', '')  # archive to this Cloud Storage bucket instead of ARCHIVE_DIR, required when APP_HOSTS > 1
+APP_HOSTS = int(os.getenv('APP_HOSTS', '1'))  # hosts running the app; ARCHIVE_DIR is per host, so more than one needs ARCHIVE_GCS_BUCKET
+
+# Machine learning predictions
+PREDICTION_BATCH_MAX_ROWS = int(os.getenv('PREDICTION_BATCH_MAX_ROWS', '5000'))  # rows per batch prediction request
+ENVIRONMENT_TABLE_PERSIST = os.getenv('ENVIRONMENT_TABLE_PERSIST', 'True').lower() == 'true'  # cache the crop x stage table in auth_app/model
+CROP_MATRIX_CACHE_TTL = int(os.getenv('CROP_MATRIX_CACHE_TTL', '300'))  # seconds to cache plant profiles for crop suggestions
+FLEET_INSIGHTS_INTERVAL_MINUTES = int(os.getenv('FLEET_INSIGHTS_INTERVAL_MINUTES', '60'))  # minutes between fleet suitability scans
+
+# Leaderboard
+LEADERBOARD_TOP_K = int(os.getenv('LEADERBOARD_TOP_K', '100'))  # entries kept per overall, crop and month ranking
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -29,9 +29,11 @@ from auth_app.views import (
     RegisteredDeviceView,
     DeviceView,
     DeviceCountView,
+    DeviceInsightsView,
     
     # Sensor views
     SensorDataView,
+    SensorBatchView,
     ActuatorDataView,
     HistoricalSensorDataView,
     DosingLogDataView,
@@ -58,6 +60,7 @@ from auth_app.views import (
     LeafCountPredictorView,
     CropSuggestionView,
     EnvironmentRecommendationView,
+    BatchPredictionView,
     
     # Notification views
     FcmTokenView,
@@ -90,6 +93,7 @@ urlpatterns = [
     
     # Sensor data endpoints
     path('api/sensor-data/', SensorDataView.as_view()),
+    path('api/sensor-data/batch/', SensorBatchView.as_view()),
     path('api/sensor-data/<str:device_id>/', HistoricalSensorDataView.as_view()),
     
     # Actuator data endpoint
@@ -101,6 +105,7 @@ urlpatterns = [
     path('api/devices/<str:device_id>/check-delete/', DeviceView.as_view()),
     path('api/devices/<str:device_id>/current_thresholds/', DeviceView.as_view()),
     path('api/devices/<str:device_id>/dosing-logs/', DosingLogDataView.as_view()),
+    path('api/devices/<str:device_id>/insights/', DeviceInsightsView.as_view()),
     path('api/device-count/', DeviceCountView.as_view()),
     
     # Plant profile endpoints
@@ -145,6 +150,7 @@ urlpatterns = [
     path('api/predict/leaf-count/', LeafCountPredictorView.as_view()),
     path('api/predict/crop-suggestion/', CropSuggestionView.as_view()),
     path('api/predict/environment-recommendation/', EnvironmentRecommendationView.as_view()),
+    path('api/predict/<str:model_name>/batch/', BatchPredictionView.as_view()),
     
     # FCM token endpoint
     path('api/fcm-token/', FcmTokenView.as_view()),
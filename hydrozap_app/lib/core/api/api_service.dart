@@ -389,19 +389,23 @@ class ApiService {
     }
   }
 
-  /// 🔔 Get Alerts by User ID
-  Future<List<Alert>> getAlerts(String userId) async {
+  /// 🔔 Get a page of Alerts by User ID, newest first
+  /// Pass the previous page's nextBefore as [before] to fetch older alerts.
+  Future<AlertPage> getAlerts(String userId, {int limit = 50, String? before}) async {
     // Ensure we don't have any trailing slashes in the ID
     final cleanUserId = userId.endsWith('/') ? userId.substring(0, userId.length - 1) : userId;
     
-    final url = '${ApiEndpoints.getAlerts}$cleanUserId/';
+    final queryParams = {'limit': limit.toString()};
+    if (before != null) queryParams['before'] = before;
+    final uri = Uri.parse('${ApiEndpoints.getAlerts}$cleanUserId/').replace(queryParameters: queryParams);
     
-    final response = await http.get(Uri.parse(url));
+    final response = await http.get(uri);
 
     if (response.statusCode == 200) {
       final data = jsonDecode(response.body);
       
       try {
+        final nextBefore = data['next_before'] as String?;
         if (data['alerts'] != null && data['alerts'] is Map) {
           List<Alert> alerts = (data['alerts'] as Map)
               .entries
@@ -415,15 +419,15 @@ class ApiService {
               })
               .toList();
           
-          return alerts;
+          return AlertPage(alerts: alerts, nextBefore: nextBefore);
         } else {
-          return [];
+          return AlertPage(alerts: []);
         }
       } catch (e) {
-        return [];
+        return AlertPage(alerts: []);
       }
     } else {
-      return [];
+      return AlertPage(alerts: []);
     }
   }
 
@@ -30,6 +30,7 @@ class DashboardCounts {
 class WebSocketService {
   WebSocketChannel? _channel;
   final StreamController<List<DeviceModel>> _devicesController = StreamController<List<DeviceModel>>.broadcast();
+  final Map<String, DeviceModel> _devices = {};
   bool _isConnected = false;
   String? _userId;
   Timer? _reconnectTimer;
@@ -133,6 +134,9 @@ class WebSocketService {
         case 'devices_update':
           _handleDevicesUpdate(data);
           break;
+        case 'devices_delta':
+          _handleDevicesDelta(data);
+          break;
         case 'pong':
           // Handle pong response
           break;
@@ -148,26 +152,46 @@ class WebSocketService {
     }
   }
   
-  // Handle device update messages
+  // Handle device update messages (full device list)
   void _handleDevicesUpdate(Map<String, dynamic> data) {
     if (data.containsKey('devices')) {
       final devicesData = data['devices'] as Map<String, dynamic>;
-      final List<DeviceModel> devices = [];
-      
-      devicesData.forEach((deviceId, deviceData) {
-        if (deviceData is Map<String, dynamic>) {
-          try {
-            final device = DeviceModel.fromJson(deviceId, deviceData);
-            devices.add(device);
-          } catch (e) {
-            // Handle device parsing error
-          }
-        }
-      });
+      _devices.clear();
+      _mergeDevices(devicesData);
       
       // Add devices to the stream
-      _devicesController.add(devices);
+      _devicesController.add(_devices.values.toList());
+    }
+  }
+  
+  // Handle device delta messages (only changed and removed devices)
+  void _handleDevicesDelta(Map<String, dynamic> data) {
+    final devicesData = data['devices'];
+    if (devicesData is Map<String, dynamic>) {
+      _mergeDevices(devicesData);
     }
+    
+    final removed = data['removed'];
+    if (removed is List) {
+      for (final deviceId in removed) {
+        _devices.remove(deviceId);
+      }
+    }
+    
+    _devicesController.add(_devices.values.toList());
+  }
+  
+  // Parse devices into the local device cache
+  void _mergeDevices(Map<String, dynamic> devicesData) {
+    devicesData.forEach((deviceId, deviceData) {
+      if (deviceData is Map<String, dynamic>) {
+        try {
+          _devices[deviceId] = DeviceModel.fromJson(deviceId, deviceData);
+        } catch (e) {
+          // Handle device parsing error
+        }
+      }
+    });
   }
   
   // Manually request device data refresh
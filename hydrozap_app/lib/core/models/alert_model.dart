@@ -119,3 +119,12 @@ class Alert {
   // Helper to get sensor timestamp if available
   String? get sensorTimestamp => sensorData != null && sensorData!['timestamp'] != null ? sensorData!['timestamp'] : null;
 }
+
+/// One page of a user's alerts, newest first.
+/// [nextBefore] is the cursor for the next (older) page, or null on the last page.
+class AlertPage {
+  final List<Alert> alerts;
+  final String? nextBefore;
+
+  AlertPage({required this.alerts, this.nextBefore});
+}
@@ -7,28 +7,49 @@ class AlertProvider with ChangeNotifier {
   final ApiService _apiService = ApiService();
   List<Alert> _alerts = [];
   bool _isLoading = false;
+  bool _isLoadingMore = false;
+  String? _nextBefore;
+
+  static const int pageSize = 50;
 
   List<Alert> get alerts => _alerts;
   bool get isLoading => _isLoading;
+  bool get isLoadingMore => _isLoadingMore;
+  bool get hasMoreAlerts => _nextBefore != null;
 
-  // Fetch Alerts by User ID
+  // Fetch the newest page of Alerts by User ID
   Future<void> fetchAlerts(String userId) async {
     print("🔄 Fetching alerts for user ID: $userId");
     _isLoading = true;
     notifyListeners();
 
-    final response = await _apiService.getAlerts(userId);
-    print("✅ Fetched ${response.length} alerts");
+    final page = await _apiService.getAlerts(userId, limit: pageSize);
+    print("✅ Fetched ${page.alerts.length} alerts");
     
-    if (response.isNotEmpty) {
-      print("🔍 First alert sample: ${response[0].toJson()}");
+    if (page.alerts.isNotEmpty) {
+      print("🔍 First alert sample: ${page.alerts[0].toJson()}");
     }
     
-    _alerts = response;
+    _alerts = page.alerts;
+    _nextBefore = page.nextBefore;
     _isLoading = false;
     notifyListeners();
   }
 
+  // Append the next (older) page of alerts
+  Future<void> loadMoreAlerts(String userId) async {
+    if (_nextBefore == null || _isLoadingMore) return;
+    _isLoadingMore = true;
+    notifyListeners();
+
+    final page = await _apiService.getAlerts(userId, limit: pageSize, before: _nextBefore);
+    final knownIds = _alerts.map((alert) => alert.alertId).toSet();
+    _alerts.addAll(page.alerts.where((alert) => !knownIds.contains(alert.alertId)));
+    _nextBefore = page.nextBefore;
+    _isLoadingMore = false;
+    notifyListeners();
+  }
+
   // Get an Alert by ID
   Alert? getAlertById(String alertId) {
     try {
@@ -610,8 +610,31 @@ class _AlertsPageState extends State<AlertsPage> {
                 child: totalAlerts == 0
                   ? const Center(child: Text("No alerts found."))
                   : ListView.builder(
-                    itemCount: _groupedAlerts.length,
+                    itemCount: _groupedAlerts.length + (alertProvider.hasMoreAlerts ? 1 : 0),
                     itemBuilder: (context, groupIndex) {
+                      // Older alerts are fetched a page at a time
+                      if (groupIndex == _groupedAlerts.length) {
+                        return Padding(
+                          padding: const EdgeInsets.all(16),
+                          child: Center(
+                            child: alertProvider.isLoadingMore
+                                ? const CircularProgressIndicator()
+                                : TextButton(
+                                    onPressed: () async {
+                                      await alertProvider.loadMoreAlerts(widget.userId);
+                                      _handleFilterChanged(
+                                        _deviceFilter,
+                                        _severityFilter,
+                                        _onlyUnacknowledged,
+                                        _fromDate,
+                                        _toDate,
+                                      );
+                                    },
+                                    child: const Text('Load older alerts'),
+                                  ),
+                          ),
+                        );
+                      }
                       final groupKey = _groupedAlerts.keys.elementAt(groupIndex);
                       final alerts = _groupedAlerts[groupKey]!;
                       